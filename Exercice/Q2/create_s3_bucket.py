@@ -1,52 +1,35 @@
-from troposphere import Template
-from troposphere.s3 import Bucket, PublicAccessBlockConfiguration, VersioningConfiguration, BucketEncryption, ServerSideEncryptionRule, ServerSideEncryptionByDefault
+import os
+import sys
+
+# Le bucket est construit par le paquet partagé tp4 (à la racine du dépôt)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from tp4.cache import builder_sources, write_template
+from tp4.s3 import Q2_SPEC, build_bucket_template
 
 # ------------------------
 # Création du template CloudFormation
 # ------------------------
-template = Template()
-template.set_description("S3 Security")
+# Bucket privé et versionné, avec blocage de l'accès public et chiffrement KMS
+# (voir build_bucket_template() dans tp4/s3.py)
 
 # ------------------------
-# Configuration du chiffrement KMS
+# Export du fichier JSON
 # ------------------------
-kms_key_id = "arn:aws:kms:us-east-1:081743453153:key/0bdfb016-9a1e-43fe-9b7c-d351fa52a535"
-
-bucket = template.add_resource(
-    Bucket(
-        "PolystudentS3ImaneQ2TP4",
-        BucketName="polystudent-q2-tp4",
-        AccessControl="Private",
-
-        PublicAccessBlockConfiguration=PublicAccessBlockConfiguration(
-            BlockPublicAcls=True,
-            IgnorePublicAcls=True,
-            BlockPublicPolicy=True,
-            RestrictPublicBuckets=True
-        ),
-
-        BucketEncryption=BucketEncryption(
-            ServerSideEncryptionConfiguration=[
-                ServerSideEncryptionRule(
-                    ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
-                        SSEAlgorithm="aws:kms",
-                        KMSMasterKeyID=kms_key_id
-                    )
-                )
-            ]
-        ),
-
-        VersioningConfiguration=VersioningConfiguration(
-            Status="Enabled"
-        )
+# Le template n'est reconstruit que si Q2_SPEC ou le code du générateur a changé.
+def main():
+    status = write_template(
+        "bucket_python.json",
+        lambda: build_bucket_template(Q2_SPEC),
+        Q2_SPEC,
+        sources=builder_sources(),
     )
-)
 
-# ------------------------
-# Export du fichier JSON
-# ------------------------
-with open("bucket_python.json", "w") as f:
-    f.write(template.to_json())
+    if status == "hit":
+        print("Template CloudFormation déjà à jour (cache) : bucket_python.json")
+    else:
+        print("Template CloudFormation généré : bucket_python.json")
 
-print("Template CloudFormation généré : bucket_python.json")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Rejeu des alarmes (tp4.alarms) : plusieurs alarmes sur la même série."""
+import unittest
+
+import numpy as np
+
+from tp4.alarms import INSUFFICIENT_DATA, AlarmDefinition, Metrics, replay
+
+
+class SharedSeriesTest(unittest.TestCase):
+    def test_two_alarms_on_same_instance(self):
+        timestamps = np.arange(0, 600, 60, dtype=np.int64)
+        metrics = Metrics(timestamps, np.zeros(len(timestamps), dtype=np.int64),
+                          np.full(len(timestamps), 2000.0), [("NetworkPacketsIn", "i-1")])
+        alarms = [AlarmDefinition("A", "i-1", threshold=1000), AlarmDefinition("B", "i-1", threshold=500)]
+        results = {result.alarm: result for result in replay(alarms, metrics)}
+        for name in ("A", "B"):
+            self.assertEqual(results[name].intervals, ((0, 600),))
+            self.assertNotEqual(results[name].final_state, INSUFFICIENT_DATA)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Clé du cache des templates : modules auxiliaires hachés, entrées communes aux scripts et à ``python -m tp4``."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        # Copie du paquet et des scripts : le test modifie le source de tp4
+        self.directory = tempfile.mkdtemp(prefix="tp4-cache-test-")
+        self.addCleanup(shutil.rmtree, self.directory)
+        ignore = shutil.ignore_patterns("__pycache__")
+        shutil.copytree(os.path.join(ROOT, "tp4"), os.path.join(self.directory, "tp4"), ignore=ignore)
+        shutil.copytree(os.path.join(ROOT, "Exercice", "Q1"), os.path.join(self.directory, "Exercice", "Q1"),
+                        ignore=ignore)
+        self.env = dict(os.environ, TP4_CACHE_DIR=os.path.join(self.directory, "cache"))
+        self.env.pop("TP4_NO_CACHE", None)
+
+    def run_tp4(self, *args, cwd=None):
+        result = subprocess.run([sys.executable, *args], cwd=cwd or self.directory, env=self.env,
+                                capture_output=True, text=True, check=True)
+        return result.stdout
+
+    def run_q1(self):
+        script = os.path.join(self.directory, "Exercice", "Q1", "Q1.py")
+        return self.run_tp4(script, cwd=os.path.dirname(script))
+
+    def test_helper_change_invalidates_entry(self):
+        self.assertIn("généré", self.run_q1())
+        self.assertIn("déjà à jour", self.run_q1())
+        # tp4.sg n'est importé par tp4.vpc qu'à la construction (compact_rules)
+        with open(os.path.join(self.directory, "tp4", "sg.py"), "a") as file:
+            file.write("\n# compact_rules modifié\n")
+        self.assertIn("généré", self.run_q1())
+
+    def test_script_and_cli_share_entries(self):
+        self.assertIn("généré", self.run_q1())
+        self.assertIn("restauré depuis le cache", self.run_tp4("-m", "tp4", "vpc", "-C", "out"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""Résumés Space-Saving de tp4.flowlogs : bornes par clé après ajouts et fusions."""
+import random
+import unittest
+from collections import Counter
+
+from tp4.flowlogs import TopK
+
+
+class TopKTest(unittest.TestCase):
+    def test_exact_under_capacity(self):
+        summary = TopK(8)
+        summary.add(["a", "b", "a", "c"], [1, 2, 3, 4])
+        self.assertEqual(summary.top(2), [("a", 4, 0), ("c", 4, 0)])
+
+    def test_bounds_after_merges(self):
+        generator = random.Random(7)
+        keys = [str(int(generator.paretovariate(0.8))) for _ in range(20000)]
+        truth = Counter(keys)
+        parts = [TopK(16) for _ in range(4)]
+        for index in range(0, len(keys), 250):
+            parts[index // 250 % 4].add(keys[index:index + 250])
+        total = parts[0]
+        for part in parts[1:]:
+            total.merge(part)
+        for key, count, error in total.top(16):
+            self.assertLessEqual(count - error, truth[key])
+            self.assertLessEqual(truth[key], count)
+        kept = set(total.keys)
+        self.assertLessEqual(max(count for key, count in truth.items() if key not in kept), total.floor())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""DependsOn redondants de tp4.graph : la chaîne qui les rend redondants est donnée."""
+import unittest
+
+from tp4.graph import DeployGraph, format_analysis
+
+
+def _resource(kind, depends_on=(), **properties):
+    return {"Type": kind, "DependsOn": list(depends_on), "Properties": properties}
+
+
+class DependsOnTest(unittest.TestCase):
+    def test_redundant_through_reference_and_depends_on(self):
+        graph = DeployGraph({"Resources": {
+            "Bucket": _resource("AWS::S3::Bucket"),
+            "Policy": _resource("AWS::S3::BucketPolicy", Bucket={"Ref": "Bucket"}),
+            "Trail": _resource("AWS::CloudTrail::Trail", ["Policy", "Bucket"]),
+            "Alarm": _resource("AWS::CloudWatch::Alarm", ["Bucket"], Dimension={"Ref": "Policy"}),
+        }})
+        findings = {(finding.resource, finding.dependency): finding for finding in graph.depends_on_findings()}
+        self.assertEqual(findings["Trail", "Bucket"].via, ("Trail", "Policy", "Bucket"))
+        self.assertEqual(findings["Alarm", "Bucket"].via, ("Alarm", "Policy", "Bucket"))
+        self.assertFalse(findings["Trail", "Policy"].redundant)
+        text = format_analysis(graph)
+        self.assertIn("Trail → Policy (DependsOn) → Bucket (Ref)", text)
+        self.assertIn("Alarm → Policy (Ref) → Bucket (Ref)", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
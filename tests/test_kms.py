@@ -0,0 +1,22 @@
+"""Lecture des traces d'accès de tp4.kms : formats d'horodatage mélangés, longueur maximale."""
+import unittest
+
+from tp4.kms import MAX_TRACE_SECONDS, _timestamps, trace_from_counts
+
+
+class TimestampTest(unittest.TestCase):
+    def test_mixed_iso_and_unix(self):
+        seconds = _timestamps(["2026-10-01T12:00:00Z", "1790856005", "2026-10-01T12:00:03+00:00"])
+        self.assertEqual(seconds.tolist(), [1790856000, 1790856005, 1790856003])
+
+    def test_invalid_timestamp(self):
+        with self.assertRaises(ValueError):
+            _timestamps(["1790856000", "hier"])
+
+    def test_trace_too_long(self):
+        with self.assertRaises(ValueError):
+            trace_from_counts([0, MAX_TRACE_SECONDS], ["PUT", "GET"], [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+"""Recommandation de tp4.natplan : résistance à la perte d'une AZ par défaut."""
+import unittest
+
+from tp4.natplan import Flow, plan, recommend
+
+
+class RecommendTest(unittest.TestCase):
+    def setUp(self):
+        flows = [Flow(1, "s3", 2.5, 1800), Flow(2, "internet", 0.8, 300), Flow(2, "logs", 0.2, 150)]
+        self.topologies = plan(flows, 2)
+
+    def test_resilient_by_default(self):
+        chosen = recommend(self.topologies)
+        self.assertTrue(chosen.resilient)
+        self.assertEqual(chosen.nat_gateways, "per_az")
+
+    def test_shared_allowed_on_request(self):
+        chosen = recommend(self.topologies, resilient=False)
+        self.assertEqual(chosen.nat_gateways, "shared")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""Index des rapports du scanner (tp4.report) : type de ressource lu dans le rapport."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tp4.report import ReportIndex
+
+
+def _finding(avdid, lines):
+    return {"AVDID": avdid, "Severity": "HIGH",
+            "CauseMetadata": {"Resource": "Trail", "StartLine": 1, "EndLine": len(lines),
+                              "Code": {"Lines": [{"Number": number, "Content": content}
+                                                 for number, content in enumerate(lines, start=1)]}}}
+
+
+class ResourceTypeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="tp4-report-test-")
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def build(self, findings):
+        path = os.path.join(self.directory, "report.json")
+        with open(path, "w") as file:
+            json.dump({"Results": [{"Target": "t.yaml", "Misconfigurations": findings}]}, file)
+        index = ReportIndex.build(path)
+        column = index.columns["resource_type"]
+        return [column.values[code] for code in column.rows]
+
+    def test_type_from_report_record(self):
+        unknown = _finding("AVD-AWS-9999", ["  Trail:", "    Properties:", "      DataResources:",
+                                            "        - Type: AWS::S3::Object", "    Type: AWS::CloudTrail::Trail"])
+        truncated = _finding("AVD-AWS-0015", ["  Trail:", "    Properties:"])
+        self.assertEqual(self.build([unknown, truncated]), ["AWS::CloudTrail::Trail", "AWS::CloudTrail::Trail"])
+
+
+if __name__ == "__main__":
+    unittest.main()
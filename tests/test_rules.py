@@ -0,0 +1,34 @@
+"""Analyse de dossiers par tp4.rules : fichiers illisibles signalés, échecs comptés par finding."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from tp4.rules import main, preset_template, scan_paths, scan_template
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="tp4-rules-test-")
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, text):
+        with open(os.path.join(self.directory, name), "w") as file:
+            file.write(text)
+
+    def test_unreadable_file_is_reported(self):
+        self.write("broken.yaml", "Resources: [unclosed\n")
+        self.write("settings.json", '{"not": "a template"}')
+        results = scan_paths([self.directory], workers=1)
+        self.assertEqual([os.path.basename(result.target) for result in results], ["broken.yaml"])
+        self.assertTrue(results[0].error)
+        self.assertEqual(main([self.directory, "--workers", "1"]), 2)
+
+    def test_failures_count_every_finding(self):
+        result = scan_template(preset_template("q3_2"), "q3_2")
+        self.assertEqual(result.failures, len(result.findings))
+        self.assertEqual(result.tests, result.successes + result.failures)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Compaction des règles de groupes de sécurité (tp4.sg) : mêmes flux autorisés, ICMP compris."""
+import itertools
+import random
+import unittest
+
+from tp4.sg import RuleIndex, compact_rules
+
+
+class CompactRulesTest(unittest.TestCase):
+    def test_icmp_type_and_code_are_not_port_ranges(self):
+        echo, unreachable = ("icmp", 8, 0, "0.0.0.0/0"), ("icmp", 3, 7, "0.0.0.0/0")
+        self.assertEqual(compact_rules([echo, unreachable]), [echo, unreachable])
+        rules = [("icmp", 3, 4, "0.0.0.0/0"), ("icmp", 5, -1, "0.0.0.0/0")]
+        self.assertEqual(compact_rules(rules), rules)
+
+    def test_icmp_covered_by_all_codes_or_types(self):
+        rules = [("icmp", 8, 0, "10.0.0.0/8"), ("icmp", 8, -1, "0.0.0.0/0"), ("icmp", 3, 1, "10.1.0.0/16"),
+                 ("icmp", -1, -1, "10.0.0.0/8")]
+        self.assertEqual(compact_rules(rules), [("icmp", 8, -1, "0.0.0.0/0"), ("icmp", -1, -1, "10.0.0.0/8")])
+
+    def test_same_flows_allowed(self):
+        generator = random.Random(5)
+        cidrs = ["0.0.0.0/0", "10.0.0.0/8", "10.0.0.0/9", "10.128.0.0/9", "192.168.1.0/24"]
+        rules = []
+        for _ in range(40):
+            protocol = generator.choice(["tcp", "udp", "icmp", "-1"])
+            if protocol == "icmp":
+                rules.append((protocol, generator.choice([-1, 0, 3, 8]), generator.choice([-1, 0, 1]),
+                              generator.choice(cidrs)))
+            else:
+                low = generator.randrange(0, 100)
+                rules.append((protocol, low, low + generator.randrange(0, 10), generator.choice(cidrs)))
+        before, after = RuleIndex(rules), RuleIndex(compact_rules(rules))
+        sources = ["1.2.3.4", "10.0.0.1", "10.200.0.1", "192.168.1.7"]
+        for protocol, port, code, source in itertools.product(["tcp", "udp", "icmp"], range(0, 112),
+                                                              [0, 1, 2], sources):
+            self.assertEqual(before.allowed(protocol, port, source, code), after.allowed(protocol, port, source, code),
+                             (protocol, port, code, source))
+
+
+if __name__ == "__main__":
+    unittest.main()
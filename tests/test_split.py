@@ -0,0 +1,31 @@
+"""Flottes (tp4.vpc, tp4.split) : limites suivies pendant la construction."""
+import unittest
+from dataclasses import replace
+
+from tp4.split import StackLimits, TemplateRecord, split_template
+from tp4.vpc import Q3_2_SPEC, build_vpc_stacks, build_vpc_template
+
+FLEET_SPEC = replace(Q3_2_SPEC, compute=replace(Q3_2_SPEC.compute, instances_per_subnet=200))
+
+
+class FleetLimitsTest(unittest.TestCase):
+    def test_over_limit_template_is_refused(self):
+        with self.assertRaises(ValueError):
+            build_vpc_template(FLEET_SPEC)
+
+    def test_stacks_respect_limits(self):
+        limits = StackLimits()
+        plan = build_vpc_stacks(FLEET_SPEC, limits)
+        self.assertGreater(len(plan.stacks), 1)
+        for _, data in plan.stacks:
+            self.assertLessEqual(len(data["Resources"]), limits.max_resources)
+
+    def test_record_matches_template(self):
+        record = TemplateRecord()
+        template = build_vpc_template(FLEET_SPEC, record)
+        self.assertEqual(record.data(template), template.to_dict())
+        self.assertEqual(split_template(template).stacks, split_template(template, record=record).stacks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Index CloudTrail (tp4.trail) : point de reprise entre deux ingestions."""
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from tp4.trail import TrailIndex
+
+
+def write_log(directory, day, name):
+    folder = os.path.join(directory, "2026", "10", day)
+    os.makedirs(folder, exist_ok=True)
+    record = {"eventTime": f"2026-10-{day}T12:00:00Z", "eventName": "PutObject", "eventID": f"{day}-{name}",
+              "userIdentity": {"arn": "arn:aws:iam::123456789012:role/LabRole"},
+              "requestParameters": {"bucketName": "polystudent-q2-tp4", "key": f"{day}/{name}"}}
+    with gzip.open(os.path.join(folder, name), "wt", encoding="utf-8") as file:
+        json.dump({"Records": [record]}, file)
+    return folder
+
+
+class BackfillTest(unittest.TestCase):
+    def test_late_file_in_old_day_is_ingested(self):
+        with tempfile.TemporaryDirectory() as directory:
+            old = time.time() - 3600
+            for day in ("16", "17", "18"):
+                folder = write_log(directory, day, "f.json.gz")
+                os.utime(folder, (old, old))
+            with TrailIndex(os.path.join(directory, "index.sqlite3")) as index:
+                self.assertEqual(index.ingest(directory, workers=1).files, 3)
+                again = index.ingest(directory, workers=1)
+                self.assertEqual((again.files, again.unchanged_days), (0, 3))
+
+                write_log(directory, "16", "g.json.gz")
+                report = index.ingest(directory, workers=1)
+                self.assertEqual((report.files, report.unchanged_days), (1, 2))
+                self.assertEqual(sorted(event["key"] for event in index.query(prefix="16/")), ["16/f.json.gz", "16/g.json.gz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
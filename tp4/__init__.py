@@ -0,0 +1,6 @@
+"""Outils partagés du TP4 : génération des templates CloudFormation et analyses.
+
+Les scripts des questions (Exercice/Q1, Q2, Q3) s'appuient sur ce paquet au lieu
+de dupliquer la construction du réseau. Le paquet n'importe rien au chargement :
+chaque module charge seulement les modules troposphere dont il a besoin.
+"""
@@ -0,0 +1,3 @@
+from tp4.cli import main
+
+raise SystemExit(main())
@@ -0,0 +1,448 @@
+"""Rejeu hors ligne des alarmes CloudWatch d'un template sur des séries de métriques.
+
+Les alarmes générées par create_alarm() (tp4/vpc.py) sont relues depuis le
+template, puis évaluées sur des métriques enregistrées localement (CSV, ou
+Parquet si pyarrow est installé) :
+
+    timestamp,InstanceId,value[,MetricName]
+    2024-01-01T00:00:00,PublicInstanceAZ1,734.5
+
+``timestamp`` est une date ISO 8601 (UTC) ou un temps Unix en secondes.
+``InstanceId`` est comparé à la valeur de la dimension de l'alarme, c'est-à-dire
+au nom logique de l'instance (``Ref``) tant que le template n'est pas déployé.
+
+Les échantillons sont agrégés par période (statistique de l'alarme) dans une
+matrice séries × périodes, puis toutes les séries sont évaluées d'un coup :
+sommes glissantes sur EvaluationPeriods, règle « M sur N » (DatapointsToAlarm)
+et TreatMissingData. Une semaine de données à la minute pour des milliers
+d'instances se rejoue en quelques secondes, et un balayage de seuils réutilise
+les mêmes statistiques.
+
+    python -m tp4.alarms q3_2 metrics.csv --sweep 500 1000 2000
+"""
+import argparse
+import csv
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+# États d'une alarme
+OK, ALARM, INSUFFICIENT_DATA = 0, 1, 2
+STATES = {OK: "OK", ALARM: "ALARM", INSUFFICIENT_DATA: "INSUFFICIENT_DATA"}
+
+_COMPARISONS = {
+    "GreaterThanThreshold": np.greater,
+    "GreaterThanOrEqualToThreshold": np.greater_equal,
+    "LessThanThreshold": np.less,
+    "LessThanOrEqualToThreshold": np.less_equal,
+}
+_TREAT_MISSING = ("missing", "ignore", "breaching", "notBreaching")
+
+
+@dataclass(frozen=True)
+class AlarmDefinition:
+    """Paramètres d'évaluation d'une alarme (AWS::CloudWatch::Alarm)."""
+    name: str
+    dimension: str
+    metric_name: str = "NetworkPacketsIn"
+    namespace: str = "AWS/EC2"
+    statistic: str = "Average"
+    period: int = 60
+    evaluation_periods: int = 1
+    datapoints_to_alarm: int = 1
+    threshold: float = 1000.0
+    comparison_operator: str = "GreaterThanThreshold"
+    treat_missing_data: str = "missing"
+
+
+@dataclass(frozen=True)
+class AlarmReplay:
+    """Résultat du rejeu d'une alarme sur une série."""
+    alarm: str
+    series: str
+    intervals: tuple      # (début, fin) en secondes Unix, fin exclue
+    transitions: int
+    alarm_seconds: int
+    final_state: int
+
+
+def _template_dict(template):
+    return template.to_dict() if hasattr(template, "to_dict") else template
+
+
+def alarms_from_template(template):
+    """Les alarmes d'un template (objet troposphere ou dict), dans l'ordre des ressources."""
+    alarms = []
+    for name, resource in _template_dict(template).get("Resources", {}).items():
+        if resource.get("Type") != "AWS::CloudWatch::Alarm":
+            continue
+        props = resource.get("Properties", {})
+        dimensions = props.get("Dimensions") or [{}]
+        value = dimensions[0].get("Value", "")
+        # Ref vers l'instance : son nom logique tient lieu d'identifiant
+        dimension = value.get("Ref", "") if isinstance(value, dict) else str(value)
+        evaluation_periods = int(props.get("EvaluationPeriods", 1))
+        alarms.append(AlarmDefinition(
+            name=name,
+            dimension=dimension,
+            metric_name=props.get("MetricName", ""),
+            namespace=props.get("Namespace", ""),
+            statistic=props.get("Statistic", "Average"),
+            period=int(props.get("Period", 60)),
+            evaluation_periods=evaluation_periods,
+            datapoints_to_alarm=int(props.get("DatapointsToAlarm", evaluation_periods)),
+            threshold=float(props.get("Threshold", 0)),
+            comparison_operator=props.get("ComparisonOperator", "GreaterThanThreshold"),
+            treat_missing_data=props.get("TreatMissingData", "missing"),
+        ))
+    return alarms
+
+
+# ----------------------------------------------------------------------
+# ------- Lecture des métriques ----------------------------------------
+# ----------------------------------------------------------------------
+@dataclass
+class Metrics:
+    """Échantillons en colonnes : chaque ligne pointe vers une série (métrique, instance)."""
+    timestamps: np.ndarray    # secondes Unix (int64)
+    codes: np.ndarray         # index dans ``keys``
+    values: np.ndarray        # float64
+    keys: list                # (nom de métrique ou None, identifiant d'instance)
+
+    def series(self, metric_name=None, dimension=None):
+        """Index des séries correspondant à une métrique et/ou une instance."""
+        return [code for code, (metric, instance) in enumerate(self.keys)
+                if (metric is None or metric_name is None or metric == metric_name)
+                and (dimension is None or instance == dimension)]
+
+
+_COLUMNS = {
+    "timestamp": ("timestamp", "Timestamp", "time"),
+    "instance": ("InstanceId", "instance_id", "instance", "dimension"),
+    "value": ("value", "Value"),
+    "metric": ("MetricName", "metric_name", "metric"),
+}
+
+
+def _column(header, role, required=True):
+    for name in _COLUMNS[role]:
+        if name in header:
+            return header.index(name)
+    if required:
+        raise ValueError(f"colonne {role} introuvable parmi {header}")
+    return None
+
+
+def _timestamps(raw):
+    try:
+        return np.array(raw, dtype=np.float64).astype(np.int64)
+    except ValueError:
+        # ISO 8601 : NumPy ne lit pas le suffixe de fuseau, les dates sont en UTC
+        text = np.char.replace(np.asarray(raw, dtype=str), "Z", "")
+        text = np.char.replace(text, "+00:00", "")
+        return text.astype("datetime64[s]").astype(np.int64)
+
+
+def load_metrics(path, chunk_bytes=32 << 20):
+    """Charge un fichier CSV (ou .parquet) de métriques par paquets d'environ ``chunk_bytes`` octets."""
+    if path.endswith(".parquet"):
+        return _load_parquet(path)
+
+    key_codes = {}
+    parts = []
+    with open(path, newline="") as file:
+        header = next(csv.reader([file.readline()]))
+        columns = (_column(header, "timestamp"), _column(header, "instance"),
+                   _column(header, "value"), _column(header, "metric", required=False))
+        while True:
+            lines = file.readlines(chunk_bytes)
+            if not lines:
+                break
+            parts.append(_chunk(lines, len(header), columns, key_codes))
+    # key_codes garde l'ordre d'insertion : la position d'une clé est son code
+    keys = [key if isinstance(key, tuple) else (None, key) for key in key_codes]
+    if not parts:
+        empty = np.array([], dtype=np.int64)
+        return Metrics(empty, empty, np.array([], dtype=np.float64), keys)
+    return Metrics(*(np.concatenate(column) for column in zip(*parts)), keys)
+
+
+def _chunk(lines, width, columns, key_codes):
+    time_col, instance_col, value_col, metric_col = columns
+    text = "".join(lines)
+    flat = None if '"' in text else text.replace("\r", "").replace("\n", ",").split(",")
+    if flat is not None and len(flat) == len(lines) * width + text.endswith("\n"):
+        # Cas courant : un seul split en C puis une tranche par colonne
+        del flat[len(lines) * width:]
+        fields = [flat[i::width] for i in range(width)]
+    else:
+        # Guillemets ou lignes vides : le module csv découpe les champs
+        fields = list(zip(*(row for row in csv.reader(lines) if row)))
+    ids = fields[instance_col] if metric_col is None else zip(fields[metric_col], fields[instance_col])
+    codes = np.fromiter((key_codes.setdefault(key, len(key_codes)) for key in ids),
+                        dtype=np.int64, count=len(fields[instance_col]))
+    timestamps = _timestamps(fields[time_col])
+    values = np.array([value or "nan" for value in fields[value_col]], dtype=np.float64)
+    return timestamps, codes, values
+
+
+def _load_parquet(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise RuntimeError("la lecture de fichiers Parquet nécessite pyarrow (pip install pyarrow)") from error
+
+    table = pq.read_table(path)
+    header = table.column_names
+    instance = table.column(header[_column(header, "instance")]).to_numpy(zero_copy_only=False).astype(str)
+    metric_index = _column(header, "metric", required=False)
+    metric = (table.column(header[metric_index]).to_numpy(zero_copy_only=False).astype(str)
+              if metric_index is not None else None)
+    pairs = np.char.add(np.char.add(metric, "\t"), instance) if metric is not None else instance
+    unique, codes = np.unique(pairs, return_inverse=True)
+    keys = [tuple(pair.split("\t", 1)) if metric is not None else (None, pair) for pair in unique]
+    raw_time = table.column(header[_column(header, "timestamp")]).to_numpy(zero_copy_only=False)
+    timestamps = (raw_time.astype("datetime64[s]").astype(np.int64) if raw_time.dtype.kind == "M"
+                  else _timestamps(raw_time))
+    values = table.column(header[_column(header, "value")]).to_numpy(zero_copy_only=False).astype(np.float64)
+    return Metrics(timestamps, codes.astype(np.int64), values, keys)
+
+
+# ----------------------------------------------------------------------
+# ------- Évaluation vectorisée ----------------------------------------
+# ----------------------------------------------------------------------
+def period_statistics(metrics, codes, period, statistic, start=None, end=None):
+    """Matrice séries × périodes de la statistique ``statistic`` (NaN si aucune donnée).
+
+    Les périodes sont alignées sur des multiples de ``period`` depuis l'époque Unix,
+    comme dans CloudWatch. Retourne (matrice, début de la première période).
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    start = int(metrics.timestamps.min()) if start is None else start
+    end = int(metrics.timestamps.max()) + 1 if end is None else end
+    start -= start % period
+    buckets = max(1, -(-(end - start) // period))
+
+    # Une même série peut revenir sur plusieurs lignes (deux alarmes sur la même instance) :
+    # les statistiques sont calculées une fois par série puis recopiées sur chaque ligne
+    codes, row_codes = np.unique(codes, return_inverse=True)
+    row_of = np.full(len(metrics.keys), -1, dtype=np.int64)
+    row_of[codes] = np.arange(len(codes))
+    rows = row_of[metrics.codes]
+    slots = (metrics.timestamps - start) // period
+    keep = (rows >= 0) & (slots >= 0) & (slots < buckets) & ~np.isnan(metrics.values)
+    flat = rows[keep] * buckets + slots[keep]
+    values = metrics.values[keep]
+    size = len(codes) * buckets
+
+    counts = np.bincount(flat, minlength=size)
+    if statistic in ("Average", "Sum"):
+        result = np.bincount(flat, weights=values, minlength=size)
+        if statistic == "Average":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result = result / counts
+    elif statistic == "SampleCount":
+        result = counts.astype(np.float64)
+    elif statistic in ("Maximum", "Minimum"):
+        # Tri par case puis réduction segmentée : pas de boucle Python par case
+        order = np.argsort(flat, kind="stable")
+        sorted_flat = flat[order]
+        heads = np.flatnonzero(np.r_[True, sorted_flat[1:] != sorted_flat[:-1]]) if len(flat) else np.array([], int)
+        reduce = np.maximum if statistic == "Maximum" else np.minimum
+        result = np.zeros(size)
+        if len(heads):
+            result[sorted_flat[heads]] = reduce.reduceat(values[order], heads)
+    else:
+        raise ValueError(f"statistique non prise en charge : {statistic}")
+    result = np.where(counts > 0, result, np.nan)
+    return result.reshape(len(codes), buckets)[row_codes], start
+
+
+def _sliding_sum(mask, width):
+    total = np.cumsum(mask, axis=1, dtype=np.int32)
+    if width < total.shape[1]:
+        total[:, width:] -= total[:, :-width].copy()
+    return total
+
+
+def evaluate_states(values, thresholds, comparison_operator, evaluation_periods=1,
+                    datapoints_to_alarm=None, treat_missing_data="missing"):
+    """États (OK, ALARM, INSUFFICIENT_DATA) à la fin de chaque période, pour chaque série.
+
+    ``values`` est une matrice séries × périodes (NaN = donnée manquante) et
+    ``thresholds`` un seuil par série. Avec « missing » ou « ignore », une fenêtre
+    partiellement vide est évaluée sur les points présents.
+    """
+    if treat_missing_data not in _TREAT_MISSING:
+        raise ValueError(f"TreatMissingData inconnu : {treat_missing_data}")
+    datapoints_to_alarm = datapoints_to_alarm or evaluation_periods
+    present = ~np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        breaching = _COMPARISONS[comparison_operator](values, np.asarray(thresholds, dtype=np.float64)[:, None])
+    breaching &= present
+    if treat_missing_data == "breaching":
+        breaching |= ~present
+        present = np.ones_like(present)
+    elif treat_missing_data == "notBreaching":
+        present = np.ones_like(present)
+
+    breaches = _sliding_sum(breaching, evaluation_periods)
+    points = _sliding_sum(present, evaluation_periods)
+    states = np.where(breaches >= datapoints_to_alarm, ALARM,
+                      np.where(points == 0, INSUFFICIENT_DATA, OK)).astype(np.int8)
+    if treat_missing_data == "ignore":
+        # Fenêtre vide : l'alarme garde son état précédent (report vers l'avant)
+        steps = np.arange(states.shape[1])
+        last = np.maximum.accumulate(np.where(points > 0, steps, -1), axis=1)
+        carried = np.take_along_axis(states, np.maximum(last, 0), axis=1)
+        states = np.where(last >= 0, carried, INSUFFICIENT_DATA).astype(np.int8)
+    return states
+
+
+def firing_intervals(states):
+    """Plages consécutives à l'état ALARM : tableaux (ligne, période de début, période de fin exclue)."""
+    firing = np.zeros((states.shape[0], states.shape[1] + 2), dtype=np.int8)
+    firing[:, 1:-1] = states == ALARM
+    edges = np.diff(firing, axis=1)
+    rows, begins = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, begins, ends
+
+
+def _groups(pairs):
+    # Regroupe les couples (alarme, série) évalués avec les mêmes paramètres
+    groups = {}
+    for alarm, code in pairs:
+        key = (alarm.statistic, alarm.period, alarm.comparison_operator, alarm.evaluation_periods,
+               alarm.datapoints_to_alarm, alarm.treat_missing_data)
+        groups.setdefault(key, []).append((alarm, code))
+    return groups
+
+
+def match_series(alarms, metrics, all_series=False):
+    """Couples (alarme, série) à évaluer.
+
+    Par défaut, chaque alarme est rejouée sur la série de son instance. Avec
+    ``all_series``, chaque définition distincte (seuil, période, etc.) est
+    rejouée sur toutes les séries de sa métrique, pour simuler une flotte.
+    """
+    if not all_series:
+        return [(alarm, code) for alarm in alarms
+                for code in metrics.series(alarm.metric_name, alarm.dimension)]
+    pairs, seen = [], set()
+    for alarm in alarms:
+        signature = replace(alarm, name="", dimension="")
+        if signature in seen:
+            continue
+        seen.add(signature)
+        pairs.extend((alarm, code) for code in metrics.series(alarm.metric_name))
+    return pairs
+
+
+def replay(alarms, metrics, all_series=False, threshold=None):
+    """Rejoue les alarmes sur les métriques et retourne une liste d'AlarmReplay.
+
+    ``threshold`` remplace le seuil de toutes les alarmes (réglage de seuil).
+    """
+    results = []
+    for (statistic, period, operator, periods, datapoints, treat), pairs in \
+            _groups(match_series(alarms, metrics, all_series)).items():
+        codes = [code for _, code in pairs]
+        values, start = period_statistics(metrics, codes, period, statistic)
+        thresholds = [alarm.threshold if threshold is None else threshold for alarm, _ in pairs]
+        states = evaluate_states(values, thresholds, operator, periods, datapoints, treat)
+        rows, begins, ends = firing_intervals(states)
+        transitions = np.count_nonzero(np.diff(states, axis=1), axis=1)
+        split = np.searchsorted(rows, np.arange(len(pairs) + 1))
+        for row, (alarm, code) in enumerate(pairs):
+            lo, hi = split[row], split[row + 1]
+            intervals = tuple(zip((start + begins[lo:hi] * period).tolist(), (start + ends[lo:hi] * period).tolist()))
+            results.append(AlarmReplay(
+                alarm=alarm.name,
+                series=metrics.keys[code][1],
+                intervals=intervals,
+                transitions=int(transitions[row]),
+                alarm_seconds=int((ends[lo:hi] - begins[lo:hi]).sum()) * period,
+                final_state=int(states[row, -1]),
+            ))
+    return results
+
+
+def sweep(alarms, metrics, thresholds, all_series=False):
+    """Pour chaque seuil : (seuil, séries déclenchées, nombre de plages, secondes en ALARM).
+
+    Les statistiques par période ne sont calculées qu'une fois par groupe d'alarmes.
+    """
+    totals = {threshold: [0, 0, 0] for threshold in thresholds}
+    for (statistic, period, operator, periods, datapoints, treat), pairs in \
+            _groups(match_series(alarms, metrics, all_series)).items():
+        values, _ = period_statistics(metrics, [code for _, code in pairs], period, statistic)
+        for threshold in thresholds:
+            states = evaluate_states(values, np.full(len(pairs), threshold), operator, periods, datapoints, treat)
+            rows, begins, ends = firing_intervals(states)
+            total = totals[threshold]
+            total[0] += len(np.unique(rows))
+            total[1] += len(rows)
+            total[2] += int((ends - begins).sum()) * period
+    return [(threshold, *totals[threshold]) for threshold in thresholds]
+
+
+def format_replays(replays, limit=20):
+    """Rendu texte : les alarmes restées le plus longtemps en ALARM d'abord."""
+    import datetime
+
+    def when(seconds):
+        return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+    firing = sorted((r for r in replays if r.intervals), key=lambda r: (-r.alarm_seconds, r.alarm, r.series))
+    lines = [f"{len(firing)} alarme(s) déclenchée(s) sur {len(replays)} rejouée(s)"]
+    for result in firing[:limit]:
+        lines.append(f"{result.alarm} [{result.series}] : {len(result.intervals)} plage(s), "
+                     f"{result.alarm_seconds} s en ALARM, état final {STATES[result.final_state]}")
+        for begin, end in result.intervals[:5]:
+            lines.append(f"    {when(begin)} -> {when(end)}")
+        if len(result.intervals) > 5:
+            lines.append(f"    ... {len(result.intervals) - 5} autre(s)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Rejeu des alarmes CloudWatch d'un template sur des métriques locales")
+    parser.add_argument("template", help="preset (q1, q3_1, q3_2) ou fichier template JSON")
+    parser.add_argument("metrics", help="fichier CSV (ou .parquet) : timestamp, InstanceId, value[, MetricName]")
+    parser.add_argument("--threshold", type=float, default=None, help="remplace le seuil des alarmes")
+    parser.add_argument("--sweep", type=float, nargs="+", default=None, help="compare plusieurs seuils")
+    parser.add_argument("--all-series", action="store_true",
+                        help="applique chaque définition d'alarme à toutes les séries de sa métrique")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    from tp4.batch import PRESETS
+
+    if args.template in PRESETS:
+        from tp4.vpc import build_vpc_template
+
+        template = build_vpc_template(PRESETS[args.template])
+    else:
+        with open(args.template) as file:
+            template = json.load(file)
+    alarms = alarms_from_template(template)
+
+    began = time.perf_counter()
+    metrics = load_metrics(args.metrics)
+    loaded = time.perf_counter()
+    if args.sweep:
+        print(f"{'seuil':>10} {'séries':>8} {'plages':>8} {'secondes':>10}")
+        for threshold, series, intervals, seconds in sweep(alarms, metrics, args.sweep, args.all_series):
+            print(f"{threshold:>10g} {series:>8} {intervals:>8} {seconds:>10}")
+    else:
+        print(format_replays(replay(alarms, metrics, args.all_series, args.threshold), args.limit))
+    print(f"\n{len(metrics.values)} échantillons lus en {loaded - began:.2f} s, "
+          f"évalués en {time.perf_counter() - loaded:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Génération en lot de templates VPC à travers un pool de processus.
+
+Au lieu de lancer un interpréteur Python par pile, on distribue les VpcSpec à un
+ProcessPoolExecutor : chaque worker importe troposphere une seule fois puis
+construit et écrit plusieurs templates.
+
+Exemple :
+    python -m tp4.batch --count 500 --output-dir tenants/ --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+from tp4.vpc import Q1_SPEC, Q3_1_SPEC, Q3_2_SPEC, build_vpc_template
+
+
+# Couches disponibles pour les locataires générés en lot
+PRESETS = {"q1": Q1_SPEC, "q3_1": Q3_1_SPEC, "q3_2": Q3_2_SPEC}
+
+
+@dataclass
+class BatchReport:
+    """Résultat d'un lot : nombre de templates écrits et débit obtenu."""
+    count: int
+    seconds: float
+    workers: int
+
+    @property
+    def templates_per_sec(self):
+        return self.count / self.seconds if self.seconds else float("inf")
+
+    def __str__(self):
+        return (f"{self.count} templates en {self.seconds:.2f} s avec {self.workers} "
+                f"worker(s) : {self.templates_per_sec:.1f} templates/s")
+
+
+def available_cpus():
+    """Nombre de CPU utilisables par ce processus (respecte l'affinité si disponible)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Cache ouvert une seule fois par worker (voir tp4/cache.py)
+_cache = None
+
+
+def _write_one(job):
+    # Exécuté dans un worker : job = (spec, chemin de sortie, utiliser le cache)
+    global _cache
+    spec, path, use_cache = job
+    fmt = "json" if path.endswith(".json") else "yaml"
+    if use_cache:
+        from tp4.cache import TemplateCache, builder_sources
+
+        if _cache is None:
+            _cache = TemplateCache()
+        return _cache.generate(path, lambda: build_vpc_template(spec), spec, fmt, sources=builder_sources())
+    # Sans cache, le template est écrit en flux (voir tp4/stream.py)
+    from tp4.stream import write_template
+
+    write_template(build_vpc_template(spec), path, fmt)
+    return "built"
+
+
+def generate_batch(jobs, workers=None, chunksize=None, use_cache=False):
+    """Génère chaque couple (spec, chemin) de ``jobs`` et retourne un BatchReport.
+
+    Avec ``workers=1`` tout est fait dans le processus courant, ce qui sert de
+    référence pour mesurer le gain du pool. Avec ``use_cache``, les templates
+    inchangés depuis le lot précédent ne sont ni reconstruits ni réécrits.
+    """
+    jobs = [(spec, path, use_cache) for spec, path in jobs]
+    workers = workers or available_cpus()
+    start = time.perf_counter()
+    if workers == 1:
+        for job in jobs:
+            _write_one(job)
+    else:
+        # Des paquets de plusieurs specs réduisent le coût de communication entre processus
+        chunksize = chunksize or max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(_write_one, jobs, chunksize=chunksize):
+                pass
+    return BatchReport(len(jobs), time.perf_counter() - start, workers)
+
+
+def tenant_specs(count, base=Q1_SPEC, prefix="tenant", pool="10.0.0.0/8", vpc_prefix=16):
+    """Retourne ``count`` specs dérivées de ``base``, une par locataire.
+
+    Chaque locataire reçoit son propre bloc /``vpc_prefix`` pris dans ``pool`` :
+    les VPC ne se chevauchent pas et peuvent donc être appairés plus tard.
+    """
+    from tp4.cidr import CidrAllocator
+
+    allocator = CidrAllocator(pool)
+    specs = []
+    for index in range(count):
+        name = f"{prefix}-{index:04d}"
+        specs.append(replace(
+            base,
+            description=f"VPC du locataire {name}",
+            cidr_block=allocator.allocate(vpc_prefix, label=name),
+            vpc_name=f"{name}-vpc",
+            igw_name=f"{name}-igw",
+            sg_name=f"{name}-sg",
+        ))
+    return specs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération en lot de templates VPC")
+    parser.add_argument("--count", type=int, default=100, help="nombre de VPC à générer")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="q1",
+                        help="couches à inclure (q1: réseau, q3_1: + flow logs, q3_2: + EC2 et alarmes)")
+    parser.add_argument("--output-dir", default="tenants")
+    parser.add_argument("--pool", default="10.0.0.0/8", help="bloc dans lequel les VPC sont découpés")
+    parser.add_argument("--vpc-prefix", type=int, default=16, help="taille du bloc de chaque VPC")
+    parser.add_argument("--format", choices=["yaml", "json"], default="yaml")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="taille du pool de processus (par défaut : nombre de CPU)")
+    parser.add_argument("--cache", action="store_true",
+                        help="ne régénérer que les templates modifiés (voir tp4/cache.py)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    specs = tenant_specs(args.count, PRESETS[args.preset], pool=args.pool, vpc_prefix=args.vpc_prefix)
+    jobs = [(spec, os.path.join(args.output_dir, f"{spec.vpc_name}.{args.format}")) for spec in specs]
+    try:
+        report = generate_batch(jobs, workers=args.workers, use_cache=args.cache)
+    except ValueError as error:         # template hors des limites d'une pile, voir tp4.split
+        parser.error(str(error))
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
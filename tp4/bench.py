@@ -0,0 +1,185 @@
+"""Bancs d'essai des outils tp4.
+
+Chaque mesure tourne dans un processus neuf pour que le pic de mémoire (RSS) d'un
+cas ne pollue pas le suivant.
+
+    python -m tp4.bench stream --sizes 100 1000 10000 --format yaml
+    python -m tp4.bench startup --targets vpc bucket --repeat 5
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = (
+    "Exercice/Q1/Q1.py", "Exercice/Q2/create_s3_bucket.py", "Exercice/Q3/Question 3_1/Q3_1.py",
+    "Exercice/Q3/Question 3_2/Q3_2.py", "Exercice/Q3/Question 3_3/Q3_3.py",
+)
+
+
+# ----------------------------------------------------------------------
+# ------- Sérialisation : to_yaml()/to_json() contre tp4.stream --------
+# ----------------------------------------------------------------------
+def fleet_template(resource_count):
+    """Template de flotte : le VPC de la Q3.2 complété d'instances et d'alarmes.
+
+    troposphere refuse plus de 500 ressources dans add_resource() (limite de
+    CloudFormation) ; le banc passe donc par add_fleet_resource(), comme les
+    flottes de build_vpc_template().
+    """
+    from tp4.vpc import Q3_2_SPEC, add_fleet_resource, build_vpc_template, create_alarm
+    import troposphere.ec2 as ec2
+    from troposphere import Ref
+
+    template = build_vpc_template(Q3_2_SPEC)
+    index = 0
+    while len(template.resources) < resource_count:
+        instance = add_fleet_resource(template, ec2.Instance(
+            f"FleetInstance{index}",
+            ImageId=Q3_2_SPEC.compute.ami,
+            InstanceType=Q3_2_SPEC.compute.instance_type,
+            SubnetId=Ref("PrivateSubnetAZ1"),
+            SecurityGroupIds=[Ref("polystudent14SG")],
+            IamInstanceProfile=Ref("LabInstanceProfile")
+        ))
+        if len(template.resources) < resource_count:
+            add_fleet_resource(template, create_alarm(instance, f"Fleet{index}", Q3_2_SPEC.monitoring))
+        index += 1
+    return template
+
+
+def _stream_case(resource_count, mode, fmt, path):
+    # Exécuté dans le processus enfant : construit, sérialise, puis mesure
+    from tp4.stream import write_template
+
+    template = fleet_template(resource_count)
+    start = time.perf_counter()
+    if mode == "stream":
+        write_template(template, path, fmt)
+    else:
+        with open(path, "w") as file:
+            file.write(template.to_yaml() if fmt == "yaml" else template.to_json())
+    seconds = time.perf_counter() - start
+    # ru_maxrss est en kilo-octets sous Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_mb}))
+
+
+def bench_stream(sizes, fmt, workdir):
+    """Compare to_yaml()/to_json() au flux pour chaque taille et vérifie l'égalité des sorties."""
+    print(f"{'ressources':>10} {'mode':>7} {'temps (s)':>10} {'pic RSS (Mo)':>13}")
+    for size in sizes:
+        outputs = {}
+        for mode in ("string", "stream"):
+            path = os.path.join(workdir, f"bench-{size}-{mode}.{fmt}")
+            result = subprocess.run(
+                [sys.executable, "-m", "tp4.bench", "_stream-case", str(size), mode, fmt, path],
+                capture_output=True, text=True,
+            )
+            if result.returncode:
+                sys.exit(result.stderr)
+            measure = json.loads(result.stdout)
+            outputs[mode] = path
+            print(f"{size:>10} {mode:>7} {measure['seconds']:>10.3f} {measure['peak_rss_mb']:>13.1f}")
+        with open(outputs["string"], "rb") as a, open(outputs["stream"], "rb") as b:
+            identical = a.read() == b.read()
+        print(f"{size:>10} sorties identiques : {'oui' if identical else 'NON'}")
+        for path in outputs.values():
+            os.remove(path)
+
+
+# ----------------------------------------------------------------------
+# ------- Démarrage : scripts séparés contre python -m tp4 -------------
+# ----------------------------------------------------------------------
+def _importtime(stderr):
+    # (total en µs, [(cumulé, module)] des imports de premier niveau) d'une sortie -X importtime
+    top = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name[1:].startswith(" "):
+            top.append((int(cumulative), name.strip()))
+    return sum(us for us, _ in top), top
+
+
+def _run_case(commands, workdir):
+    # Lance chaque commande (un interpréteur par commande) ; retourne (secondes, import µs, imports)
+    env = dict(os.environ, TP4_CACHE_DIR=os.path.join(workdir, ".cache"), PYTHONPATH=ROOT)
+    env.pop("TP4_NO_CACHE", None)
+    start, total, top = time.perf_counter(), 0, []
+    for command in commands:
+        result = subprocess.run([sys.executable, "-X", "importtime", *command], cwd=workdir, env=env,
+                                capture_output=True, text=True)
+        if result.returncode:
+            sys.exit(result.stderr)
+        us, modules = _importtime(result.stderr)
+        total += us
+        top += modules
+    return time.perf_counter() - start, total, top
+
+
+def bench_startup(targets, repeat):
+    """Temps de démarrage (cache vide, puis cache à jour) des scripts et de python -m tp4."""
+    cases = [("5 scripts", [[os.path.join(ROOT, script)] for script in SCRIPTS]),
+             ("python -m tp4 all", [["-m", "tp4", "all"]])]
+    cases += [(f"python -m tp4 {target}", [["-m", "tp4", target]]) for target in targets]
+    print(f"{'commande':<26} {'cache':>6} {'médiane (ms)':>13} {'imports (ms)':>13}  principaux imports")
+    for label, commands in cases:
+        for state in ("vide", "à jour"):
+            walls = []
+            for _ in range(repeat):
+                workdir = tempfile.mkdtemp(prefix="tp4-startup-")
+                try:
+                    if state == "à jour":
+                        _run_case(commands, workdir)
+                    seconds, imports, top = _run_case(commands, workdir)
+                    walls.append(seconds)
+                finally:
+                    shutil.rmtree(workdir)
+            by_module = {}
+            for us, name in top:
+                by_module[name] = by_module.get(name, 0) + us
+            heaviest = ", ".join(f"{name} {us / 1000:.0f}"
+                                 for name, us in sorted(by_module.items(), key=lambda item: -item[1])[:3])
+            print(f"{label:<26} {state:>6} {statistics.median(walls) * 1000:>13.0f} {imports / 1000:>13.1f}  "
+                  f"{heaviest}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bancs d'essai des outils tp4")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stream = commands.add_parser("stream", help="sérialisation complète contre sérialisation en flux")
+    stream.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    stream.add_argument("--format", choices=["yaml", "json"], default="yaml")
+    stream.add_argument("--workdir", default=".")
+
+    startup = commands.add_parser("startup", help="démarrage des scripts contre python -m tp4 (-X importtime)")
+    startup.add_argument("--targets", nargs="*", default=["vpc", "bucket"])
+    startup.add_argument("--repeat", type=int, default=5)
+
+    case = commands.add_parser("_stream-case")
+    case.add_argument("size", type=int)
+    case.add_argument("mode")
+    case.add_argument("format")
+    case.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "stream":
+        bench_stream(args.sizes, args.format, args.workdir)
+    elif args.command == "startup":
+        bench_startup(args.targets, args.repeat)
+    elif args.command == "_stream-case":
+        _stream_case(args.size, args.mode, args.format, args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Cache sur disque, adressé par contenu, des templates CloudFormation générés.
+
+La clé d'un template est un SHA-256 calculé sur ses entrées (le spec), le format
+de sortie, la version de troposphere et le code source des générateurs : tout le
+paquet tp4 (voir builder_sources()), car les générateurs importent à la demande
+des modules auxiliaires (tp4.cidr, tp4.sg...) qui changent aussi le résultat. Tant que
+la clé ne change pas et que le fichier de sortie est intact, on évite la
+construction, la sérialisation et l'écriture.
+
+Le cache est une base SQLite (sûre entre processus) bornée en taille : les
+entrées les moins récemment utilisées sont évincées en premier. Les compteurs de
+hits, de misses et d'évictions sont conservés dans la base.
+
+Variables d'environnement :
+    TP4_CACHE_DIR        dossier du cache (par défaut : .tp4-cache à la racine du dépôt)
+    TP4_CACHE_MAX_BYTES  taille maximale des sorties conservées (par défaut : 256 Mio)
+    TP4_NO_CACHE         si défini, le cache est ignoré et tout est régénéré
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import sqlite3
+import sys
+import time
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tp4-cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_VERSION = re.compile(r"^__version__\s*=\s*[\"']([^\"']+)[\"']", re.MULTILINE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0), ('bytes', 0);
+"""
+
+
+def builder_sources():
+    """Sources hachées dans la clé des templates générés, communes aux scripts et à ``python -m tp4``.
+
+    C'est le paquet tp4 entier : hacher seulement le module du générateur
+    laisserait passer une modification de tp4.cidr ou tp4.sg.
+    """
+    return ["tp4"]
+
+
+def _source_paths(source):
+    # Une source est un chemin de fichier, un module ("tp4.vpc") ou un paquet ("tp4" : tous ses
+    # fichiers .py et ses données) ; retourne [(nom dans la clé, chemin)]
+    if os.path.isfile(source):
+        return [("", source)]
+    spec = importlib.util.find_spec(source)
+    if spec is None or spec.origin is None:
+        raise ValueError(f"source introuvable pour la clé de cache : {source}")
+    if not spec.submodule_search_locations:
+        return [("", spec.origin)]
+    paths = []
+    for location in spec.submodule_search_locations:
+        for root, directories, files in os.walk(location):
+            directories[:] = sorted(name for name in directories if name != "__pycache__")
+            for name in sorted(files):
+                if name.endswith((".py", ".json")):
+                    path = os.path.join(root, name)
+                    paths.append((os.path.relpath(path, location), path))
+    return paths
+
+
+_digests = {}
+
+
+def _file_digest(path):
+    # Empreinte d'un fichier, relue seulement si sa taille ou sa date de modification change
+    stat = os.stat(path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    known = _digests.get(path)
+    if known is None or known[0] != stamp:
+        with open(path, "rb") as file:
+            known = _digests[path] = (stamp, hashlib.sha256(file.read()).digest())
+    return known[1]
+
+
+def troposphere_version():
+    """Version de troposphere, lue dans son source tant que le module n'est pas chargé.
+
+    Importer troposphere (cfn_flip, yaml, ...) coûte environ 100 ms : sur un hit
+    du cache, le template n'est pas construit et troposphere n'est jamais importé.
+    """
+    module = sys.modules.get("troposphere")
+    if module is None:
+        spec = importlib.util.find_spec("troposphere")
+        if spec is not None and spec.origin is not None:
+            with open(spec.origin, encoding="utf-8") as file:
+                match = _VERSION.search(file.read())
+            if match is not None:
+                return match.group(1)
+        import troposphere as module
+    return module.__version__
+
+
+def cache_key(inputs, fmt, sources=()):
+    """Clé de cache des entrées ``inputs`` sérialisées en ``fmt`` par le code de ``sources``."""
+    digest = hashlib.sha256()
+    digest.update(f"tp4-cache-v1\0{troposphere_version()}\0{fmt}\0{inputs!r}\0".encode())
+    for source in sources:
+        for name, path in _source_paths(source):
+            digest.update(f"{name}\0".encode())
+            digest.update(_file_digest(path))
+    return digest.hexdigest()
+
+
+def serialize(template, fmt):
+    """Texte du template au format "yaml" ou "json" (comme to_yaml()/to_json())."""
+    if fmt == "yaml":
+        return template.to_yaml()
+    if fmt == "json":
+        return template.to_json()
+    raise ValueError(f"format inconnu : {fmt}")
+
+
+class TemplateCache:
+    """Cache LRU borné en octets des templates sérialisés."""
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get("TP4_CACHE_DIR") or DEFAULT_DIR
+        self.max_bytes = int(max_bytes or os.environ.get("TP4_CACHE_MAX_BYTES") or DEFAULT_MAX_BYTES)
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.directory, "cache.sqlite3"), timeout=30)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # ------- Compteurs -------------------------------------------------
+    # ------------------------------------------------------------------
+    def stats(self):
+        """Compteurs persistants : hits, misses, evictions, bytes et entries."""
+        stats = dict(self._db.execute("SELECT name, value FROM stats"))
+        stats["entries"] = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+    def _bump(self, name, delta=1):
+        self._db.execute("UPDATE stats SET value = value + ? WHERE name = ?", (delta, name))
+
+    # ------------------------------------------------------------------
+    # ------- Génération à travers le cache -----------------------------
+    # ------------------------------------------------------------------
+    def generate(self, output_path, build, inputs, fmt=None, sources=()):
+        """Écrit le template de ``build()`` dans ``output_path`` seulement si nécessaire.
+
+        ``build`` n'est appelé que sur un miss. Retourne "hit" si le fichier était
+        déjà à jour (rien n'est construit, sérialisé ni écrit), "restored" s'il a été
+        réécrit depuis le cache et "built" si le template a été reconstruit.
+        """
+        fmt = fmt or ("json" if output_path.endswith(".json") else "yaml")
+        key = cache_key(inputs, fmt, sources)
+        path = os.path.abspath(output_path)
+        now = time.time()
+
+        with self._db:
+            row = self._db.execute(
+                "SELECT key, size, mtime_ns FROM outputs WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and row[0] == key and _stat_matches(path, row[1], row[2]):
+                # Fichier déjà à jour : le cache n'est même pas relu
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                self._bump("hits")
+                return "hit"
+
+            entry = self._db.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if entry is not None:
+                data = entry[0]
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                self._bump("hits")
+                status = "restored"
+            else:
+                data = serialize(build(), fmt).encode("utf-8")
+                self._store(key, data, now)
+                self._bump("misses")
+                status = "built"
+
+        _write_bytes(path, data)
+        stat = os.stat(path)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+                (path, key, stat.st_size, stat.st_mtime_ns),
+            )
+        return status
+
+    def _store(self, key, data, now):
+        self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, data, len(data), now))
+        self._bump("bytes", len(data))
+        self._evict()
+
+    def _evict(self):
+        # Éviction LRU : on retire les entrées les plus anciennes jusqu'à repasser sous la borne
+        total = self._db.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM outputs WHERE key = ?", (key,))
+            total -= size
+            self._bump("bytes", -size)
+            self._bump("evictions")
+
+
+def _stat_matches(path, size, mtime_ns):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+
+def _write_bytes(path, data):
+    # Écriture atomique : un lecteur ne voit jamais un fichier à moitié écrit
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as file:
+        file.write(data)
+    os.replace(tmp, path)
+
+
+def write_template(output_path, build, inputs, fmt=None, sources=()):
+    """Génère ``output_path`` à travers le cache par défaut et retourne le statut.
+
+    Avec TP4_NO_CACHE, le template est toujours reconstruit et réécrit ("built").
+    """
+    if os.environ.get("TP4_NO_CACHE"):
+        from tp4.stream import write_template as write_stream
+
+        write_stream(build(), output_path, fmt)
+        return "built"
+    with TemplateCache() as cache:
+        return cache.generate(output_path, build, inputs, fmt, sources)
@@ -0,0 +1,431 @@
+"""Forme canonique et différence sémantique de deux templates (arbre de Merkle).
+
+Q1.py, Q3_1.py et Q3_2.py produisent des VPC presque identiques, et
+"VPC Security/vpc.yaml" décrit le même réseau avec des paramètres. Un diff
+textuel de ces fichiers dépend de l'ordre des clés et du format ; ici les deux
+templates sont d'abord mis en forme canonique :
+
+- les paramètres connus (valeur ``Default`` ou ``--param``) remplacent leurs
+  ``Ref`` et les ``${...}`` de ``Fn::Sub`` ; un ``Fn::Sub`` sans variable
+  restante, un ``Fn::Join`` de chaînes et un ``Fn::Select`` sur une liste
+  connue deviennent des chaînes ; ``Fn::GetAtt`` prend toujours la forme liste ;
+- les scalaires deviennent des chaînes (``true``/``"true"``, ``80``/``"80"``
+  sont équivalents pour CloudFormation) ;
+- les listes de tags ``[{Key, Value}]`` deviennent ``{Key: Value}`` (l'ordre
+  des tags ne compte pas) et ``DependsOn`` une liste triée.
+
+Chaque nœud de la forme canonique reçoit une empreinte (BLAKE2b) calculée à
+partir de celles de ses enfants, indépendante de l'ordre des clés ; les grands
+dictionnaires (``Resources`` d'un template de flotte) sont en plus répartis en
+paquets par nom. La comparaison ne descend que dans les sous-arbres dont les
+empreintes diffèrent : son coût suit la taille du changement, pas celle des
+templates.
+
+Les ressources présentes d'un seul côté sont rapprochées par type et par
+propriétés identiques, références masquées (``VPCQ1TP4`` et ``VPC`` sont la
+même ressource renommée), puis comparées propriété par propriété.
+
+    python -m tp4.canon q1 q3_1
+    python -m tp4.canon q1 "VPC Security/vpc.yaml" --param EnvironmentName=polystudent \\
+        --azs us-east-1a us-east-1b
+"""
+import argparse
+import hashlib
+import json
+import time
+import zlib
+from dataclasses import dataclass
+
+from tp4.refs import _SUB_TOKEN, rewrite_references, template_dict
+
+BUCKET_THRESHOLD = 64       # au-delà, les enfants d'un dictionnaire sont répartis en paquets
+_BUCKETS = 256
+
+
+# ----------------------------------------------------------------------
+# ------- Forme canonique -----------------------------------------------
+# ----------------------------------------------------------------------
+def parameter_values(template, overrides=None):
+    """{paramètre: valeur} connus : ``Default`` du template, remplacé par ``overrides``."""
+    values = {}
+    for name, body in (template.get("Parameters") or {}).items():
+        value = (overrides or {}).get(name, body.get("Default"))
+        if value is None:
+            continue
+        value = _scalar(value)
+        if str(body.get("Type", "")).startswith(("List<", "CommaDelimitedList")):
+            value = [item.strip() for item in value.split(",")]
+        values[name] = value
+    return values
+
+
+def _scalar(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+def _is_tags(value):
+    return bool(value) and all(isinstance(item, dict) and item.keys() == {"Key", "Value"}
+                               and isinstance(item["Key"], str) for item in value)
+
+
+def _canon(value, values, azs):
+    if isinstance(value, list):
+        if _is_tags(value):
+            return {item["Key"]: _canon(item["Value"], values, azs)
+                    for item in sorted(value, key=lambda item: item["Key"])}
+        return [_canon(item, values, azs) for item in value]
+    if not isinstance(value, dict):
+        return _scalar(value)
+    if len(value) == 1:
+        (key, args), = value.items()
+        if key == "Ref" and isinstance(args, str):
+            return values[args] if args in values else value
+        if key == "Fn::GetAtt":
+            return {key: args.split(".", 1) if isinstance(args, str) else [_canon(arg, values, azs) for arg in args]}
+        if key == "Fn::Sub":
+            return _sub(args, values, azs)
+        if key == "Fn::GetAZs" and azs:
+            return list(azs)
+        args = _canon(args, values, azs)
+        if key == "Fn::Join" and len(args) == 2 and isinstance(args[1], list) \
+                and all(isinstance(item, str) for item in args[1]):
+            return args[0].join(args[1])
+        if key == "Fn::Select" and len(args) == 2 and isinstance(args[1], list) \
+                and isinstance(args[0], str) and args[0].isdigit() and int(args[0]) < len(args[1]):
+            return args[1][int(args[0])]
+        return {key: args}
+    result = {}
+    for key in sorted(value):
+        item = _canon(value[key], values, azs)
+        if key == "DependsOn":
+            item = sorted([item] if isinstance(item, str) else item)
+        result[key] = item
+    return result
+
+
+def _sub(args, values, azs):
+    text, variables = (args, {}) if isinstance(args, str) else (args[0], args[1])
+    variables = {name: _canon(item, values, azs) for name, item in variables.items()}
+
+    def token(match):
+        name = match.group(1)
+        known = variables[name] if name in variables else values.get(name)
+        return known if isinstance(known, str) else match.group(0)
+
+    text = _SUB_TOKEN.sub(token, text)
+    remaining = set(_SUB_TOKEN.findall(text))
+    variables = {name: item for name, item in variables.items() if name in remaining}
+    if variables:
+        return {"Fn::Sub": [text, variables]}
+    # ${!Littéral} s'écrit ${Littéral} une fois la substitution faite
+    return {"Fn::Sub": text} if remaining else text.replace("${!", "${")
+
+
+def canonical(template, parameters=None, azs=None):
+    """Forme canonique (dict) d'un template troposphere ou dict.
+
+    ``parameters`` complète ou remplace les valeurs par défaut des paramètres ;
+    ``azs`` est la liste des zones de disponibilité que retourne ``Fn::GetAZs``.
+    """
+    data = template_dict(template)
+    return _canon(data, parameter_values(data, parameters), azs)
+
+
+# ----------------------------------------------------------------------
+# ------- Arbre de Merkle ------------------------------------------------
+# ----------------------------------------------------------------------
+class MerkleNode:
+    """Nœud de l'arbre : empreinte, valeur canonique, enfants (dict ou liste) et paquets."""
+    __slots__ = ("digest", "value", "children", "buckets")
+
+    def __init__(self, digest, value, children=None, buckets=None):
+        self.digest = digest
+        self.value = value
+        self.children = children
+        self.buckets = buckets      # {paquet: (empreinte, clés)} des grands dictionnaires
+
+
+def _bucket(key):
+    return zlib.crc32(key.encode()) % _BUCKETS
+
+
+def _hash_items(tag, items):
+    digest = hashlib.blake2b(tag, digest_size=16)
+    for key, child in items:
+        digest.update(key.encode())
+        digest.update(b"\0")
+        digest.update(child)
+    return digest.digest()
+
+
+def merkle_tree(value):
+    """Arbre de Merkle d'une valeur canonique (voir ``canonical``)."""
+    return _tree(value, {})
+
+
+def _tree(value, leaves):
+    if isinstance(value, dict):
+        children = {str(key): _tree(item, leaves) for key, item in value.items()}
+        if len(children) <= BUCKET_THRESHOLD:
+            return MerkleNode(_hash_items(b"d", ((key, children[key].digest) for key in sorted(children))),
+                              value, children)
+        grouped = {}
+        for key in children:
+            grouped.setdefault(_bucket(key), []).append(key)
+        buckets = {}
+        for bucket, keys in grouped.items():
+            keys.sort()
+            buckets[bucket] = (_hash_items(b"b", ((key, children[key].digest) for key in keys)), keys)
+        digest = _hash_items(b"D", ((str(bucket), buckets[bucket][0]) for bucket in sorted(buckets)))
+        return MerkleNode(digest, value, children, buckets)
+    if isinstance(value, list):
+        children = [_tree(item, leaves) for item in value]
+        digest = hashlib.blake2b(b"l", digest_size=16)
+        for child in children:
+            digest.update(child.digest)
+        return MerkleNode(digest.digest(), value, children)
+    # Les feuilles se répètent beaucoup (types, CIDR, "0.0.0.0/0") : une par valeur distincte
+    node = leaves.get(value)
+    if node is None:
+        encoded = b"n" if value is None else b"s" + str(value).encode()
+        node = leaves[value] = MerkleNode(hashlib.blake2b(encoded, digest_size=16).digest(), value)
+    return node
+
+
+# ----------------------------------------------------------------------
+# ------- Différence ----------------------------------------------------
+# ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class Change:
+    """Changement à un chemin de la forme canonique : added, removed, modified ou reordered."""
+    path: tuple
+    kind: str
+    old: object = None
+    new: object = None
+
+    @property
+    def location(self):
+        text = ""
+        for part in self.path:
+            text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else part)
+        return text
+
+
+def diff_trees(old, new, path=()):
+    """Changements entre deux arbres, en ne descendant que dans les sous-arbres différents."""
+    changes = []
+    _diff(old, new, path, changes)
+    return changes
+
+
+def _changed_keys(old, new):
+    if old.buckets is None or new.buckets is None:
+        return old.children.keys() | new.children.keys()
+    keys = set()
+    for mine, other in ((old.buckets, new.buckets), (new.buckets, old.buckets)):
+        for bucket, (digest, bucket_keys) in mine.items():
+            if bucket not in other or other[bucket][0] != digest:
+                keys.update(bucket_keys)
+    return keys
+
+
+def _diff(old, new, path, changes):
+    if old.digest == new.digest:
+        return
+    if isinstance(old.children, dict) and isinstance(new.children, dict):
+        for key in sorted(_changed_keys(old, new)):
+            mine, other = old.children.get(key), new.children.get(key)
+            if other is None:
+                changes.append(Change(path + (key,), "removed", old=mine.value))
+            elif mine is None:
+                changes.append(Change(path + (key,), "added", new=other.value))
+            else:
+                _diff(mine, other, path + (key,), changes)
+    elif isinstance(old.children, list) and isinstance(new.children, list):
+        _diff_lists(old.children, new.children, path, changes)
+    else:
+        changes.append(Change(path, "modified", old.value, new.value))
+
+
+def _diff_lists(old, new, path, changes):
+    # Les éléments identiques des deux côtés sont appariés par empreinte, quel que soit leur rang ;
+    # les autres sont comparés dans l'ordre, le surplus est ajouté ou retiré
+    available = {}
+    for index, child in enumerate(old):
+        available.setdefault(child.digest, []).append(index)
+    matched, added = set(), []
+    for index, child in enumerate(new):
+        candidates = available.get(child.digest)
+        if candidates:
+            matched.add(candidates.pop(0))
+        else:
+            added.append(index)
+    removed = [index for index in range(len(old)) if index not in matched]
+    if not removed and not added:
+        changes.append(Change(path, "reordered", [child.value for child in old], [child.value for child in new]))
+        return
+    for before, after in zip(removed, added):
+        _diff(old[before], new[after], path + (after,), changes)
+    for before in removed[len(added):]:
+        changes.append(Change(path + (before,), "removed", old=old[before].value))
+    for after in added[len(removed):]:
+        changes.append(Change(path + (after,), "added", new=new[after].value))
+
+
+# ----------------------------------------------------------------------
+# ------- Ressources renommées -------------------------------------------
+# ----------------------------------------------------------------------
+def _features(body, resources):
+    # Empreintes des propriétés, les références étant remplacées par le type de la ressource citée
+    def blind(name, attribute):
+        target = resources.get(name)
+        return {"Ref": f"<{target.get('Type')}>"} if target is not None else None
+
+    features = {("Type", merkle_tree(body.get("Type")).digest)}
+    for key, value in (body.get("Properties") or {}).items():
+        features.add((key, merkle_tree(rewrite_references(value, blind)).digest))
+    return features
+
+
+def match_resources(old, new):
+    """{nom dans ``new``: nom dans ``old``} des ressources renommées entre deux formes canoniques.
+
+    Seules les ressources absentes de l'autre template sont candidates ; deux
+    ressources du même type sont appariées par nombre de propriétés identiques,
+    puis par rang parmi les ressources de ce type.
+    """
+    old_resources, new_resources = old.get("Resources") or {}, new.get("Resources") or {}
+    only_old = [name for name in old_resources if name not in new_resources]
+    only_new = [name for name in new_resources if name not in old_resources]
+    if not only_old or not only_new:
+        return {}
+
+    def ranked(names, resources):
+        ranks, seen = {}, {}
+        for name in names:
+            kind = resources[name].get("Type")
+            ranks[name] = (kind, seen.get(kind, 0))
+            seen[kind] = seen.get(kind, 0) + 1
+        return ranks
+
+    old_ranks, new_ranks = ranked(only_old, old_resources), ranked(only_new, new_resources)
+    old_features = {name: _features(old_resources[name], old_resources) for name in only_old}
+    new_features = {name: _features(new_resources[name], new_resources) for name in only_new}
+    pairs = []
+    for before in only_old:
+        for after in only_new:
+            if old_ranks[before][0] == new_ranks[after][0]:
+                score = len(old_features[before] & new_features[after])
+                pairs.append((-score, abs(old_ranks[before][1] - new_ranks[after][1]), old_ranks[before][1],
+                              before, after))
+    renames, taken = {}, set()
+    for _, _, _, before, after in sorted(pairs):
+        if before not in taken and after not in renames:
+            renames[after] = before
+            taken.add(before)
+    return renames
+
+
+def rename_resources(template, renames):
+    """Copie d'une forme canonique où les ressources (et leurs références) portent les noms de ``renames``."""
+    def replace(name, attribute):
+        if name not in renames:
+            return None
+        return {"Ref": renames[name]} if attribute is None else {"Fn::GetAtt": [renames[name], attribute]}
+
+    result = {}
+    for section, body in template.items():
+        if section == "Resources":
+            resources = {}
+            for name, resource in body.items():
+                resource = rewrite_references(resource, replace)
+                if "DependsOn" in resource:
+                    resource["DependsOn"] = sorted(renames.get(item, item) for item in resource["DependsOn"])
+                resources[renames.get(name, name)] = resource
+            body = dict(sorted(resources.items()))
+        elif isinstance(body, (dict, list)):
+            body = rewrite_references(body, replace)
+        result[section] = body
+    return result
+
+
+def diff_templates(old, new, parameters=None, azs=None, match=True):
+    """(changements, renommages {nouveau: ancien}) entre deux templates troposphere ou dict."""
+    old, new = canonical(old, parameters, azs), canonical(new, parameters, azs)
+    renames = match_resources(old, new) if match else {}
+    if renames:
+        new = rename_resources(new, renames)
+    return diff_trees(merkle_tree(old), merkle_tree(new)), renames
+
+
+def _short(value, width=70):
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+
+def format_changes(changes, renames):
+    lines = [f"  renommée : {before} → {after}" for after, before in renames.items()]
+    for change in changes:
+        if change.kind == "added":
+            lines.append(f"+ {change.location} : {_short(change.new)}")
+        elif change.kind == "removed":
+            lines.append(f"- {change.location} : {_short(change.old)}")
+        elif change.kind == "reordered":
+            lines.append(f"↕ {change.location} : même contenu, autre ordre")
+        else:
+            lines.append(f"~ {change.location} : {_short(change.old, 40)} → {_short(change.new, 40)}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from tp4.rules import load_template, preset_template
+
+    parser = argparse.ArgumentParser(description="Différence sémantique entre deux templates (forme canonique)")
+    parser.add_argument("old", help="preset (q1, q3_1, ...) ou fichier JSON/YAML")
+    parser.add_argument("new", help="preset (q1, q3_1, ...) ou fichier JSON/YAML")
+    parser.add_argument("--param", action="append", default=[], metavar="NOM=VALEUR",
+                        help="valeur d'un paramètre (remplace Default)")
+    parser.add_argument("--azs", nargs="+", default=None, help="zones retournées par Fn::GetAZs")
+    parser.add_argument("--section", action="append", default=None,
+                        help="ne compare que cette section (Resources, Outputs...)")
+    parser.add_argument("--no-match", action="store_true", help="ne rapproche pas les ressources renommées")
+    parser.add_argument("--json", action="store_true", help="changements en JSON")
+    parser.add_argument("--exit-code", action="store_true", help="code de retour 1 s'il y a des changements")
+    args = parser.parse_args(argv)
+    parameters = {}
+    for item in args.param:
+        name, separator, value = item.partition("=")
+        if not separator:
+            parser.error(f"--param attend NOM=VALEUR : {item}")
+        parameters[name] = value
+
+    templates = []
+    for name in (args.old, args.new):
+        template = preset_template(name)
+        template = template_dict(template if template is not None else load_template(name))
+        if args.section:
+            template = {section: template[section] for section in args.section if section in template}
+        templates.append(template)
+    began = time.perf_counter()
+    changes, renames = diff_templates(*templates, parameters=parameters, azs=args.azs, match=not args.no_match)
+    elapsed = time.perf_counter() - began
+
+    if args.json:
+        print(json.dumps({"renamed": renames,
+                          "changes": [{"path": change.location, "kind": change.kind, "old": change.old,
+                                       "new": change.new} for change in changes]},
+                         indent=2, ensure_ascii=False))
+    else:
+        print(f"{args.old} → {args.new} : {len(changes)} changement(s), {len(renames)} ressource(s) "
+              f"renommée(s) en {elapsed * 1000:.1f} ms")
+        if changes or renames:
+            print(format_changes(changes, renames))
+    return 1 if args.exit_code and changes else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
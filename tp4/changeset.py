@@ -0,0 +1,243 @@
+"""Prévision d'un change set : mise à jour sur place ou remplacement, ressource par ressource.
+
+Entre vpc_Q1.yaml, vpc-Q3_1.yaml et vpc-Q3_2.yaml, certaines modifications
+de propriétés obligent CloudFormation à remplacer la ressource (nouvelle
+ressource créée, ancienne supprimée au nettoyage) : un NAT Gateway, un
+sous-réseau ou une instance remplacés coûtent plusieurs minutes et coupent le
+trafic. Ce module compare deux versions d'un template avant l'envoi du change
+set :
+
+- les propriétés modifiées viennent de la différence canonique (tp4.canon) ;
+- leur comportement vient d'une table embarquée, data/update_behavior.json
+  (Immutable : remplacement, Conditional : remplacement selon la valeur,
+  Interrupting : interruption ; Mutable sinon), indexée une fois par
+  processus en {type: {propriété: comportement}} ;
+- un remplacement se propage : une propriété qui cite par Ref ou Fn::GetAtt
+  une ressource remplacée change de valeur elle aussi ;
+- la durée est estimée sur le graphe de dépendances avec les durées de
+  tp4.graph (LATENCY) : mise à jour, puis nettoyage des anciennes ressources.
+
+    python -m tp4.changeset q1 q3_2
+    python -m tp4.changeset vpc_Q1.yaml vpc-Q3_1.yaml --fail-on-replacement 60
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from tp4.canon import canonical, diff_trees, merkle_tree
+from tp4.graph import DEFAULT_LATENCY, LATENCY, DeployGraph
+from tp4.refs import references
+
+BEHAVIOR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "update_behavior.json")
+IN_PLACE_SECONDS = 5        # mise à jour sans interruption d'une propriété
+# Action de la ressource selon le comportement de la propriété modifiée, de la moins à la plus coûteuse
+_ACTIONS = ("update", "interrupt", "conditional", "replace")
+_ACTION_OF = {"Mutable": "update", "Interrupting": "interrupt", "Conditional": "conditional", "Immutable": "replace"}
+LABELS = {
+    "create": "création", "delete": "suppression", "replace": "remplacement",
+    "conditional": "remplacement possible", "interrupt": "mise à jour avec interruption",
+    "update": "mise à jour sans interruption",
+}
+_SIGNS = {"create": "+", "delete": "-", "replace": "!", "conditional": "?", "interrupt": "*", "update": "~"}
+
+
+@lru_cache(maxsize=None)
+def update_behaviors(path=BEHAVIOR_FILE):
+    """Index {type: {propriété: comportement}} de la table ; les propriétés absentes sont Mutable."""
+    with open(path) as file:
+        table = json.load(file)
+    return {kind: {prop: behavior for behavior, props in groups.items() for prop in props}
+            for kind, groups in table.items() if not kind.startswith("_")}
+
+
+def property_behavior(kind, prop):
+    """Comportement d'une propriété modifiée ; Conditional si le type n'est pas dans la table."""
+    behaviors = update_behaviors()
+    if kind not in behaviors:
+        return "Conditional"
+    return behaviors[kind].get(prop, "Mutable")
+
+
+@dataclass(frozen=True)
+class ResourceChange:
+    """Action prévue pour une ressource ; ``reasons`` : (propriété, comportement, cause)."""
+    name: str
+    kind: str
+    action: str
+    reasons: tuple = ()
+    seconds: float = 0.0
+
+    @property
+    def replaced(self):
+        return self.action in ("replace", "conditional")
+
+
+@dataclass
+class Forecast:
+    """Changements prévus et durée estimée (mise à jour puis nettoyage), en secondes."""
+    changes: list
+    update_seconds: float
+    cleanup_seconds: float
+    critical_path: list
+
+    def by_action(self):
+        counts = dict.fromkeys(LABELS, 0)
+        for change in self.changes:
+            counts[change.action] += 1
+        return counts
+
+    def slow_replacements(self, threshold):
+        return [change for change in self.changes if change.replaced and change.seconds >= threshold]
+
+
+# ----------------------------------------------------------------------
+# ------- Prévision -----------------------------------------------------
+# ----------------------------------------------------------------------
+def _changed_properties(old_resources, new_resources):
+    # {ressource: {(propriété, vrai) ou (attribut de ressource, faux)}} par la différence de Merkle
+    changed = {}
+    for change in diff_trees(merkle_tree(old_resources), merkle_tree(new_resources)):
+        if len(change.path) < 2:
+            continue                # ressource ajoutée ou retirée
+        name, section = change.path[0], change.path[1]
+        if section == "Properties" and len(change.path) == 2:
+            props = {(prop, True) for prop in (change.old or {}).keys() | (change.new or {}).keys()}
+        elif section == "Properties":
+            props = {(change.path[2], True)}
+        else:
+            props = {(section, False)}      # Type, Metadata, DependsOn, DeletionPolicy...
+        changed.setdefault(name, set()).update(props)
+    return changed
+
+
+def _resource_change(name, body, props, replaced, latency):
+    kind = body.get("Type", "")
+    reasons = []
+    for prop, is_property in sorted(props):
+        if is_property:
+            reasons.append((prop, property_behavior(kind, prop), "valeur modifiée"))
+        elif prop == "Type":
+            reasons.append((prop, "Immutable", "type modifié"))
+        else:
+            reasons.append((prop, "Mutable", "attribut de ressource"))
+    # Une référence à une ressource remplacée change de valeur (nouvel identifiant physique)
+    for prop, value in (body.get("Properties") or {}).items():
+        if (prop, True) in props:
+            continue
+        cited = sorted({target for target, _ in references(value) if target in replaced})
+        if cited:
+            behavior = property_behavior(kind, prop)
+            if behavior == "Immutable" and all(replaced[target] == "conditional" for target in cited):
+                behavior = "Conditional"
+            reasons.append((prop, behavior, f"{', '.join(cited)} remplacée(s)"))
+    if not reasons:
+        return None
+    action = max((_ACTION_OF[behavior] for _, behavior, _ in reasons), key=_ACTIONS.index)
+    seconds = latency.get(kind, DEFAULT_LATENCY)
+    if action == "update":
+        seconds = min(seconds, IN_PLACE_SECONDS)
+    return ResourceChange(name, kind, action, tuple(reasons), seconds)
+
+
+def forecast(old, new, parameters=None, latency=None):
+    """Forecast du passage de ``old`` à ``new`` (templates troposphere ou dict)."""
+    latency = dict(LATENCY, **(latency or {}))
+    old_resources = canonical(old, parameters).get("Resources", {})
+    new_resources = canonical(new, parameters).get("Resources", {})
+    changed = _changed_properties(old_resources, new_resources)
+
+    new_graph = DeployGraph({"Resources": new_resources}, latency)
+    changes, replaced = [], {}
+    for name in new_graph.order:
+        body = new_resources[name]
+        if name not in old_resources:
+            change = ResourceChange(name, body.get("Type", ""), "create",
+                                    seconds=latency.get(body.get("Type", ""), DEFAULT_LATENCY))
+        else:
+            change = _resource_change(name, body, changed.get(name, ()), replaced, latency)
+        if change is None:
+            continue
+        if change.replaced:
+            replaced[name] = change.action
+        changes.append(change)
+    deleted = [ResourceChange(name, body.get("Type", ""), "delete",
+                              seconds=latency.get(body.get("Type", ""), DEFAULT_LATENCY))
+               for name, body in old_resources.items() if name not in new_resources]
+
+    # Mise à jour : chemin le plus long du nouveau graphe, ressources inchangées comptées 0 s
+    durations = {change.name: change.seconds for change in changes}
+    new_graph.latency = {name: durations.get(name, 0.0) for name in new_graph.order}
+    update_seconds, path = new_graph.critical_path()
+    # Nettoyage : anciennes ressources supprimées (retirées ou remplacées), dépendantes d'abord
+    old_graph = DeployGraph({"Resources": old_resources}, latency)
+    removed = {change.name for change in deleted} | replaced.keys()
+    old_graph.latency = {name: old_graph.latency[name] if name in removed else 0.0 for name in old_graph.order}
+    cleanup_seconds, _ = old_graph.critical_path()
+    return Forecast(changes + deleted, update_seconds, cleanup_seconds,
+                    [name for name, _ in path if durations.get(name)])
+
+
+def format_forecast(title, result):
+    counts = result.by_action()
+    lines = [f"{title} : " + ", ".join(f"{LABELS[action]} {count}" for action, count in counts.items() if count),
+             f"  durée estimée : {result.update_seconds:.0f} s de mise à jour + "
+             f"{result.cleanup_seconds:.0f} s de nettoyage"]
+    if result.critical_path:
+        lines.append(f"  chemin critique : {' → '.join(result.critical_path)}")
+    if not result.changes:
+        lines[0] = f"{title} : aucun changement"
+    for change in result.changes:
+        lines.append(f"{_SIGNS[change.action]} {change.name} ({change.kind}) : {LABELS[change.action]}, "
+                     f"{change.seconds:.0f} s")
+        for prop, behavior, cause in change.reasons:
+            lines.append(f"      {prop} : {behavior} ({cause})")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from tp4.rules import load_template, preset_template
+
+    parser = argparse.ArgumentParser(description="Prévision d'un change set : mise à jour ou remplacement")
+    parser.add_argument("old", help="preset (q1, q3_1, ...) ou fichier JSON/YAML déployé")
+    parser.add_argument("new", help="preset ou fichier JSON/YAML à déployer")
+    parser.add_argument("--param", action="append", default=[], metavar="NOM=VALEUR",
+                        help="valeur d'un paramètre (remplace Default)")
+    parser.add_argument("--latency", nargs="+", default=[], metavar="TYPE=SECONDES",
+                        help="durée d'un type de ressource, ex. AWS::EC2::NatGateway=90")
+    parser.add_argument("--fail-on-replacement", type=float, default=None, metavar="SECONDES",
+                        help="code de retour 1 si un remplacement (même possible) dure au moins SECONDES")
+    parser.add_argument("--json", action="store_true", help="prévision en JSON")
+    args = parser.parse_args(argv)
+    parameters = dict(item.partition("=")[::2] for item in args.param)
+    latency = {kind: float(seconds) for kind, _, seconds in (item.partition("=") for item in args.latency)}
+
+    templates = []
+    for name in (args.old, args.new):
+        template = preset_template(name)
+        templates.append(template if template is not None else load_template(name))
+    result = forecast(*templates, parameters=parameters, latency=latency)
+
+    if args.json:
+        print(json.dumps({
+            "update_seconds": result.update_seconds,
+            "cleanup_seconds": result.cleanup_seconds,
+            "critical_path": result.critical_path,
+            "changes": [{"resource": change.name, "type": change.kind, "action": change.action,
+                         "seconds": change.seconds,
+                         "reasons": [dict(zip(("property", "behavior", "cause"), reason)) for reason in change.reasons]}
+                        for change in result.changes],
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(format_forecast(f"{args.old} → {args.new}", result))
+    if args.fail_on_replacement is not None:
+        slow = result.slow_replacements(args.fail_on_replacement)
+        for change in slow:
+            print(f"remplacement lent : {change.name} ({change.kind}), {change.seconds:.0f} s")
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,202 @@
+"""Allocation indexée de blocs CIDR IPv4.
+
+Le bloc de départ (par exemple le CidrBlock du VPC, ou 10.0.0.0/8 pour une flotte
+de VPC) est vu comme un arbre binaire implicite : chaque nœud est un préfixe et
+ses deux enfants sont ses deux moitiés. On ne stocke que les nœuds touchés :
+
+- ``_allocated`` : blocs réservés, avec leur étiquette ;
+- ``_best`` : pour chaque ancêtre d'un bloc réservé, le plus grand bloc encore
+  libre sous lui (sous la forme de la plus petite longueur de préfixe).
+
+Tester un chevauchement, réserver, libérer ou trouver le premier bloc libre d'une
+taille donnée coûte O(profondeur) ≤ 32 opérations, quel que soit le nombre de
+sous-réseaux déjà alloués : pas de comparaison deux à deux.
+"""
+import ipaddress
+
+_FULL = 33   # plus grand que toute longueur de préfixe IPv4 : « aucun bloc libre »
+
+
+class CidrAllocator:
+    """Allocateur de sous-blocs d'un réseau IPv4."""
+
+    def __init__(self, cidr):
+        network = ipaddress.IPv4Network(cidr)
+        self.network = network
+        self._root = (int(network.network_address), network.prefixlen)
+        self._allocated = {}
+        self._best = {}
+
+    def __len__(self):
+        return len(self._allocated)
+
+    def allocations(self):
+        """Blocs réservés, triés par adresse : liste de couples (cidr, étiquette)."""
+        return [(_to_cidr(node), label) for node, label in sorted(self._allocated.items())]
+
+    # ------------------------------------------------------------------
+    # ------- Requêtes ---------------------------------------------------
+    # ------------------------------------------------------------------
+    def overlaps(self, cidr):
+        """Vrai si ``cidr`` chevauche un bloc déjà réservé."""
+        return self._conflict(self._node(cidr)) is not None
+
+    def find_overlap(self, cidr):
+        """Le bloc réservé qui chevauche ``cidr`` (ancêtre ou descendant), ou None."""
+        conflict = self._conflict(self._node(cidr))
+        return None if conflict is None else _to_cidr(conflict)
+
+    def _conflict(self, node):
+        network, prefixlen = node
+        # Un ancêtre (ou le bloc lui-même) est réservé ?
+        for length in range(self._root[1], prefixlen + 1):
+            ancestor = (network & _mask(length), length)
+            if ancestor in self._allocated:
+                return ancestor
+        # Un descendant est réservé ? Alors le nœud a été touché.
+        if node in self._best:
+            return self._first_allocated_under(node)
+        return None
+
+    def _first_allocated_under(self, node):
+        while node not in self._allocated:
+            left, right = _children(node)
+            node = left if left in self._best or left in self._allocated else right
+        return node
+
+    # ------------------------------------------------------------------
+    # ------- Réservation et libération ----------------------------------
+    # ------------------------------------------------------------------
+    def reserve(self, cidr, label=None):
+        """Réserve exactement ``cidr`` ; ValueError s'il sort du réseau ou chevauche un bloc."""
+        node = self._node(cidr)
+        conflict = self._conflict(node)
+        if conflict is not None:
+            raise ValueError(f"{cidr} chevauche {_to_cidr(conflict)} ({self._allocated[conflict]})")
+        self._allocated[node] = label
+        self._update_ancestors(node)
+        return str(_to_cidr(node))
+
+    def allocate(self, prefixlen, label=None, within=None):
+        """Réserve le premier bloc libre de longueur ``prefixlen`` (dans ``within`` si fourni)."""
+        start = self._node(within) if within is not None else self._root
+        if prefixlen < start[1] or prefixlen > 32:
+            raise ValueError(f"/{prefixlen} ne peut pas être découpé dans {_to_cidr(start)}")
+        # Les ancêtres de ``within`` ne doivent pas déjà être réservés
+        for length in range(self._root[1], start[1]):
+            if (start[0] & _mask(length), length) in self._allocated:
+                raise ValueError(f"aucun bloc /{prefixlen} libre dans {_to_cidr(start)}")
+        if self._best_of(start) > prefixlen:
+            raise ValueError(f"aucun bloc /{prefixlen} libre dans {_to_cidr(start)}")
+
+        # Descente guidée par _best : on prend toujours la moitié basse si elle suffit
+        node = start
+        while node[1] < prefixlen:
+            left, right = _children(node)
+            node = left if self._best_of(left) <= prefixlen else right
+        self._allocated[node] = label
+        self._update_ancestors(node)
+        return str(_to_cidr(node))
+
+    def release(self, cidr):
+        """Libère un bloc précédemment réservé."""
+        node = self._node(cidr)
+        if node not in self._allocated:
+            raise KeyError(cidr)
+        del self._allocated[node]
+        self._update_ancestors(node)
+
+    def _best_of(self, node):
+        if node in self._allocated:
+            return _FULL
+        return self._best.get(node, node[1])
+
+    def _update_ancestors(self, node):
+        network, prefixlen = node
+        for length in range(prefixlen - 1, self._root[1] - 1, -1):
+            parent = (network & _mask(length), length)
+            left, right = _children(parent)
+            best = min(self._best_of(left), self._best_of(right))
+            if all(child not in self._best and child not in self._allocated for child in (left, right)):
+                # Les deux moitiés sont entièrement libres : le parent redevient intact
+                self._best.pop(parent, None)
+            else:
+                self._best[parent] = best
+
+    def _node(self, cidr):
+        network = ipaddress.IPv4Network(cidr)
+        if not network.subnet_of(self.network):
+            raise ValueError(f"{cidr} n'est pas inclus dans {self.network}")
+        return int(network.network_address), network.prefixlen
+
+
+def _mask(length):
+    return (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+
+
+def _children(node):
+    network, prefixlen = node
+    return (network, prefixlen + 1), (network | (1 << (31 - prefixlen)), prefixlen + 1)
+
+
+def _to_cidr(node):
+    return ipaddress.IPv4Network(node)
+
+
+def _bits(count):
+    # Nombre de bits nécessaires pour numéroter ``count`` blocs
+    return max(1, (count - 1).bit_length())
+
+
+def plan_subnets(vpc_cidr, az_count, tiers=("public", "private"), subnet_prefix=24,
+                 max_azs=8, max_tiers=None):
+    """Découpe ``vpc_cidr`` en ``len(tiers)`` × ``az_count`` sous-réseaux.
+
+    Le VPC est d'abord coupé en un bloc par tier (de quoi loger ``max_tiers``
+    tiers), puis chaque bloc de tier en un bloc par AZ (de quoi loger ``max_azs``
+    AZ). Chaque sous-réseau prend le début de son bloc d'AZ : le reste du bloc est
+    réservé à la croissance du même tier dans la même AZ (voir SubnetLayout.grow()).
+
+    Avec les valeurs par défaut, 10.0.0.0/16 et 2 AZ donnent le découpage de la Q1 :
+    public 10.0.0.0/24 et 10.0.16.0/24, privé 10.0.128.0/24 et 10.0.144.0/24.
+    """
+    return SubnetLayout(vpc_cidr, az_count, tiers, subnet_prefix, max_azs, max_tiers)
+
+
+class SubnetLayout:
+    """Découpage d'un VPC en blocs tier × AZ ; voir plan_subnets()."""
+
+    def __init__(self, vpc_cidr, az_count, tiers, subnet_prefix, max_azs, max_tiers):
+        if az_count > max_azs:
+            raise ValueError(f"{az_count} AZ demandées pour {max_azs} blocs d'AZ réservés")
+        self.allocator = CidrAllocator(vpc_cidr)
+        vpc_prefix = self.allocator.network.prefixlen
+        tier_prefix = vpc_prefix + _bits(max_tiers or len(tiers))
+        az_prefix = tier_prefix + _bits(max_azs)
+        if subnet_prefix < az_prefix:
+            raise ValueError(f"/{subnet_prefix} ne tient pas dans un bloc d'AZ /{az_prefix}")
+
+        self.tiers = tuple(tiers)
+        self.blocks = {}      # (tier, index d'AZ) -> bloc réservé à ce tier dans cette AZ
+        self.subnets = {}     # (tier, index d'AZ) -> liste des sous-réseaux alloués
+        tier_blocks = list(self.allocator.network.subnets(new_prefix=tier_prefix))
+        if len(tiers) > len(tier_blocks):
+            raise ValueError(f"{vpc_cidr} ne peut pas contenir {len(tiers)} tiers")
+        for tier, tier_block in zip(tiers, tier_blocks):
+            az_blocks = tier_block.subnets(new_prefix=az_prefix)
+            for az_index, az_block in zip(range(az_count), az_blocks):
+                self.blocks[tier, az_index] = az_block
+                self.subnets[tier, az_index] = []
+                self.grow(tier, az_index, subnet_prefix)
+
+    def grow(self, tier, az_index, prefixlen=24):
+        """Alloue un sous-réseau de plus pour ``tier`` dans l'AZ ``az_index``."""
+        cidr = self.allocator.allocate(prefixlen, label=f"{tier}-az{az_index + 1}",
+                                       within=self.blocks[tier, az_index])
+        self.subnets[tier, az_index].append(cidr)
+        return cidr
+
+    def cidrs(self, tier):
+        """Premier sous-réseau de ``tier`` dans chaque AZ, dans l'ordre des AZ."""
+        az_count = sum(1 for key in self.blocks if key[0] == tier)
+        return tuple(self.subnets[tier, index][0] for index in range(az_count))
@@ -0,0 +1,72 @@
+"""Point d'entrée unique : ``python -m tp4 <cible>... | scan ...``.
+
+Les cibles produisent les templates des questions dans un seul processus, avec
+le même cache que les scripts d'Exercice/ :
+
+    vpc          vpc_Q1.yaml         (Q1)
+    bucket       bucket_python.json  (Q2)
+    flowlogs     vpc-Q3_1.yaml       (Q3.1)
+    compute      vpc-Q3_2.yaml       (Q3.2)
+    replication  Q3_3.json           (Q3.3)
+
+Chaque générateur n'est importé que pour sa cible, et troposphere n'est pas
+importé du tout si le fichier est déjà à jour dans le cache : la commande est
+assez rapide au démarrage pour un hook pre-commit (voir ``python -m tp4.bench
+startup``, mesuré avec ``-X importtime``).
+
+    python -m tp4 vpc bucket replication -C build/
+    python -m tp4 all
+    python -m tp4 scan q1 q3_3 --severity HIGH CRITICAL
+"""
+import argparse
+import importlib
+import os
+import sys
+
+# cible : (fichier produit, module du générateur, spec, fonction de construction)
+TARGETS = {
+    "vpc": ("vpc_Q1.yaml", "tp4.vpc", "Q1_SPEC", "build_vpc_template"),
+    "bucket": ("bucket_python.json", "tp4.s3", "Q2_SPEC", "build_bucket_template"),
+    "flowlogs": ("vpc-Q3_1.yaml", "tp4.vpc", "Q3_1_SPEC", "build_vpc_template"),
+    "compute": ("vpc-Q3_2.yaml", "tp4.vpc", "Q3_2_SPEC", "build_vpc_template"),
+    "replication": ("Q3_3.json", "tp4.s3", "Q3_3_SPEC", "build_replication_template"),
+}
+_STATUS = {"hit": "déjà à jour (cache)", "restored": "restauré depuis le cache", "built": "généré"}
+
+
+def generate(target, directory="."):
+    """Écrit le fichier de ``target`` dans ``directory`` ; retourne (chemin, statut du cache)."""
+    from tp4.cache import builder_sources, write_template
+
+    filename, module_name, spec_name, builder_name = TARGETS[target]
+    module = importlib.import_module(module_name)
+    spec, build = getattr(module, spec_name), getattr(module, builder_name)
+    path = os.path.join(directory, filename)
+    return path, write_template(path, lambda: build(spec), spec, sources=builder_sources())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["scan"]:
+        from tp4.rules import main as scan
+
+        return scan(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        prog="python -m tp4", description="Génère les templates du TP4 dans un seul processus",
+        epilog="python -m tp4 scan ... : analyse statique des templates (voir python -m tp4 scan -h)",
+    )
+    parser.add_argument("targets", nargs="+", choices=[*TARGETS, "all"], metavar="cible",
+                        help=f"{', '.join(TARGETS)} ou all")
+    parser.add_argument("-C", "--directory", default=".", help="dossier de sortie")
+    args = parser.parse_args(argv)
+
+    targets = list(TARGETS) if "all" in args.targets else list(dict.fromkeys(args.targets))
+    os.makedirs(args.directory, exist_ok=True)
+    for target in targets:
+        try:
+            path, status = generate(target, args.directory)
+        except ValueError as error:     # template hors des limites d'une pile, voir tp4.split
+            parser.error(f"{target} : {error}")
+        print(f"{path} : {_STATUS[status]}")
+    return 0
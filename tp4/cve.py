@@ -0,0 +1,113 @@
+"""Résumé cve.json dérivé du rapport du scanner, en un seul passage en flux.
+
+Exercice/Q4/4.2/cve.json répète une entrée {Description, CVSSv3, Severity}
+par résultat : le texte « block public ACLs » revient une fois par bucket.
+Ici chaque entrée distincte n'apparaît qu'une fois, avec son nombre
+d'occurrences et les cibles (fichiers) qui la contiennent. Le rapport est lu
+avec tp4.report, donc la mémoire dépend du nombre d'entrées distinctes (borné
+par le nombre de règles) et de ``max_targets``, pas du nombre de résultats.
+
+    python -m tp4.cve Exercice/Q4/4.2/tp4_vulnerabilities.json -o cve_summary.json
+
+``--expand`` produit au contraire une entrée par résultat, c'est-à-dire le
+fichier cve.json d'origine, octet pour octet.
+"""
+import argparse
+import hashlib
+import json
+import sys
+
+from tp4.report import iter_misconfigurations
+
+MAX_TARGETS = 100
+
+
+def _cvss_v3(finding):
+    # Les misconfigurations n'ont pas de score ; les vulnérabilités ont CVSS.<source>.V3Vector
+    for source in (finding.get("CVSS") or {}).values():
+        if source.get("V3Vector"):
+            return source["V3Vector"]
+    return ""
+
+
+def _entry(finding):
+    return {"Description": finding.get("Description", ""), "CVSSv3": _cvss_v3(finding),
+            "Severity": finding.get("Severity", "")}
+
+
+def _key(entry):
+    # Empreinte de taille fixe : le dictionnaire de déduplication ne garde pas les textes en double
+    text = "\0".join((entry["Description"], entry["CVSSv3"], entry["Severity"]))
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def summarize(findings, max_targets=MAX_TARGETS):
+    """Entrées distinctes (ordre de première apparition) avec Occurrences et Targets.
+
+    ``findings`` : couples (cible, misconfiguration). Au-delà de ``max_targets``
+    cibles, les occurrences dans les autres cibles sont seulement comptées
+    (OtherOccurrences) ; Occurrences reste exact.
+    """
+    summary = {}
+    for target, finding in findings:
+        entry = _entry(finding)
+        key = _key(entry)
+        found = summary.get(key)
+        if found is None:
+            found = summary[key] = dict(entry, AVDID=finding.get("AVDID") or finding.get("ID", ""),
+                                        Occurrences=0, Targets={}, OtherOccurrences=0)
+        found["Occurrences"] += 1
+        targets = found["Targets"]
+        if target in targets:
+            targets[target] += 1
+        elif len(targets) < max_targets:
+            targets[target] = 1
+        else:
+            found["OtherOccurrences"] += 1
+    return list(summary.values())
+
+
+def expand(findings):
+    """Une entrée {Description, CVSSv3, Severity} par résultat, comme cve.json."""
+    for _, finding in findings:
+        yield _entry(finding)
+
+
+def report_findings(path):
+    """(cible, misconfiguration) pour chaque résultat du rapport, en flux."""
+    for target, _, finding in iter_misconfigurations(path):
+        yield target, finding
+
+
+def _write_list(entries, file):
+    # Écriture entrée par entrée, même mise en forme que json.dump(..., indent=2)
+    file.write("[")
+    first = True
+    for entry in entries:
+        text = json.dumps(entry, indent=2, ensure_ascii=False)
+        file.write(("\n" if first else ",\n") + "  " + text.replace("\n", "\n  "))
+        first = False
+    file.write("\n]\n" if not first else "]\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Résumé dédupliqué (cve.json) d'un rapport du scanner")
+    parser.add_argument("report")
+    parser.add_argument("-o", "--output", default=None, help="fichier de sortie (stdout par défaut)")
+    parser.add_argument("--expand", action="store_true",
+                        help="une entrée par résultat, sans déduplication (format cve.json d'origine)")
+    parser.add_argument("--max-targets", type=int, default=MAX_TARGETS,
+                        help="nombre de cibles gardées par entrée")
+    args = parser.parse_args(argv)
+
+    findings = report_findings(args.report)
+    entries = expand(findings) if args.expand else summarize(findings, args.max_targets)
+    if args.output is None:
+        _write_list(entries, sys.stdout)
+        return
+    with open(args.output, "w", encoding="utf-8") as file:
+        _write_list(entries, file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Différence entre deux rapports du scanner : résultats nouveaux, corrigés, inchangés.
+
+Chaque résultat est identifié par AVDID + Target + CauseMetadata.Resource et
+une empreinte du code en cause (lignes sans indentation ni lignes vides), pas
+par ses numéros de ligne : régénérer un template qui décale les ressources ne
+crée ni « nouveau » ni « corrigé ». Les résultats restés sans partenaire sont
+ensuite rapprochés par ressource logique (première ligne du code, ex.
+``Q3Trail``), ce qui couvre une ressource modifiée mais toujours en défaut.
+
+Les deux rapports sont lus en flux (tp4.report) et joints par hachage, en O(n) :
+
+    python -m tp4.delta ancien.json nouveau.json --fail-on HIGH
+"""
+import argparse
+import hashlib
+import json
+import re
+
+from tp4.report import iter_misconfigurations
+
+SEVERITIES = ("UNKNOWN", "LOW", "MEDIUM", "HIGH", "CRITICAL")
+_LINES = re.compile(r":\d+(-\d+)?$")
+_LOGICAL_ID = re.compile(r'^\s*"?([A-Za-z0-9]+)"?\s*:\s*\{?\s*$')
+
+
+def _code(cause):
+    return [line.get("Content", "") for line in (cause.get("Code") or {}).get("Lines") or []]
+
+
+def _fingerprint(lines):
+    text = "\n".join(stripped for stripped in (line.strip() for line in lines) if stripped)
+    return hashlib.blake2b(text.encode(), digest_size=12).digest()
+
+
+def _anchor(lines):
+    # Nom logique de la ressource si le code en cause commence par sa déclaration
+    match = _LOGICAL_ID.match(lines[0]) if lines else None
+    return match.group(1) if match else None
+
+
+def finding_keys(path):
+    """(clé exacte, clé de repli, résumé) pour chaque résultat du rapport, en flux."""
+    for target, _, finding in iter_misconfigurations(path):
+        cause = finding.get("CauseMetadata") or {}
+        avdid = finding.get("AVDID") or finding.get("ID", "")
+        lines = _code(cause)
+        resource = _LINES.sub("", cause.get("Resource", ""))
+        anchor = _anchor(lines)
+        summary = (avdid, finding.get("Severity", "UNKNOWN"), target, anchor or cause.get("Resource", ""),
+                   cause.get("StartLine", 0), cause.get("EndLine", 0), finding.get("Title", ""))
+        exact = (avdid, target, resource, _fingerprint(lines))
+        fallback = (avdid, target, anchor) if anchor else None
+        yield exact, fallback, summary
+
+
+def diff_reports(old_path, new_path):
+    """{"new": [...], "fixed": [...], "unchanged": n, "moved": n} entre deux rapports.
+
+    Les résumés sont des tuples (AVDID, sévérité, cible, ressource, début, fin,
+    titre) ; « moved » compte les résultats inchangés rapprochés par ressource
+    logique plutôt que par empreinte.
+    """
+    previous = {}
+    for exact, fallback, summary in finding_keys(old_path):
+        previous.setdefault(exact, []).append((fallback, summary))
+
+    unchanged, unmatched = 0, []
+    for exact, fallback, summary in finding_keys(new_path):
+        candidates = previous.get(exact)
+        if candidates:
+            candidates.pop()
+            unchanged += 1
+        else:
+            unmatched.append((fallback, summary))
+
+    # Repli : même règle, même cible, même ressource logique, code différent
+    remaining = {}
+    for candidates in previous.values():
+        for fallback, summary in candidates:
+            remaining.setdefault(fallback, []).append(summary)
+    new, moved = [], 0
+    for fallback, summary in unmatched:
+        candidates = remaining.get(fallback) if fallback is not None else None
+        if candidates:
+            candidates.pop()
+            moved += 1
+        else:
+            new.append(summary)
+    fixed = [summary for summaries in remaining.values() for summary in summaries]
+    return {"new": new, "fixed": fixed, "unchanged": unchanged + moved, "moved": moved}
+
+
+def gate(delta, fail_on):
+    """Vrai si un nouveau résultat atteint la sévérité ``fail_on``."""
+    level = SEVERITIES.index(fail_on)
+    return any(SEVERITIES.index(summary[1]) >= level for summary in delta["new"] if summary[1] in SEVERITIES)
+
+
+def format_delta(delta):
+    lines = [f"Nouveaux : {len(delta['new'])}, corrigés : {len(delta['fixed'])}, "
+             f"inchangés : {delta['unchanged']} (dont {delta['moved']} déplacés)"]
+    for sign, key in (("+", "new"), ("-", "fixed")):
+        for avdid, severity, target, resource, start, end, title in delta[key]:
+            lines.append(f"{sign} {avdid} ({severity}) {target}:{start}-{end} {resource} — {title}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Différence entre deux rapports JSON du scanner")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--fail-on", choices=SEVERITIES, default=None,
+                        help="code de retour 1 si un nouveau résultat atteint cette sévérité")
+    parser.add_argument("--json", action="store_true", help="rapport de différence en JSON")
+    args = parser.parse_args(argv)
+
+    delta = diff_reports(args.old, args.new)
+    if args.json:
+        fields = ("AVDID", "Severity", "Target", "Resource", "StartLine", "EndLine", "Title")
+        output = dict(delta)
+        for key in ("new", "fixed"):
+            output[key] = [dict(zip(fields, summary)) for summary in delta[key]]
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+    else:
+        print(format_delta(delta))
+    return 1 if args.fail_on and gate(delta, args.fail_on) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,324 @@
+"""Déploiement local des piles du TP contre un émulateur AWS (moto en mode serveur).
+
+Sans compte AWS, les cinq piles (vpc_Q1.yaml, bucket_python.json, vpc-Q3_1.yaml,
+vpc-Q3_2.yaml, Q3_3.json) sont créées sur un serveur moto : lancé dans le
+processus (``--port``) ou déjà démarré ailleurs (``--endpoint``). Les
+create_stack partent en parallèle depuis un pool de threads. Ensuite, une seule
+boucle de suivi interroge l'état de toutes les piles en un appel
+describe_stacks par tour. Les événements ne sont lus que pour les piles encore
+en cours, et l'intervalle double tant que rien ne bouge (plafonné, avec gigue).
+Les durées par ressource viennent des horodatages des événements. Les durées
+par pile sont mesurées côté client.
+
+    python -m tp4.deploy                                # les cinq presets
+    python -m tp4.deploy vpc_Q1.yaml Q3_3.json -o timings.json
+    python -m tp4.deploy --baseline timings.json --tolerance 0.25
+
+Avec ``--baseline``, le code de retour vaut 1 si une pile ou le débit global
+(ressources/s) se dégrade au-delà de la tolérance.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+PRESETS = ("q1", "q2", "q3_1", "q3_2", "q3_3")
+REGION = "us-east-1"
+CAPABILITIES = ["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"]
+
+
+@dataclass
+class ResourceTiming:
+    """Création d'une ressource, d'après ses événements CloudFormation."""
+    logical_id: str
+    resource_type: str
+    status: str = ""
+    started: object = None          # datetime de CREATE_IN_PROGRESS
+    ended: object = None            # datetime de CREATE_COMPLETE / CREATE_FAILED
+    reason: str = ""
+
+    @property
+    def seconds(self):
+        if self.started is None or self.ended is None:
+            return None
+        return (self.ended - self.started).total_seconds()
+
+
+@dataclass
+class StackRun:
+    """Suivi d'une pile : soumission, état, événements déjà lus et durées."""
+    name: str
+    source: str
+    body: str
+    stack_id: str = None
+    status: str = "PENDING"
+    submitted: float = 0.0
+    finished: float = None
+    error: str = ""
+    last_event: str = None
+    resources: dict = field(default_factory=dict)
+
+    @property
+    def seconds(self):
+        return None if self.finished is None else self.finished - self.submitted
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+
+# ----------------------------------------------------------------------
+# ------- Client et émulateur ------------------------------------------
+# ----------------------------------------------------------------------
+def make_client(endpoint, region=REGION):
+    """Client CloudFormation boto3 vers ``endpoint``, avec relances adaptatives."""
+    try:
+        import boto3
+        from botocore.config import Config
+    except ImportError as error:
+        raise RuntimeError("le déploiement local nécessite boto3 (pip install boto3)") from error
+
+    # moto accepte n'importe quels identifiants ; on n'utilise jamais ceux du poste
+    return boto3.session.Session().client(
+        "cloudformation", endpoint_url=endpoint, region_name=region,
+        aws_access_key_id="testing", aws_secret_access_key="testing",
+        config=Config(retries={"max_attempts": 10, "mode": "adaptive"}, max_pool_connections=32),
+    )
+
+
+def start_emulator(port, host="127.0.0.1"):
+    """Démarre un serveur moto dans un thread ; retourne (serveur, URL)."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as error:
+        raise RuntimeError("l'émulateur nécessite moto[server] (pip install 'moto[server]')") from error
+
+    server = ThreadedMotoServer(ip_address=host, port=port, verbose=False)
+    server.start()
+    return server, f"http://{host}:{port}"
+
+
+# ----------------------------------------------------------------------
+# ------- Soumission et suivi ------------------------------------------
+# ----------------------------------------------------------------------
+def stack_sources(names):
+    """StackRun à soumettre : presets (q1, q2, ...) ou fichiers JSON/YAML."""
+    from tp4.rules import preset_template
+
+    runs = []
+    for name in names:
+        template = preset_template(name)
+        if template is not None:
+            body = template.to_json()
+        else:
+            with open(name) as file:
+                body = file.read()
+            name = os.path.splitext(os.path.basename(name))[0]
+        # Nom de pile CloudFormation : lettres, chiffres et tirets
+        stack = "tp4-" + "".join(c if c.isalnum() else "-" for c in name)
+        runs.append(StackRun(stack, name, body))
+    return runs
+
+
+def _submit(client, run):
+    run.submitted = time.monotonic()
+    try:
+        run.stack_id = client.create_stack(StackName=run.name, TemplateBody=run.body,
+                                           Capabilities=CAPABILITIES)["StackId"]
+        run.status = "CREATE_IN_PROGRESS"
+    except Exception as error:          # ClientError, validation du template, connexion
+        run.status, run.error, run.finished = "SUBMIT_FAILED", str(error), time.monotonic()
+    return run
+
+
+def _statuses(client):
+    # Un seul appel paginé pour l'état de toutes les piles
+    statuses, token = {}, None
+    while True:
+        page = client.describe_stacks(**({"NextToken": token} if token else {}))
+        for stack in page["Stacks"]:
+            statuses[stack["StackId"]] = (stack["StackStatus"], stack.get("StackStatusReason", ""))
+        token = page.get("NextToken")
+        if not token:
+            return statuses
+
+
+def _read_events(client, run):
+    # Événements postérieurs au dernier lu (l'API les rend du plus récent au plus ancien)
+    fresh, token = [], None
+    while True:
+        page = client.describe_stack_events(StackName=run.stack_id, **({"NextToken": token} if token else {}))
+        for event in page["StackEvents"]:
+            if event["EventId"] == run.last_event:
+                token = None
+                break
+            fresh.append(event)
+        else:
+            token = page.get("NextToken")
+        if not token:
+            break
+    if fresh:
+        run.last_event = fresh[0]["EventId"]
+    for event in reversed(fresh):
+        logical_id = event["LogicalResourceId"]
+        if event.get("ResourceType") == "AWS::CloudFormation::Stack" and logical_id == run.name:
+            continue
+        timing = run.resources.setdefault(logical_id, ResourceTiming(logical_id, event.get("ResourceType", "")))
+        status = event["ResourceStatus"]
+        timing.status = status
+        if status == "CREATE_IN_PROGRESS" and timing.started is None:
+            timing.started = event["Timestamp"]
+        elif status in ("CREATE_COMPLETE", "CREATE_FAILED"):
+            timing.ended = event["Timestamp"]
+            timing.reason = event.get("ResourceStatusReason", "") or ""
+    return bool(fresh)
+
+
+def wait(client, runs, min_delay=0.2, max_delay=5.0, timeout=900):
+    """Suit les piles soumises jusqu'à un état final (ou ``timeout`` secondes).
+
+    Retourne le nombre de tours de suivi effectués.
+    """
+    pending = [run for run in runs if not run.done]
+    delay, rounds, deadline = min_delay, 0, time.monotonic() + timeout
+    while pending:
+        if time.monotonic() > deadline:
+            for run in pending:
+                run.status, run.error, run.finished = "TIMEOUT", f"pas d'état final après {timeout} s", time.monotonic()
+            break
+        time.sleep(random.uniform(delay / 2, delay))
+        rounds += 1
+        statuses = _statuses(client)
+        progressed = False
+        for run in pending:
+            progressed |= _read_events(client, run)
+            status, reason = statuses.get(run.stack_id, (run.status, ""))
+            progressed |= status != run.status
+            run.status = status
+            if not status.endswith("_IN_PROGRESS"):
+                run.finished, run.error = time.monotonic(), reason or ""
+        pending = [run for run in pending if not run.done]
+        # Rien de nouveau : on espace les appels ; sinon on revient au pas minimal
+        delay = min_delay if progressed else min(max_delay, delay * 2)
+    return rounds
+
+
+def deploy(client, runs, workers=None, cleanup=True, **wait_options):
+    """Soumet ``runs`` en parallèle, attend leur fin et retourne le rapport de durées."""
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers or len(runs) or 1) as pool:
+        list(pool.map(lambda run: _submit(client, run), runs))
+    rounds = wait(client, runs, **wait_options)
+    seconds = time.monotonic() - start
+    if cleanup:
+        for run in runs:
+            if run.stack_id:
+                client.delete_stack(StackName=run.stack_id)
+    return timings(runs, seconds, rounds)
+
+
+# ----------------------------------------------------------------------
+# ------- Durées et comparaison ----------------------------------------
+# ----------------------------------------------------------------------
+def timings(runs, seconds, rounds=0):
+    """Rapport JSON-sérialisable : durées par pile et par ressource, débit global."""
+    created = sum(1 for run in runs for timing in run.resources.values() if timing.status == "CREATE_COMPLETE")
+    return {
+        "seconds": round(seconds, 3),
+        "polls": rounds,
+        "resources_per_sec": round(created / seconds, 3) if seconds else None,
+        "stacks": {
+            run.source: {
+                "stack": run.name,
+                "status": run.status,
+                "seconds": None if run.seconds is None else round(run.seconds, 3),
+                "error": run.error,
+                "resources": {
+                    timing.logical_id: {"type": timing.resource_type, "status": timing.status,
+                                        "seconds": timing.seconds, "reason": timing.reason}
+                    for timing in run.resources.values()
+                },
+            }
+            for run in runs
+        },
+    }
+
+
+def regressions(report, baseline, tolerance=0.25):
+    """Messages pour chaque pile plus lente (ou débit plus faible) que ``baseline`` au-delà de ``tolerance``."""
+    messages = []
+    for source, stack in report["stacks"].items():
+        before = baseline.get("stacks", {}).get(source)
+        if not before or before.get("seconds") is None:
+            continue
+        if stack["status"] != "CREATE_COMPLETE":
+            messages.append(f"{source} : {stack['status']} (référence {before['status']})")
+        elif stack["seconds"] > before["seconds"] * (1 + tolerance):
+            messages.append(f"{source} : {stack['seconds']:.2f} s contre {before['seconds']:.2f} s")
+    rate, previous = report.get("resources_per_sec"), baseline.get("resources_per_sec")
+    if rate is not None and previous and rate < previous * (1 - tolerance):
+        messages.append(f"débit : {rate:.1f} ressources/s contre {previous:.1f}")
+    return messages
+
+
+def format_timings(report, slowest=3):
+    lines = [f"{len(report['stacks'])} pile(s) en {report['seconds']:.2f} s, "
+             f"{report['resources_per_sec']} ressources/s, {report['polls']} tour(s) de suivi"]
+    for source, stack in report["stacks"].items():
+        seconds = "-" if stack["seconds"] is None else f"{stack['seconds']:.2f} s"
+        lines.append(f"  {source:<12} {stack['status']:<20} {seconds:>9}  {len(stack['resources'])} ressources")
+        if stack["error"]:
+            lines.append(f"    {stack['error']}")
+        timed = [(values["seconds"], name) for name, values in stack["resources"].items()
+                 if values["seconds"] is not None]
+        for seconds, name in sorted(timed, reverse=True)[:slowest]:
+            lines.append(f"    {name} : {seconds:.2f} s")
+        for name, values in stack["resources"].items():
+            if values["status"] == "CREATE_FAILED":
+                lines.append(f"    échec {name} ({values['type']}) : {values['reason']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Déploie les piles du TP sur un émulateur AWS local et mesure les durées")
+    parser.add_argument("templates", nargs="*", default=list(PRESETS),
+                        help="presets (q1, q2, q3_1, q3_2, q3_3) ou fichiers JSON/YAML ; les cinq presets par défaut")
+    parser.add_argument("--endpoint", default=None, help="URL d'un émulateur déjà lancé (ex. http://localhost:5000)")
+    parser.add_argument("--port", type=int, default=5000, help="port du serveur moto lancé dans le processus")
+    parser.add_argument("--workers", type=int, default=None, help="threads de soumission (une par pile par défaut)")
+    parser.add_argument("--max-delay", type=float, default=5.0, help="intervalle de suivi maximal (s)")
+    parser.add_argument("--timeout", type=float, default=900)
+    parser.add_argument("--keep", action="store_true", help="ne supprime pas les piles à la fin")
+    parser.add_argument("-o", "--output", default=None, help="écrit les durées en JSON")
+    parser.add_argument("--baseline", default=None, help="durées JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    runs = stack_sources(args.templates)
+    server, endpoint = (None, args.endpoint) if args.endpoint else start_emulator(args.port)
+    try:
+        report = deploy(make_client(endpoint), runs, args.workers, cleanup=not args.keep,
+                        max_delay=args.max_delay, timeout=args.timeout)
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(format_timings(report))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    failed = any(stack["status"] != "CREATE_COMPLETE" for stack in report["stacks"].values())
+    if args.baseline:
+        with open(args.baseline) as file:
+            messages = regressions(report, json.load(file), args.tolerance)
+        for message in messages:
+            print(f"régression : {message}")
+        failed |= bool(messages)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
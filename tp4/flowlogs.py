@@ -0,0 +1,253 @@
+"""Ingestion en flux des VPC Flow Logs et agrégats par fenêtre de temps.
+
+Le flow log de la Q3.1 (VPCFlowLogRejectedOnly) dépose des fichiers .log.gz au
+format par défaut (version 2) dans le bucket polystudent-q2-tp4. Ici, un dossier
+local tient lieu de bucket :
+
+    AWSLogs/<compte>/vpcflowlogs/<région>/AAAA/MM/JJ/<...>.log.gz
+
+Chaque fichier est décompressé par un worker, lu par paquets de lignes et
+résumé : pour chaque fenêtre de temps, on garde le nombre de paquets rejetés et
+les principales adresses sources, ports de destination et interfaces (ENI).
+Les résumés sont des « Space-Saving » bornés stockés dans des tableaux NumPy :
+la mémoire ne dépend que du nombre de fenêtres et de la capacité des résumés,
+pas du volume de journaux.
+
+    python -m tp4.flowlogs logs/ --window 600 --top 10
+"""
+import argparse
+import gzip
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+# Colonnes du format par défaut (version 2)
+FIELDS = (
+    "version", "account-id", "interface-id", "srcaddr", "dstaddr", "srcport", "dstport",
+    "protocol", "packets", "bytes", "start", "end", "action", "log-status",
+)
+_COLUMN = {name: index for index, name in enumerate(FIELDS)}
+DIMENSIONS = ("srcaddr", "dstport", "interface-id")
+
+
+class TopK:
+    """Résumé Space-Saving fusionnable : les ``capacity`` clés les plus fréquentes.
+
+    Chaque clé gardée a un compte ``counts`` et une erreur ``errors`` : son
+    compte réel est compris entre ``counts - errors`` et ``counts``. Tant que le
+    nombre de clés distinctes reste sous la capacité, les comptes sont exacts.
+    Une fois le résumé plein, une clé absente a un compte réel d'au plus
+    ``floor()`` : c'est ce que reçoit une clé qui entre (ou qui manque d'un côté
+    d'une fusion), en compte comme en erreur.
+    """
+
+    def __init__(self, capacity=256, keys=None, counts=None, errors=None):
+        self.capacity = capacity
+        self.keys = keys if keys is not None else np.array([], dtype=object)
+        self.counts = counts if counts is not None else np.array([], dtype=np.int64)
+        self.errors = errors if errors is not None else np.zeros(len(self.counts), dtype=np.int64)
+
+    def floor(self):
+        """Borne du compte réel d'une clé absente du résumé."""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def add(self, keys, counts=None):
+        """Ajoute des occurrences (``counts`` pondère chaque clé, 1 par défaut)."""
+        keys = np.asarray(keys, dtype=object)
+        counts = np.ones(len(keys), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self._combine(keys, counts, np.zeros(len(keys), dtype=np.int64), 0)
+
+    def merge(self, other):
+        self._combine(other.keys, other.counts, other.errors, other.floor())
+
+    def _combine(self, keys, counts, errors, floor):
+        # Fusion de Space-Saving : une clé absente d'un côté y compte pour la borne de ce côté
+        if not len(keys):
+            return
+        own = len(self.keys)
+        all_keys = np.concatenate([self.keys, keys])
+        # Regroupement vectorisé : np.unique sur les clés, bincount sur les comptes
+        unique, inverse = np.unique(all_keys.astype(str), return_inverse=True)
+        size = len(unique)
+        present = np.zeros(size, dtype=bool), np.zeros(size, dtype=bool)
+        present[0][inverse[:own]] = True
+        present[1][inverse[own:]] = True
+        missing = np.where(present[0], 0, self.floor()) + np.where(present[1], 0, floor)
+        totals = np.bincount(inverse, weights=np.concatenate([self.counts, counts]), minlength=size)
+        totals = totals.astype(np.int64) + missing
+        errors = np.bincount(inverse, weights=np.concatenate([self.errors, errors]), minlength=size)
+        errors = errors.astype(np.int64) + missing
+        first = np.zeros(size, dtype=np.int64)
+        first[inverse[::-1]] = np.arange(len(all_keys))[::-1]
+        if size > self.capacity:
+            keep = np.argpartition(-totals, self.capacity)[:self.capacity]
+            first, totals, errors = first[keep], totals[keep], errors[keep]
+        self.keys, self.counts, self.errors = all_keys[first], totals, errors
+
+    def top(self, k):
+        """Les ``k`` clés les plus fréquentes : liste de triplets (clé, compte, erreur)."""
+        order = np.argsort(-self.counts, kind="stable")[:k]
+        return [(self.keys[i], int(self.counts[i]), int(self.errors[i])) for i in order]
+
+
+class Rollup:
+    """Agrégats par fenêtre : total de paquets et TopK par dimension."""
+
+    def __init__(self, window=600, capacity=256):
+        self.window = window
+        self.capacity = capacity
+        self.windows = {}       # début de fenêtre -> {"records", "packets", dimension -> TopK}
+        self.records = 0
+
+    def _slot(self, start):
+        slot = self.windows.get(start)
+        if slot is None:
+            slot = {"records": 0, "packets": 0}
+            slot.update({dimension: TopK(self.capacity) for dimension in DIMENSIONS})
+            self.windows[start] = slot
+        return slot
+
+    def add_chunk(self, columns):
+        """Ajoute un paquet de lignes déjà découpées en colonnes (voir parse_lines())."""
+        starts = columns["start"] // self.window * self.window
+        self.records += len(starts)
+        for start in np.unique(starts):
+            mask = starts == start
+            slot = self._slot(int(start))
+            packets = columns["packets"][mask]
+            slot["records"] += int(mask.sum())
+            slot["packets"] += int(packets.sum())
+            for dimension in DIMENSIONS:
+                keys = columns[dimension][mask]
+                # On compte en paquets : une rafale de rejets pèse plus qu'une ligne isolée
+                slot[dimension].add(keys, packets)
+
+    def merge(self, other):
+        self.records += other.records
+        for start, theirs in other.windows.items():
+            slot = self._slot(start)
+            slot["records"] += theirs["records"]
+            slot["packets"] += theirs["packets"]
+            for dimension in DIMENSIONS:
+                slot[dimension].merge(theirs[dimension])
+
+
+# ----------------------------------------------------------------------
+# ------- Lecture des fichiers -----------------------------------------
+# ----------------------------------------------------------------------
+def parse_lines(lines, action="REJECT"):
+    """Découpe des lignes de flow log en colonnes NumPy (lignes NODATA/SKIPDATA ignorées)."""
+    rows = [line.split() for line in lines]
+    rows = [row for row in rows if len(row) == len(FIELDS) and row[_COLUMN["log-status"]] == "OK"
+            and (action is None or row[_COLUMN["action"]] == action)]
+    if not rows:
+        return None
+    table = np.array(rows, dtype=object)
+    dstport = table[:, _COLUMN["dstport"]]
+    return {
+        "srcaddr": table[:, _COLUMN["srcaddr"]],
+        "interface-id": table[:, _COLUMN["interface-id"]],
+        # ICMP n'a pas de port : "-" devient -1
+        "dstport": np.where(dstport == "-", "-1", dstport).astype(np.int64),
+        "packets": np.where(table[:, _COLUMN["packets"]] == "-", "0", table[:, _COLUMN["packets"]]).astype(np.int64),
+        "start": table[:, _COLUMN["start"]].astype(np.int64),
+    }
+
+
+def rollup_file(path, window=600, capacity=256, chunk_lines=50_000, action="REJECT"):
+    """Résume un fichier .log.gz par paquets de ``chunk_lines`` lignes."""
+    rollup = Rollup(window, capacity)
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as file:
+        first = file.readline()
+        if first and not first.startswith("version"):
+            # Pas d'en-tête : la première ligne est déjà un enregistrement
+            file = itertools.chain([first], file)
+        while True:
+            lines = list(itertools.islice(file, chunk_lines))
+            if not lines:
+                break
+            columns = parse_lines(lines, action)
+            if columns is not None:
+                rollup.add_chunk(columns)
+    return rollup
+
+
+def iter_log_files(directory):
+    """Fichiers de flow logs (.log.gz ou .log) sous ``directory``, triés par chemin."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith((".log.gz", ".log")):
+                yield os.path.join(root, name)
+
+
+def _rollup_job(args):
+    return rollup_file(*args)
+
+
+def ingest(directory, window=600, capacity=256, workers=None, chunk_lines=50_000, action="REJECT"):
+    """Résume tous les fichiers de ``directory`` en parallèle et retourne un Rollup fusionné.
+
+    Au plus 2 × ``workers`` fichiers sont en cours à la fois : la mémoire du
+    processus principal reste bornée quel que soit le nombre de fichiers.
+    """
+    from tp4.batch import available_cpus
+
+    workers = workers or available_cpus()
+    total = Rollup(window, capacity)
+    jobs = ((path, window, capacity, chunk_lines, action) for path in iter_log_files(directory))
+    if workers == 1:
+        for job in jobs:
+            total.merge(_rollup_job(job))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(_rollup_job, job))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+        for future in pending:
+            total.merge(future.result())
+    return total
+
+
+def format_rollup(rollup, top=10):
+    """Rendu texte : une section par fenêtre avec ses principales sources, ports et ENI."""
+    import datetime
+
+    lines = [f"{rollup.records} enregistrements dans {len(rollup.windows)} fenêtre(s) de {rollup.window} s"]
+    for start in sorted(rollup.windows):
+        slot = rollup.windows[start]
+        when = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append("")
+        lines.append(f"== {when} UTC : {slot['records']} enregistrements, {slot['packets']} paquets rejetés")
+        for dimension in DIMENSIONS:
+            entries = ", ".join(f"{key} ({count})" if not error else f"{key} ({count - error} à {count})"
+                                for key, count, error in slot[dimension].top(top))
+            lines.append(f"   {dimension:<13} {entries}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agrégats des VPC Flow Logs d'un dossier local")
+    parser.add_argument("directory", help="dossier qui tient lieu de bucket (ex. une copie de AWSLogs/)")
+    parser.add_argument("--window", type=int, default=600, help="taille des fenêtres en secondes")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--capacity", type=int, default=256, help="clés conservées par résumé")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--all-actions", action="store_true", help="compter aussi les paquets ACCEPT")
+    args = parser.parse_args(argv)
+
+    rollup = ingest(args.directory, args.window, args.capacity, args.workers,
+                    action=None if args.all_actions else "REJECT")
+    print(format_rollup(rollup, args.top))
+
+
+if __name__ == "__main__":
+    main()
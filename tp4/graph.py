@@ -0,0 +1,194 @@
+"""Graphe de déploiement d'un template : vagues, chemin critique et DependsOn superflus.
+
+Les arêtes viennent des références (Ref, Fn::GetAtt, Fn::Sub : « implicites »)
+et de DependsOn (« explicites », ex. les EIP des NAT qui attendent
+InternetGatewayAttachment, ou Q3Trail qui attend Q3BackupBucketPolicy).
+CloudFormation crée en parallèle tout ce qui ne dépend pas d'une ressource en
+cours de création : la durée d'une pile est donc celle du chemin le plus long,
+pondéré par la durée de création de chaque type (LATENCY, en secondes).
+
+Une arête DependsOn est signalée si elle est redondante (la dépendance est déjà
+impliquée par une autre chaîne de références ou de DependsOn, affichée) ou si
+elle allonge le chemin critique :
+
+    python -m tp4.graph q1 q3_3 --latency AWS::EC2::NatGateway=90
+"""
+import argparse
+from dataclasses import dataclass
+
+from tp4.refs import explicit_dependencies, implicit_dependencies, template_dict, topological_order
+
+# Durées de création typiques observées avec CloudFormation (secondes)
+LATENCY = {
+    "AWS::CloudTrail::Trail": 10,
+    "AWS::CloudWatch::Alarm": 3,
+    "AWS::EC2::EIP": 5,
+    "AWS::EC2::FlowLog": 10,
+    "AWS::EC2::Instance": 45,
+    "AWS::EC2::InternetGateway": 15,
+    "AWS::EC2::LaunchTemplate": 5,
+    "AWS::EC2::NatGateway": 120,
+    "AWS::EC2::Route": 5,
+    "AWS::EC2::RouteTable": 5,
+    "AWS::EC2::SecurityGroup": 8,
+    "AWS::EC2::Subnet": 5,
+    "AWS::EC2::SubnetRouteTableAssociation": 3,
+    "AWS::EC2::VPC": 15,
+    "AWS::EC2::VPCEndpoint": 60,
+    "AWS::EC2::VPCGatewayAttachment": 15,
+    "AWS::IAM::InstanceProfile": 120,
+    "AWS::IAM::Role": 15,
+    "AWS::KMS::Key": 10,
+    "AWS::S3::Bucket": 20,
+    "AWS::S3::BucketPolicy": 3,
+}
+DEFAULT_LATENCY = 10
+
+
+@dataclass(frozen=True)
+class DependsOnFinding:
+    """Arête DependsOn signalée : ``resource`` attend ``dependency``."""
+    resource: str
+    dependency: str
+    redundant: bool         # déjà impliquée par une autre chaîne de dépendances
+    delay: float            # secondes gagnées sur la pile sans cette arête
+    via: tuple = ()         # chaîne resource → ... → dependency qui rend l'arête redondante
+
+
+class DeployGraph:
+    """Graphe {ressource: dépendances} d'un template, avec la nature de chaque arête."""
+
+    def __init__(self, template, latency=None):
+        resources = template_dict(template).get("Resources", {})
+        self.types = {name: body.get("Type", "") for name, body in resources.items()}
+        self.implicit = {name: implicit_dependencies(body) & resources.keys() for name, body in resources.items()}
+        self.explicit = {name: explicit_dependencies(body) & resources.keys() for name, body in resources.items()}
+        self.graph = {name: self.implicit[name] | self.explicit[name] for name in resources}
+        self.order = topological_order(self.graph)
+        table = dict(LATENCY, **(latency or {}))
+        self.latency = {name: table.get(kind, DEFAULT_LATENCY) for name, kind in self.types.items()}
+
+    def waves(self):
+        """Listes de ressources créables en parallèle, vague par vague."""
+        wave = {}
+        for name in self.order:
+            wave[name] = max((wave[dep] + 1 for dep in self.graph[name]), default=0)
+        grouped = [[] for _ in range(max(wave.values(), default=-1) + 1)]
+        for name in self.graph:          # ordre du template dans chaque vague
+            grouped[wave[name]].append(name)
+        return grouped
+
+    def _finish(self, skip=None):
+        # Heure de fin de chaque ressource au plus tôt ; ``skip`` : arête (ressource, dépendance) ignorée
+        finish, previous = {}, {}
+        for name in self.order:
+            start, before = 0.0, None
+            for dep in self.graph[name]:
+                if (name, dep) != skip and finish[dep] > start:
+                    start, before = finish[dep], dep
+            finish[name], previous[name] = start + self.latency[name], before
+        return finish, previous
+
+    def critical_path(self):
+        """(durée totale estimée, [(ressource, fin au plus tôt)] du chemin le plus long)."""
+        finish, previous = self._finish()
+        if not finish:
+            return 0.0, []
+        name = max(self.order, key=finish.__getitem__)
+        path = []
+        while name is not None:
+            path.append((name, finish[name]))
+            name = previous[name]
+        return finish[path[0][0]], path[::-1]
+
+    def _path(self, start, goal, skip, edges=None):
+        # Plus courte chaîne start → ... → goal sans l'arête ``skip`` (parcours en largeur de
+        # ``edges``, self.graph par défaut), ou None
+        edges = self.graph if edges is None else edges
+        parent, queue = {start: None}, [start]
+        for name in queue:
+            for dep in sorted(edges[name]):
+                if (name, dep) == skip or dep in parent:
+                    continue
+                parent[dep] = name
+                if dep == goal:
+                    path = [dep]
+                    while parent[path[-1]] is not None:
+                        path.append(parent[path[-1]])
+                    return tuple(path[::-1])
+                queue.append(dep)
+        return None
+
+    def depends_on_findings(self):
+        """Arêtes DependsOn redondantes ou qui allongent la création de la pile."""
+        total, _ = self.critical_path()
+        findings = []
+        for name in self.order:
+            for dep in sorted(self.explicit[name]):
+                edge = (name, dep)
+                # Chaîne de références seules de préférence, sinon en passant par d'autres DependsOn
+                via = (self._path(name, dep, edge, self.implicit) or self._path(name, dep, edge)) or ()
+                finish, _ = self._finish(skip=edge)
+                delay = total - max(finish.values())
+                if via or delay > 0:
+                    findings.append(DependsOnFinding(name, dep, bool(via), delay, via))
+        return findings
+
+    def to_dot(self):
+        """Graphe au format Graphviz ; les arêtes DependsOn seules sont en pointillés."""
+        lines = ["digraph deploy {", "  rankdir=LR;"]
+        for name in self.order:
+            lines.append(f'  "{name}" [label="{name}\\n{self.types[name]} ({self.latency[name]:g} s)"];')
+            for dep in sorted(self.graph[name]):
+                style = "" if dep in self.implicit[name] else " [style=dashed]"
+                lines.append(f'  "{dep}" -> "{name}"{style};')
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def _chain(graph, via):
+    # "A → B (Ref) → C (DependsOn)" : nature de chaque arête de la chaîne
+    hops = [via[0]]
+    for source, target in zip(via, via[1:]):
+        hops.append(f"{target} ({'Ref' if target in graph.implicit[source] else 'DependsOn'})")
+    return " → ".join(hops)
+
+
+def format_analysis(graph, name="template"):
+    total, path = graph.critical_path()
+    waves = graph.waves()
+    lines = [f"{name} : {len(graph.graph)} ressources, {len(waves)} vague(s), durée estimée {total:g} s"]
+    for number, wave in enumerate(waves):
+        shown = ", ".join(wave[:8]) + (f", ... (+{len(wave) - 8})" if len(wave) > 8 else "")
+        lines.append(f"  vague {number} : {shown}")
+    lines.append("  chemin critique : " + " → ".join(f"{resource} ({end:g} s)" for resource, end in path))
+    for finding in graph.depends_on_findings():
+        reason = f"redondant (déjà impliqué par {_chain(graph, finding.via)})" if finding.redundant else "non redondant"
+        gain = f", allonge la pile de {finding.delay:g} s" if finding.delay > 0 else ""
+        lines.append(f"  DependsOn {finding.resource} → {finding.dependency} : {reason}{gain}")
+    return "\n".join(lines)
+
+
+def _latency(text):
+    kind, _, seconds = text.partition("=")
+    return kind, float(seconds)
+
+
+def main(argv=None):
+    from tp4.rules import load_template, preset_template
+
+    parser = argparse.ArgumentParser(description="Vagues de déploiement et chemin critique d'un template")
+    parser.add_argument("templates", nargs="+", help="presets (q1, q2, q3_1, q3_2, q3_3) ou fichiers JSON/YAML")
+    parser.add_argument("--latency", nargs="+", type=_latency, default=[], metavar="TYPE=SECONDES",
+                        help="durée de création d'un type de ressource")
+    parser.add_argument("--dot", action="store_true", help="affiche le graphe au format Graphviz")
+    args = parser.parse_args(argv)
+
+    for name in args.templates:
+        template = preset_template(name)
+        graph = DeployGraph(template if template is not None else load_template(name), dict(args.latency))
+        print(graph.to_dot() if args.dot else format_analysis(graph, name))
+
+
+if __name__ == "__main__":
+    main()
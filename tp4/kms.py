@@ -0,0 +1,272 @@
+"""Modèle du volume de requêtes KMS d'un bucket chiffré en SSE-KMS (bucket de la Q2).
+
+Sans S3 Bucket Key, chaque écriture d'objet appelle GenerateDataKey et chaque
+lecture appelle Decrypt sur la clé KMS du bucket. Une copie fait les deux. Avec
+une Bucket Key, S3 dérive une clé de bucket depuis KMS et la réutilise pendant
+une durée limitée. Le modèle compte alors un appel par clé de bucket active et
+par fenêtre de réutilisation, pour les écritures comme pour les lectures. Les
+lectures d'objets chiffrés avant l'activation (``legacy_fraction``) gardent un
+Decrypt par objet.
+
+Une trace d'accès (CSV) est rejouée seconde par seconde :
+
+    timestamp,operation[,count]
+    2026-10-01T12:00:00Z,PUT,120
+    1790000000,GetObject,1
+
+``timestamp`` est une date ISO 8601 (UTC) ou un temps Unix en secondes, au
+choix pour chaque ligne ; la trace couvre au plus MAX_TRACE_SECONDS (31 jours).
+``operation`` est PUT/GET/COPY ou le nom de l'appel S3 (PutObject, GetObject,
+CopyObject, CreateMultipartUpload) ; les autres opérations n'appellent pas KMS.
+La trace peut aussi venir de l'index CloudTrail de tp4.trail (``--trail-index``).
+
+Pour chaque bucket SSE-KMS du template, la configuration générée et son
+alternative (Bucket Key activée ou non) sont comparées : appels KMS par
+seconde, marge sous le quota, appels refusés et latence ajoutée.
+
+    python -m tp4.kms --trace trace.csv q2 --quota 5500
+    python -m tp4.kms --trail-index .tp4-cache/cloudtrail.sqlite3 q2
+"""
+import argparse
+import csv
+from dataclasses import dataclass
+
+import numpy as np
+
+from tp4.refs import template_dict
+
+# Appels KMS (tous comptés sur le même quota d'opérations cryptographiques) par opération
+_KIND = {
+    "PUT": "put", "PUTOBJECT": "put", "POST": "put", "CREATEMULTIPARTUPLOAD": "put",
+    "GET": "get", "GETOBJECT": "get",
+    "COPY": "copy", "COPYOBJECT": "copy", "UPLOADPARTCOPY": "copy",
+}
+TRAIL_EVENTS = ("PutObject", "GetObject", "CopyObject", "CreateMultipartUpload", "UploadPartCopy")
+MAX_TRACE_SECONDS = 31 * 86400     # une seconde par case : 3 colonnes de 8 octets, environ 64 Mo
+
+
+@dataclass(frozen=True)
+class KmsModel:
+    """Hypothèses du modèle ; à ajuster selon Service Quotas et les mesures du compte."""
+    quota: float = 5500                 # opérations cryptographiques/s partagées (quota le plus bas)
+    kms_latency_ms: float = 8.0         # latence d'un appel KMS dans la région
+    retry_penalty_ms: float = 200.0     # appel refusé : 503 SlowDown puis relance du client
+    bucket_key_seconds: int = 300       # durée de réutilisation d'une clé de bucket
+    bucket_key_fanout: int = 16         # clés de bucket actives en même temps côté S3
+    legacy_fraction: float = 0.0        # part des lectures sur des objets chiffrés sans Bucket Key
+
+
+@dataclass
+class Trace:
+    """Requêtes par seconde (tableaux NumPy) à partir de ``start`` (secondes Unix)."""
+    start: int
+    put: np.ndarray
+    get: np.ndarray
+    copy: np.ndarray
+
+    @property
+    def seconds(self):
+        return len(self.put)
+
+    @property
+    def requests(self):
+        return self.put + self.get + self.copy
+
+
+@dataclass
+class Prediction:
+    """Appels KMS prédits seconde par seconde pour une configuration de bucket."""
+    bucket_key: bool
+    calls: np.ndarray
+    requests: np.ndarray
+    model: KmsModel
+
+    @property
+    def throttled(self):
+        return np.maximum(self.calls - self.model.quota, 0)
+
+    @property
+    def peak(self):
+        return float(self.calls.max()) if len(self.calls) else 0.0
+
+    def percentile(self, q):
+        return float(np.percentile(self.calls, q)) if len(self.calls) else 0.0
+
+    @property
+    def headroom(self):
+        """Marge entre la seconde la plus chargée et le quota (négative si dépassé)."""
+        return self.model.quota - self.peak
+
+    @property
+    def saturated_seconds(self):
+        return int((self.calls > self.model.quota).sum())
+
+    def added_latency_ms(self):
+        """(moyenne par requête, pire seconde) de la latence ajoutée par KMS, en ms."""
+        throttled = self.throttled
+        per_second = self.calls * self.model.kms_latency_ms + throttled * self.model.retry_penalty_ms
+        busy = self.requests > 0
+        if not busy.any():
+            return 0.0, 0.0
+        worst = float((per_second[busy] / self.requests[busy]).max())
+        return float(per_second.sum() / self.requests.sum()), worst
+
+
+# ----------------------------------------------------------------------
+# ------- Trace d'accès ------------------------------------------------
+# ----------------------------------------------------------------------
+def _timestamps(raw):
+    # Chaque valeur est lue seule : un nombre est un temps Unix, le reste une date ISO 8601 en UTC
+    values = np.char.strip(np.asarray(raw, dtype=str))
+    unsigned = np.char.replace(np.char.lstrip(values, "-"), ".", "", count=1)
+    numeric = np.char.isdigit(unsigned) if len(values) else np.zeros(0, dtype=bool)
+    seconds = np.empty(len(values), dtype=np.int64)
+    seconds[numeric] = values[numeric].astype(np.float64).astype(np.int64)
+    # ISO 8601 en UTC, comme dans tp4.alarms
+    text = np.char.replace(np.char.replace(values[~numeric], "Z", ""), "+00:00", "")
+    try:
+        seconds[~numeric] = text.astype("datetime64[s]").astype(np.int64)
+    except ValueError as error:
+        raise ValueError(f"horodatage ni Unix ni ISO 8601 (UTC) dans la trace : {error}") from None
+    return seconds
+
+
+def trace_from_counts(timestamps, operations, counts):
+    """Trace par seconde à partir de trois séquences alignées (seconde, opération, nombre)."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float64)
+    if not len(timestamps):
+        empty = np.zeros(0)
+        return Trace(0, empty, empty, empty)
+    start = int(timestamps.min())
+    offsets = timestamps - start
+    length = int(offsets.max()) + 1
+    if length > MAX_TRACE_SECONDS:
+        raise ValueError(f"trace de {length} s, au-delà de {MAX_TRACE_SECONDS} s ({MAX_TRACE_SECONDS // 86400} jours) : "
+                         "horodatages incohérents ou trace à découper")
+    kinds = np.array([_KIND.get(operation.upper(), "") for operation in operations])
+    columns = {kind: np.bincount(offsets[kinds == kind], weights=counts[kinds == kind], minlength=length)
+               for kind in ("put", "get", "copy")}
+    return Trace(start, **columns)
+
+
+def load_trace(path):
+    """Trace d'un fichier CSV ``timestamp,operation[,count]``."""
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        header = [name.strip().lower() for name in next(reader)]
+        time_col, op_col = header.index("timestamp"), header.index("operation")
+        count_col = header.index("count") if "count" in header else None
+        rows = [row for row in reader if row]
+    return trace_from_counts(
+        _timestamps([row[time_col] for row in rows]),
+        [row[op_col] for row in rows],
+        [float(row[count_col]) if count_col is not None else 1.0 for row in rows],
+    )
+
+
+def trace_from_trail(index_path, bucket=None, since=None, until=None):
+    """Trace des événements de données S3 indexés par tp4.trail (sans les requêtes en erreur)."""
+    from tp4.trail import TrailIndex
+
+    with TrailIndex(index_path) as index:
+        rows = index.per_second(events=TRAIL_EVENTS, bucket=bucket, since=since, until=until, errors=False)
+    if not rows:
+        return trace_from_counts([], [], [])
+    return trace_from_counts(*zip(*rows))
+
+
+# ----------------------------------------------------------------------
+# ------- Configuration du template et prédiction ----------------------
+# ----------------------------------------------------------------------
+def kms_buckets(template):
+    """[(nom logique, clé KMS, Bucket Key activée)] des buckets chiffrés avec KMS."""
+    found = []
+    for name, body in template_dict(template).get("Resources", {}).items():
+        if body.get("Type") != "AWS::S3::Bucket":
+            continue
+        encryption = (body.get("Properties") or {}).get("BucketEncryption") or {}
+        for rule in encryption.get("ServerSideEncryptionConfiguration") or []:
+            default = rule.get("ServerSideEncryptionByDefault") or {}
+            if str(default.get("SSEAlgorithm", "")).startswith("aws:kms"):
+                found.append((name, default.get("KMSMasterKeyID", "aws/s3"), rule.get("BucketKeyEnabled") is True))
+                break
+    return found
+
+
+def _bucket_key_calls(requests, model):
+    # Dans chaque fenêtre de réutilisation, les ``fanout`` premières requêtes appellent KMS
+    # (une par clé de bucket à dériver), les suivantes réutilisent une clé déjà dérivée
+    calls = np.zeros(len(requests))
+    window = model.bucket_key_seconds
+    for start in range(0, len(requests), window):
+        chunk = requests[start:start + window]
+        if chunk.any():
+            capped = np.minimum(np.cumsum(chunk), model.bucket_key_fanout)
+            calls[start:start + len(chunk)] = np.diff(capped, prepend=0)
+    return calls
+
+
+def predict(trace, bucket_key, model=KmsModel()):
+    """Appels KMS par seconde de ``trace`` pour un bucket avec ou sans Bucket Key."""
+    if not bucket_key:
+        calls = trace.put + trace.get + 2 * trace.copy
+    else:
+        legacy = trace.get * model.legacy_fraction
+        calls = (_bucket_key_calls(trace.put + trace.copy, model)
+                 + _bucket_key_calls(trace.get - legacy + trace.copy, model) + legacy)
+    return Prediction(bucket_key, calls, trace.requests, model)
+
+
+def format_predictions(name, key, trace, predictions):
+    lines = [f"{name} (clé {key}) : {trace.seconds} s de trace, {int(trace.requests.sum())} requêtes "
+             f"(PUT {int(trace.put.sum())}, GET {int(trace.get.sum())}, COPY {int(trace.copy.sum())})",
+             f"  {'configuration':<28} {'KMS/s moy':>10} {'p99':>9} {'max':>9} {'marge':>9} "
+             f"{'s saturées':>10} {'refusés':>9} {'latence moy':>11} {'pire s':>9}"]
+    for label, prediction in predictions:
+        mean, worst = prediction.added_latency_ms()
+        lines.append(f"  {label:<28} {prediction.calls.mean() if len(prediction.calls) else 0:>10.1f} "
+                     f"{prediction.percentile(99):>9.1f} {prediction.peak:>9.1f} {prediction.headroom:>9.1f} "
+                     f"{prediction.saturated_seconds:>10} {int(prediction.throttled.sum()):>9} "
+                     f"{mean:>8.2f} ms {worst:>6.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from tp4.rules import load_template, preset_template
+
+    parser = argparse.ArgumentParser(description="Appels KMS prédits pour les buckets SSE-KMS d'un template")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", default=None, help="trace CSV timestamp,operation[,count]")
+    source.add_argument("--trail-index", default=None, help="index SQLite de tp4.trail")
+    parser.add_argument("template", nargs="?", default="q2", help="preset (q2, q3_3, ...) ou fichier JSON/YAML")
+    parser.add_argument("--bucket", default=None, help="nom logique du bucket (tous les buckets SSE-KMS par défaut)")
+    parser.add_argument("--quota", type=float, default=KmsModel.quota, help="appels KMS/s autorisés")
+    parser.add_argument("--kms-latency-ms", type=float, default=KmsModel.kms_latency_ms)
+    parser.add_argument("--retry-penalty-ms", type=float, default=KmsModel.retry_penalty_ms)
+    parser.add_argument("--bucket-key-seconds", type=int, default=KmsModel.bucket_key_seconds)
+    parser.add_argument("--bucket-key-fanout", type=int, default=KmsModel.bucket_key_fanout)
+    parser.add_argument("--legacy-fraction", type=float, default=KmsModel.legacy_fraction,
+                        help="part des lectures sur des objets chiffrés sans Bucket Key")
+    args = parser.parse_args(argv)
+
+    template = preset_template(args.template)
+    template = template if template is not None else load_template(args.template)
+    model = KmsModel(args.quota, args.kms_latency_ms, args.retry_penalty_ms, args.bucket_key_seconds,
+                     args.bucket_key_fanout, args.legacy_fraction)
+    try:
+        trace = load_trace(args.trace) if args.trace else trace_from_trail(args.trail_index)
+    except ValueError as error:
+        parser.error(str(error))
+    buckets = [entry for entry in kms_buckets(template) if args.bucket in (None, entry[0])]
+    if not buckets:
+        parser.error("aucun bucket chiffré avec KMS dans le template")
+    for name, key, bucket_key in buckets:
+        generated = f"générée ({'avec' if bucket_key else 'sans'} Bucket Key)"
+        alternative = f"{'sans' if bucket_key else 'avec'} Bucket Key"
+        print(format_predictions(name, key, trace, [(generated, predict(trace, bucket_key, model)),
+                                                    (alternative, predict(trace, not bucket_key, model))]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Chargement rapide des templates écrits à la main, en dict ou en Template troposphere.
+
+"VPC Security/vpc.yaml", "EC2 Security/ec2.json" et "S3 Security/s3.json" ne
+sont pas produits par le paquet : ce module les relit pour que les règles
+(tp4.rules), le graphe de déploiement (tp4.graph) et les autres outils qui
+passent par ``rules.load_template`` s'appliquent aussi à eux, et pour les
+régénérer avec troposphere.
+
+- le YAML est lu par le chargeur C de LibYAML (yaml.CSafeLoader), avec les
+  balises courtes de CloudFormation (!Ref, !Sub, !GetAtt...) converties en
+  forme longue ; sans LibYAML, le chargeur Python de PyYAML prend le relais ;
+- le dict lu est conservé dans le cache (dossier templates/) tant que le
+  fichier ne change pas (chemin, taille, date de modification) ;
+- la conversion en Template passe par le TemplateGenerator de troposphere,
+  sans reconstruire à chaque propriété l'ensemble des classes connues ; les
+  valeurs y sont validées (``"false"`` devient ``false``) et les attributs de
+  ressource inconnus de CloudFormation (``Description`` de s3.json) sont perdus,
+  d'où l'analyse faite sur le dict.
+
+    python -m tp4.loader "VPC Security/vpc.yaml" "EC2 Security/ec2.json" "S3 Security/s3.json"
+    python -m tp4.loader "VPC Security/vpc.yaml" --to json -o vpc.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import yaml
+
+_PARSE_VERSION = 1      # à incrémenter si la forme du dict produit change (cache sur disque)
+HAND_WRITTEN = ("VPC Security/vpc.yaml", "EC2 Security/ec2.json", "S3 Security/s3.json")
+
+
+# ----------------------------------------------------------------------
+# ------- Lecture du YAML (balises courtes CloudFormation) --------------
+# ----------------------------------------------------------------------
+class CfnLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """Chargeur sûr de LibYAML qui comprend les balises courtes de CloudFormation."""
+
+
+# CloudFormation garde les dates ("2010-09-09") comme des chaînes
+CfnLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if tag != "tag:yaml.org,2002:timestamp"]
+    for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()
+}
+
+
+def _short_form(loader, suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if suffix in ("Ref", "Condition"):
+        return {suffix: value}
+    if suffix == "GetAtt" and isinstance(value, str):
+        value = value.split(".", 1)
+    return {f"Fn::{suffix}": value}
+
+
+CfnLoader.add_multi_constructor("!", _short_form)
+
+
+def parse_text(text, name=""):
+    """Dict d'un template JSON ou YAML déjà lu (``name`` sert à reconnaître l'extension)."""
+    if name.endswith(".json") or text.lstrip().startswith("{"):
+        return json.loads(text)
+    return yaml.load(text, Loader=CfnLoader)
+
+
+def _parse_file(path):
+    with open(path) as file:
+        return parse_text(file.read(), path)
+
+
+def parse(path):
+    """Dict du template ``path``, relu depuis le cache (dossier templates/) tant qu'il n'a pas changé."""
+    from tp4.cache import DEFAULT_DIR
+
+    if os.environ.get("TP4_NO_CACHE"):
+        return _parse_file(path)
+    path = os.path.abspath(path)
+    status = os.stat(path)
+    stamp = (path, status.st_size, status.st_mtime_ns, _PARSE_VERSION)
+    directory = os.path.join(os.environ.get("TP4_CACHE_DIR") or DEFAULT_DIR, "templates")
+    cached = os.path.join(directory, hashlib.sha256(path.encode()).hexdigest()[:32] + ".pickle")
+    try:
+        with open(cached, "rb") as file:
+            found, data = pickle.load(file)
+        if found == stamp:
+            return data
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+        pass
+    data = _parse_file(path)
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{cached}.{os.getpid()}.tmp"
+    with open(partial, "wb") as file:
+        pickle.dump((stamp, data), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, cached)
+    return data
+
+
+# ----------------------------------------------------------------------
+# ------- Conversion en Template troposphere ----------------------------
+# ----------------------------------------------------------------------
+class _Members(frozenset):
+    # TemplateGenerator teste ``cls not in self.inspect_members.union(self._custom_members)``
+    # pour chaque propriété : sans membres personnalisés, l'ensemble est réutilisé tel quel
+    def union(self, *others):
+        if not any(others):
+            return self
+        return frozenset.union(self, *others)
+
+
+_generator_class = None
+
+
+def _generator():
+    global _generator_class
+    if _generator_class is None:
+        from troposphere.template_generator import TemplateGenerator
+
+        class Generator(TemplateGenerator):
+            pass
+
+        # Le premier accès importe tous les modules de troposphere (une seule fois par processus)
+        Generator._inspect_members = _Members(TemplateGenerator({}).inspect_members)
+        _generator_class = Generator
+    return _generator_class
+
+
+def to_template(data):
+    """Template troposphere équivalent au dict ``data``."""
+    return _generator()(data)
+
+
+def import_template(path):
+    """Template troposphere du fichier JSON ou YAML ``path``."""
+    return to_template(parse(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Charge des templates écrits à la main (JSON/YAML) avec troposphere")
+    parser.add_argument("paths", nargs="*", default=list(HAND_WRITTEN),
+                        help="fichiers JSON/YAML (les trois templates écrits à la main par défaut)")
+    parser.add_argument("--to", choices=("json", "yaml"), default=None,
+                        help="réécrit le template régénéré par troposphere")
+    parser.add_argument("-o", "--output", default=None, help="fichier de sortie de --to (un seul template)")
+    args = parser.parse_args(argv)
+    if args.output and len(args.paths) != 1:
+        parser.error("-o n'accepte qu'un seul template")
+
+    began = time.perf_counter()
+    _generator()
+    print(f"troposphere chargé en {(time.perf_counter() - began) * 1000:.0f} ms (une fois par processus)")
+    for path in args.paths:
+        began = time.perf_counter()
+        data = parse(path)
+        parsed = time.perf_counter() - began
+        template = to_template(data)
+        converted = time.perf_counter() - began - parsed
+        print(f"{path} : {len(template.resources)} ressources, {len(template.parameters)} paramètres, "
+              f"{len(template.outputs)} sorties (lecture {parsed * 1000:.1f} ms, "
+              f"conversion {converted * 1000:.1f} ms)")
+        if args.to:
+            text = template.to_json() if args.to == "json" else template.to_yaml()
+            if args.output:
+                with open(args.output, "w") as file:
+                    file.write(text)
+            else:
+                print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Choix de la topologie de sortie des sous-réseaux privés : NAT par AZ, NAT partagé, endpoints.
+
+Dans la Q1, toute la sortie des sous-réseaux privés passe par les deux NAT
+Gateways, y compris le trafic vers S3 (bucket polystudent-q2-tp4, buckets de
+réplication de la Q3.3) : ce trafic paie le traitement du NAT (latence, coût
+au Go) et partage son débit. À partir d'une matrice de trafic locale (CSV) :
+
+    az,destination,peak_gbps,gb_per_month
+    us-east-1a,s3,2.5,1800
+    2,internet,0.8,300
+    us-east-1b,logs,0.2,150
+
+``az`` est une zone du VpcSpec ou son rang (1, 2...). ``destination`` est
+``internet`` ou le nom court d'un service AWS (s3, dynamodb, logs, ssm...).
+
+Les topologies comparées combinent un NAT par AZ ou un NAT partagé avec :
+aucun endpoint, des endpoints Gateway (s3, dynamodb, gratuits et sans limite
+de débit), et des endpoints Interface pour les services dont le trafic coûte
+plus cher par le NAT que l'endpoint lui-même. Pour chacune : marge de débit
+du NAT ou de l'endpoint le plus chargé, coût mensuel, latence ajoutée et
+résistance à la perte d'une AZ. La recommandation est la moins chère qui
+garde la marge demandée parmi les topologies qui résistent à la perte d'une
+AZ : le NAT partagé n'est retenu qu'avec --allow-shared. Elle peut être écrite
+en template avec -o.
+
+    python -m tp4.natplan trafic.csv --preset q1 --min-headroom 0.3
+    python -m tp4.natplan trafic.csv --preset q3_1 -o vpc-endpoints.yaml
+    python -m tp4.natplan trafic.csv --preset q1 --allow-shared
+"""
+import argparse
+import csv
+from dataclasses import dataclass, replace
+
+from tp4.vpc import GATEWAY_SERVICES, EndpointSpec
+
+
+@dataclass(frozen=True)
+class NatModel:
+    """Hypothèses du modèle (us-east-1) ; à ajuster selon la région et les mesures du compte."""
+    burst_gbps: float = 100.0           # débit maximal d'un NAT ou d'une interface d'endpoint (montée progressive)
+    nat_baseline_gbps: float = 5.0      # débit d'un NAT Gateway avant montée en charge
+    interface_baseline_gbps: float = 10.0   # débit d'un endpoint Interface par AZ avant montée en charge
+    nat_hourly: float = 0.045           # $ par NAT Gateway et par heure
+    nat_per_gb: float = 0.045           # $ par Go traité par le NAT
+    interface_hourly: float = 0.01      # $ par endpoint Interface, par AZ et par heure
+    interface_per_gb: float = 0.01      # $ par Go traité par un endpoint Interface
+    cross_az_per_gb: float = 0.02       # $ par Go entre deux AZ (0,01 $ dans chaque sens)
+    nat_latency_ms: float = 0.5         # traitement par le NAT
+    cross_az_latency_ms: float = 1.0    # aller-retour vers le NAT partagé d'une autre AZ
+    hours: float = 730.0                # heures par mois
+
+
+@dataclass(frozen=True)
+class Flow:
+    """Trafic d'une AZ (rang à partir de 1) vers une destination."""
+    az: int
+    destination: str
+    peak_gbps: float
+    gb_per_month: float
+
+
+@dataclass
+class Topology:
+    """Évaluation d'une topologie : marge de débit, coût mensuel et latence ajoutée."""
+    nat_gateways: str                   # "per_az" ou "shared"
+    endpoints: tuple                    # EndpointSpec
+    peak_gbps: float                    # composant (NAT ou interface) le plus chargé
+    headroom_gbps: float
+    headroom: float                     # fraction de burst_gbps restante
+    over_baseline: bool                 # le composant le plus chargé dépend de la montée en charge
+    monthly_cost: float
+    latency_ms: float                   # latence moyenne ajoutée, pondérée par le volume
+    resilient: bool                     # chaque AZ garde sa sortie si une autre AZ tombe
+
+    @property
+    def label(self):
+        nat = "NAT par AZ" if self.nat_gateways == "per_az" else "NAT partagé"
+        if not self.endpoints:
+            return nat
+        return f"{nat} + endpoints {', '.join(endpoint.service for endpoint in self.endpoints)}"
+
+
+# ----------------------------------------------------------------------
+# ------- Matrice de trafic ---------------------------------------------
+# ----------------------------------------------------------------------
+def load_matrix(path, azs):
+    """Flux du CSV ``az,destination,peak_gbps,gb_per_month`` ; ``azs`` : zones du VpcSpec."""
+    flows = []
+    with open(path, newline="") as file:
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            zone = row["az"].strip()
+            if zone in azs:
+                index = azs.index(zone) + 1
+            elif zone.isdigit() and 1 <= int(zone) <= len(azs):
+                index = int(zone)
+            else:
+                raise ValueError(f"ligne {line} : AZ inconnue {zone} (attendu : {', '.join(azs)} ou 1..{len(azs)})")
+            flows.append(Flow(index, row["destination"].strip().lower(), float(row["peak_gbps"]),
+                              float(row["gb_per_month"])))
+    return flows
+
+
+# ----------------------------------------------------------------------
+# ------- Évaluation des topologies --------------------------------------
+# ----------------------------------------------------------------------
+def _interface_worthwhile(flows, service, az_count, model):
+    # L'endpoint Interface coûte ses heures dans chaque AZ mais économise le traitement NAT
+    volume = sum(flow.gb_per_month for flow in flows if flow.destination == service)
+    saved = volume * (model.nat_per_gb - model.interface_per_gb)
+    return saved > model.interface_hourly * az_count * model.hours
+
+
+def candidate_endpoints(flows, az_count, model=NatModel()):
+    """Ensembles d'endpoints à évaluer : aucun, Gateway seuls, Gateway et Interface rentables."""
+    services = sorted({flow.destination for flow in flows if flow.destination != "internet"})
+    gateway = tuple(EndpointSpec(service) for service in services if service in GATEWAY_SERVICES)
+    interface = tuple(EndpointSpec(service, "Interface") for service in services
+                      if service not in GATEWAY_SERVICES and _interface_worthwhile(flows, service, az_count, model))
+    candidates = [()]
+    for endpoints in (gateway, gateway + interface):
+        if endpoints and endpoints not in candidates:
+            candidates.append(endpoints)
+    return candidates
+
+
+def evaluate(flows, az_count, nat_gateways, endpoints, model=NatModel()):
+    """Topology obtenue en faisant passer ``flows`` par les NAT et les ``endpoints`` donnés."""
+    routed = {endpoint.service: endpoint.endpoint_type for endpoint in endpoints}
+    nat_load, interface_load = {}, {}
+    nat_gb = interface_gb = cross_az_gb = 0.0
+    weighted_latency = total_gb = 0.0
+    for flow in flows:
+        total_gb += flow.gb_per_month
+        kind = routed.get(flow.destination)
+        if kind == "Gateway":
+            continue                    # route directe vers le service, ni coût ni limite de débit
+        if kind == "Interface":
+            key = (flow.destination, flow.az)
+            interface_load[key] = interface_load.get(key, 0.0) + flow.peak_gbps
+            interface_gb += flow.gb_per_month
+            continue
+        nat = flow.az if nat_gateways == "per_az" else 1
+        nat_load[nat] = nat_load.get(nat, 0.0) + flow.peak_gbps
+        nat_gb += flow.gb_per_month
+        latency = model.nat_latency_ms
+        if nat != flow.az:
+            cross_az_gb += flow.gb_per_month
+            latency += model.cross_az_latency_ms
+        weighted_latency += latency * flow.gb_per_month
+
+    loads = [(load, model.nat_baseline_gbps) for load in nat_load.values()]
+    loads += [(load, model.interface_baseline_gbps) for load in interface_load.values()]
+    peak, baseline = max(loads, default=(0.0, model.nat_baseline_gbps))
+    nat_count = az_count if nat_gateways == "per_az" else 1
+    interface_count = sum(1 for kind in routed.values() if kind == "Interface")
+    cost = (nat_count * model.nat_hourly * model.hours + nat_gb * model.nat_per_gb
+            + interface_count * az_count * model.interface_hourly * model.hours
+            + interface_gb * model.interface_per_gb + cross_az_gb * model.cross_az_per_gb)
+    return Topology(
+        nat_gateways, tuple(endpoints), peak, model.burst_gbps - peak, (model.burst_gbps - peak) / model.burst_gbps,
+        peak > baseline, cost, weighted_latency / total_gb if total_gb else 0.0,
+        nat_gateways == "per_az" or az_count == 1,
+    )
+
+
+def plan(flows, az_count, model=NatModel()):
+    """Toutes les topologies candidates, de la moins chère à la plus chère."""
+    topologies = [evaluate(flows, az_count, nat_gateways, endpoints, model)
+                  for nat_gateways in ("per_az", "shared")
+                  for endpoints in candidate_endpoints(flows, az_count, model)]
+    return sorted(topologies, key=lambda topology: (topology.monthly_cost, topology.latency_ms))
+
+
+def recommend(topologies, min_headroom=0.2, resilient=True):
+    """Topologie la moins chère qui garde ``min_headroom`` de marge.
+
+    Avec ``resilient`` (par défaut), seules les topologies qui résistent à la
+    perte d'une AZ sont éligibles.
+    """
+    eligible = [topology for topology in topologies if topology.resilient or not resilient]
+    feasible = [topology for topology in eligible if topology.headroom >= min_headroom]
+    if feasible:
+        return feasible[0]
+    return max(eligible, key=lambda topology: topology.headroom, default=None)
+
+
+def apply(spec, topology):
+    """VpcSpec ``spec`` modifié pour suivre ``topology``."""
+    return replace(spec, nat_gateways=topology.nat_gateways, endpoints=topology.endpoints)
+
+
+def format_plan(topologies, chosen, min_headroom):
+    lines = [f"  {'topologie':<44} {'pic Gbit/s':>10} {'marge':>7} {'coût/mois':>10} {'latence':>9}  AZ"]
+    for topology in topologies:
+        mark = "→" if topology is chosen else " "
+        lines.append(f"{mark} {topology.label:<44} {topology.peak_gbps:>10.2f} {topology.headroom:>6.0%} "
+                     f"{topology.monthly_cost:>9.2f}$ {topology.latency_ms:>6.2f} ms  "
+                     f"{'oui' if topology.resilient else 'non'}{' (montée en charge)' if topology.over_baseline else ''}")
+    if chosen is None:
+        lines.append("aucune topologie éligible")
+    elif chosen.headroom < min_headroom:
+        lines.append(f"aucune topologie ne garde {min_headroom:.0%} de marge : la plus large est retenue")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from tp4.batch import PRESETS
+
+    parser = argparse.ArgumentParser(description="NAT par AZ, NAT partagé ou endpoints VPC selon une matrice de trafic")
+    parser.add_argument("matrix", help="CSV az,destination,peak_gbps,gb_per_month")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="q1", help="VPC de départ")
+    parser.add_argument("--min-headroom", type=float, default=0.2, help="marge de débit minimale (fraction)")
+    parser.add_argument("--allow-shared", action="store_true",
+                        help="autorise le NAT partagé (une AZ perdue coupe la sortie des autres)")
+    parser.add_argument("--nat-latency-ms", type=float, default=NatModel.nat_latency_ms)
+    parser.add_argument("--cross-az-latency-ms", type=float, default=NatModel.cross_az_latency_ms)
+    parser.add_argument("-o", "--output", default=None, help="écrit le template VPC de la topologie recommandée")
+    args = parser.parse_args(argv)
+
+    spec = PRESETS[args.preset]
+    if not spec.internet_access:
+        parser.error(f"le VPC {args.preset} n'a pas de NAT Gateway")
+    model = NatModel(nat_latency_ms=args.nat_latency_ms, cross_az_latency_ms=args.cross_az_latency_ms)
+    try:
+        flows = load_matrix(args.matrix, list(spec.azs))
+    except ValueError as error:
+        parser.error(str(error))
+    topologies = plan(flows, len(spec.azs), model)
+    chosen = recommend(topologies, args.min_headroom, resilient=not args.allow_shared)
+    print(format_plan(topologies, chosen, args.min_headroom))
+    cheaper = recommend(topologies, args.min_headroom, resilient=False)
+    if cheaper not in (None, chosen) and not args.allow_shared:
+        print(f"{cheaper.label} serait moins cher mais ne résiste pas à la perte d'une AZ (--allow-shared)")
+    if chosen is not None and args.output:
+        from tp4.cache import builder_sources, write_template
+        from tp4.vpc import build_vpc_template
+
+        recommended = apply(spec, chosen)
+        write_template(args.output, lambda: build_vpc_template(recommended), recommended, sources=builder_sources())
+        print(f"{args.output} : {chosen.label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Analyse hors ligne de l'accessibilité réseau d'un template VPC.
+
+À partir d'un Template (Q1, Q3.x ou un template chargé depuis un fichier), on
+reconstruit le modèle du réseau : sous-réseaux, tables de routage (route locale,
+routes vers l'IGW et vers les NAT Gateways), associations et groupes de sécurité.
+On peut alors répondre sans déployer :
+
+- matrice d'accessibilité entre chaque sous-réseau et Internet, port par port
+  (reachability_matrix()) ;
+- verdict vectorisé sur des centaines de milliers de flux hypothétiques
+  (NetworkModel.evaluate_flows()).
+
+Les recherches de route utilisent un trie de plus long préfixe précalculé par
+table (RouteTrie) ; la version vectorisée fait une recherche searchsorted par
+longueur de préfixe présente dans la table.
+
+Hypothèses : un sous-réseau sans instance est protégé par l'union des groupes de
+sécurité du template ; les groupes sans SecurityGroupEgress autorisent toute
+sortie ; un sous-réseau sans association utilise la table principale, qui ne
+contient que la route locale.
+"""
+import ipaddress
+
+from tp4.sg import RuleIndex, rules_from_ingress
+
+INTERNET = "internet"
+# Adresse publique représentative d'Internet (TEST-NET-3, RFC 5737)
+INTERNET_ADDRESS = "203.0.113.10"
+
+# Verdicts de evaluate_flows()
+ALLOWED = 0
+NO_ROUTE = 1          # aucune route (ou pas d'IP publique / pas d'IGW) vers la destination
+BLOCKED_BY_SG = 2     # la route existe mais le groupe de sécurité refuse le port
+VERDICTS = {ALLOWED: "allowed", NO_ROUTE: "no-route", BLOCKED_BY_SG: "blocked-by-sg"}
+
+
+# ----------------------------------------------------------------------
+# ------- Trie de plus long préfixe ------------------------------------
+# ----------------------------------------------------------------------
+class RouteTrie:
+    """Trie binaire de préfixes IPv4 : lookup() retourne la cible du plus long préfixe."""
+
+    def __init__(self, routes=()):
+        self._root = [None, None, None]    # [enfant 0, enfant 1, cible]
+        self._routes = []
+        for cidr, target in routes:
+            self.insert(cidr, target)
+
+    def insert(self, cidr, target):
+        network = ipaddress.IPv4Network(cidr)
+        address, length = int(network.network_address), network.prefixlen
+        node = self._root
+        for bit in range(length):
+            branch = (address >> (31 - bit)) & 1
+            if node[branch] is None:
+                node[branch] = [None, None, None]
+            node = node[branch]
+        node[2] = target
+        self._routes.append((address, length, target))
+        self._arrays = None
+
+    def lookup(self, address):
+        """Cible de la route la plus spécifique pour ``address`` (None si aucune)."""
+        address = address if isinstance(address, int) else int(ipaddress.IPv4Address(address))
+        node, best = self._root, self._root[2]
+        for bit in range(32):
+            node = node[(address >> (31 - bit)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+    def targets(self):
+        """Cibles distinctes de la table, dans l'ordre d'insertion."""
+        return list(dict.fromkeys(target for _, _, target in self._routes))
+
+    def lookup_many(self, addresses):
+        """Version vectorisée : indice dans targets() de la cible de chaque adresse (-1 si aucune)."""
+        import numpy as np
+
+        addresses = np.asarray(addresses, dtype=np.int64)
+        result = np.full(len(addresses), -1, dtype=np.int64)
+        resolved = np.zeros(len(addresses), dtype=bool)
+        # Du préfixe le plus long au plus court : la première correspondance gagne
+        for length, networks, codes in self._by_length():
+            mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+            masked = addresses & mask
+            slot = np.clip(np.searchsorted(networks, masked), 0, len(networks) - 1)
+            hit = ~resolved & (networks[slot] == masked)
+            result[hit] = codes[slot[hit]]
+            resolved |= hit
+        return result
+
+    def _by_length(self):
+        # Un tableau trié de réseaux par longueur de préfixe, calculé une seule fois
+        import numpy as np
+
+        if self._arrays is None:
+            codes = {target: index for index, target in enumerate(self.targets())}
+            groups = {}
+            for address, length, target in self._routes:
+                groups.setdefault(length, {})[address] = codes[target]
+            self._arrays = []
+            for length in sorted(groups, reverse=True):
+                networks = sorted(groups[length])
+                self._arrays.append((length, np.array(networks, dtype=np.int64),
+                                     np.array([groups[length][n] for n in networks], dtype=np.int64)))
+        return self._arrays
+
+
+# ----------------------------------------------------------------------
+# ------- Modèle du réseau ---------------------------------------------
+# ----------------------------------------------------------------------
+def _template_dict(template):
+    return template.to_dict() if hasattr(template, "to_dict") else template
+
+
+def _ref(value):
+    return value.get("Ref") if isinstance(value, dict) else None
+
+
+class NetworkModel:
+    """Réseau décrit par un template : sous-réseaux, routes et groupes de sécurité."""
+
+    def __init__(self, template):
+        data = _template_dict(template)
+        resources = data.get("Resources", {})
+        parameters = {name: p.get("Default") for name, p in data.get("Parameters", {}).items()}
+
+        def value(raw):
+            # Les Ref vers un paramètre prennent sa valeur par défaut (templates écrits à la main)
+            name = _ref(raw)
+            return parameters.get(name, raw) if name is not None else raw
+
+        by_type = {}
+        for name, resource in resources.items():
+            by_type.setdefault(resource.get("Type"), []).append((name, resource.get("Properties", {})))
+
+        self.vpc_cidrs = [value(p["CidrBlock"]) for _, p in by_type.get("AWS::EC2::VPC", [])]
+        self.subnets = {}
+        for name, props in by_type.get("AWS::EC2::Subnet", []):
+            self.subnets[name] = {
+                "cidr": ipaddress.IPv4Network(value(props["CidrBlock"])),
+                "public_ip": str(props.get("MapPublicIpOnLaunch", False)).lower() == "true",
+            }
+
+        attached = {_ref(p.get("InternetGatewayId")) for _, p in by_type.get("AWS::EC2::VPCGatewayAttachment", [])}
+        nat_subnets = {name: _ref(p.get("SubnetId")) for name, p in by_type.get("AWS::EC2::NatGateway", [])}
+
+        # Tables de routage : route locale + routes explicites
+        routes = {name: [(cidr, "local") for cidr in self.vpc_cidrs]
+                  for name, _ in by_type.get("AWS::EC2::RouteTable", [])}
+        for _, props in by_type.get("AWS::EC2::Route", []):
+            table = _ref(props.get("RouteTableId"))
+            destination = value(props.get("DestinationCidrBlock"))
+            if table not in routes or not isinstance(destination, str):
+                continue
+            gateway = _ref(props.get("GatewayId"))
+            nat = _ref(props.get("NatGatewayId"))
+            if gateway is not None:
+                target = ("igw", gateway) if gateway in attached else ("detached-igw", gateway)
+            elif nat is not None:
+                target = ("nat", nat)
+            else:
+                target = ("other", None)
+            routes[table].append((destination, target))
+        self.route_tables = {name: RouteTrie(entries) for name, entries in routes.items()}
+        self.route_tables["<main>"] = RouteTrie((cidr, "local") for cidr in self.vpc_cidrs)
+
+        self.subnet_table = {name: "<main>" for name in self.subnets}
+        for _, props in by_type.get("AWS::EC2::SubnetRouteTableAssociation", []):
+            subnet, table = _ref(props.get("SubnetId")), _ref(props.get("RouteTableId"))
+            if subnet in self.subnet_table and table in self.route_tables:
+                self.subnet_table[subnet] = table
+        self.nat_subnets = nat_subnets
+
+        # Groupes de sécurité : index d'entrée par groupe, puis par sous-réseau
+        groups = {name: rules_from_ingress(props.get("SecurityGroupIngress", []))
+                  for name, props in by_type.get("AWS::EC2::SecurityGroup", [])}
+        attached_groups = {name: set() for name in self.subnets}
+        for _, props in by_type.get("AWS::EC2::Instance", []):
+            subnet = _ref(props.get("SubnetId"))
+            if subnet in attached_groups:
+                attached_groups[subnet].update(_ref(g) for g in props.get("SecurityGroupIds", []))
+        self.subnet_rules = {}
+        for subnet, names in attached_groups.items():
+            names = {n for n in names if n in groups} or set(groups)
+            rules = [rule for n in sorted(names) for rule in groups[n]]
+            self.subnet_rules[subnet] = RuleIndex(rules)
+
+        self._subnet_names = sorted(self.subnets, key=lambda n: int(self.subnets[n]["cidr"].network_address))
+
+    # ------------------------------------------------------------------
+    # ------- Requêtes unitaires -----------------------------------------
+    # ------------------------------------------------------------------
+    def route(self, subnet, destination):
+        """Cible de la route utilisée depuis ``subnet`` vers l'adresse ``destination``."""
+        return self.route_tables[self.subnet_table[subnet]].lookup(destination)
+
+    def internet_egress(self, subnet):
+        """Comment ``subnet`` sort vers Internet : "direct", "nat" ou None."""
+        target = self.route(subnet, INTERNET_ADDRESS)
+        if not isinstance(target, tuple):
+            return None
+        if target[0] == "igw":
+            return "direct" if self.subnets[subnet]["public_ip"] else None
+        if target[0] == "nat":
+            nat_subnet = self.nat_subnets.get(target[1])
+            # Le NAT doit lui-même sortir par un IGW depuis son sous-réseau public
+            nat_route = self.route(nat_subnet, INTERNET_ADDRESS) if nat_subnet in self.subnets else None
+            return "nat" if isinstance(nat_route, tuple) and nat_route[0] == "igw" else None
+        return None
+
+    def internet_ingress(self, subnet):
+        """Vrai si une connexion initiée depuis Internet peut atteindre ``subnet`` (routage seul)."""
+        return self.internet_egress(subnet) == "direct"
+
+    def _host(self, subnet):
+        # Première adresse utilisable d'un sous-réseau AWS (les 4 premières sont réservées)
+        return int(self.subnets[subnet]["cidr"].network_address) + 4
+
+    def reachable(self, source, destination, port, protocol="tcp"):
+        """Vrai si ``source`` peut ouvrir une connexion ``protocol``/``port`` vers ``destination``.
+
+        ``source`` et ``destination`` sont des noms de sous-réseaux ou INTERNET.
+        """
+        if destination == INTERNET:
+            return source != INTERNET and self.internet_egress(source) is not None
+        rules = self.subnet_rules[destination]
+        if source == INTERNET:
+            return self.internet_ingress(destination) and rules.allowed(protocol, port, INTERNET_ADDRESS)
+        target = self.route(source, self._host(destination))
+        return target == "local" and rules.allowed(protocol, port, self._host(source))
+
+    def reachability_matrix(self, ports, protocol="tcp"):
+        """Matrice {port: {source: {destination: bool}}} entre sous-réseaux et Internet."""
+        nodes = self._subnet_names + [INTERNET]
+        return {
+            port: {
+                source: {destination: self.reachable(source, destination, port, protocol)
+                         for destination in nodes if destination != source}
+                for source in nodes
+            }
+            for port in ports
+        }
+
+    # ------------------------------------------------------------------
+    # ------- Requêtes vectorisées ---------------------------------------
+    # ------------------------------------------------------------------
+    def locate(self, addresses):
+        """Indice (dans l'ordre des CIDR) du sous-réseau de chaque adresse, -1 hors VPC."""
+        import numpy as np
+
+        addresses = _as_addresses(addresses)
+        starts = np.array([int(self.subnets[n]["cidr"].network_address) for n in self._subnet_names], dtype=np.int64)
+        ends = np.array([int(self.subnets[n]["cidr"].broadcast_address) for n in self._subnet_names], dtype=np.int64)
+        if not len(starts):
+            return np.full(len(addresses), -1, dtype=np.int64)
+        slot = np.searchsorted(starts, addresses, side="right") - 1
+        inside = (slot >= 0) & (addresses <= ends[np.clip(slot, 0, None)])
+        return np.where(inside, slot, -1)
+
+    def evaluate_flows(self, sources, destinations, ports, protocols="tcp"):
+        """Verdict (ALLOWED, NO_ROUTE, BLOCKED_BY_SG) de chaque flux source → destination:port."""
+        import numpy as np
+
+        sources = _as_addresses(sources)
+        destinations = _as_addresses(destinations)
+        ports = np.asarray(ports, dtype=np.int64)
+        if isinstance(protocols, str):
+            protocols = np.full(len(ports), protocols)
+        else:
+            protocols = np.asarray(protocols, dtype=str)
+        src_subnet = self.locate(sources)
+        dst_subnet = self.locate(destinations)
+        verdict = np.full(len(ports), NO_ROUTE, dtype=np.int8)
+
+        names = self._subnet_names
+        egress = np.array([self.internet_egress(n) is not None for n in names] + [False])
+        ingress = np.array([self.internet_ingress(n) for n in names] + [False])
+
+        # 1. Routage depuis chaque sous-réseau source : une recherche vectorisée par table
+        route_kind = np.full(len(ports), 2, dtype=np.int64)
+        for index, name in enumerate(names):
+            mask = src_subnet == index
+            if not mask.any():
+                continue
+            trie = self.route_tables[self.subnet_table[name]]
+            codes = trie.lookup_many(destinations[mask])
+            route_kind[mask] = self._route_kinds(trie)[codes]
+
+        # Vers Internet : il faut une sortie (IGW + IP publique, ou NAT)
+        to_internet = (dst_subnet < 0) & (src_subnet >= 0)
+        verdict[to_internet & (route_kind == 1) & egress[src_subnet]] = ALLOWED
+
+        # Depuis Internet : le sous-réseau destination doit être joignable par l'IGW
+        from_internet = (src_subnet < 0) & (dst_subnet >= 0)
+        routed = from_internet & ingress[dst_subnet]
+        # Entre sous-réseaux : la route locale doit gagner
+        routed |= (src_subnet >= 0) & (dst_subnet >= 0) & (route_kind == 0)
+
+        # 2. Groupes de sécurité du sous-réseau destination
+        for index, name in enumerate(names):
+            mask = routed & (dst_subnet == index)
+            if not mask.any():
+                continue
+            allowed = self.subnet_rules[name].allowed_many(protocols[mask], ports[mask], sources[mask])
+            verdict[mask] = np.where(allowed, ALLOWED, BLOCKED_BY_SG)
+        return verdict
+
+    def _route_kinds(self, trie):
+        # 0 : route locale, 1 : sortie vers Internet (IGW ou NAT), 2 : autre ou aucune route
+        import numpy as np
+
+        kinds = []
+        for target in trie.targets():
+            if target == "local":
+                kinds.append(0)
+            elif isinstance(target, tuple) and target[0] in ("igw", "nat"):
+                kinds.append(1)
+            else:
+                kinds.append(2)
+        # Indice -1 (aucune route) : dernier élément
+        return np.array(kinds + [2], dtype=np.int64)
+
+
+def _as_addresses(addresses):
+    import numpy as np
+
+    addresses = np.asarray(addresses)
+    if addresses.dtype.kind in "iu":
+        return addresses.astype(np.int64)
+    return np.array([int(ipaddress.IPv4Address(a)) for a in addresses], dtype=np.int64)
+
+
+def format_matrix(matrix):
+    """Rendu texte de reachability_matrix() : une grille par port."""
+    lines = []
+    for port, rows in matrix.items():
+        nodes = list(rows)
+        width = max(len(n) for n in nodes)
+        lines.append(f"Port {port}")
+        lines.append(" " * (width + 2) + " ".join(f"{n:>{width}}" for n in nodes))
+        for source in nodes:
+            cells = ["-" if d == source else ("oui" if rows[source][d] else "non") for d in nodes]
+            lines.append(f"{source:<{width}}  " + " ".join(f"{c:>{width}}" for c in cells))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Accessibilité réseau d'un template VPC, sans déploiement")
+    parser.add_argument("template", help="preset (q1, q3_1, q3_2) ou fichier template JSON")
+    parser.add_argument("--ports", type=int, nargs="+", default=[22, 80, 443, 3306, 8080])
+    parser.add_argument("--protocol", default="tcp")
+    parser.add_argument("--flows", type=int, default=0,
+                        help="évalue aussi N flux aléatoires et affiche le temps de la requête vectorisée")
+    args = parser.parse_args(argv)
+
+    from tp4.batch import PRESETS
+
+    if args.template in PRESETS:
+        from tp4.vpc import build_vpc_template
+
+        template = build_vpc_template(PRESETS[args.template])
+    else:
+        with open(args.template) as file:
+            template = json.load(file)
+    model = NetworkModel(template)
+    print(format_matrix(model.reachability_matrix(args.ports, args.protocol)))
+
+    if args.flows:
+        import numpy as np
+
+        rng = np.random.default_rng(0)
+        # Moitié des adresses dans les sous-réseaux, moitié ailleurs sur Internet
+        inside = np.concatenate([
+            rng.integers(int(s["cidr"].network_address), int(s["cidr"].broadcast_address) + 1, args.flows)
+            for s in model.subnets.values()
+        ])
+
+        def pick():
+            return np.where(rng.random(args.flows) < 0.5, rng.choice(inside, args.flows),
+                            rng.integers(0, 2 ** 32, args.flows))
+
+        sources, destinations = pick(), pick()
+        ports = rng.choice(args.ports, args.flows)
+        start = time.perf_counter()
+        verdicts = model.evaluate_flows(sources, destinations, ports, args.protocol)
+        seconds = time.perf_counter() - start
+        counts = np.bincount(verdicts, minlength=len(VERDICTS))
+        print(f"{args.flows} flux évalués en {seconds * 1000:.1f} ms : "
+              + ", ".join(f"{VERDICTS[code]}={count}" for code, count in enumerate(counts)))
+
+
+if __name__ == "__main__":
+    main()
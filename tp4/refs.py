@@ -0,0 +1,164 @@
+"""Références entre ressources d'un template CloudFormation (forme dict).
+
+Une ressource dépend d'une autre quand elle la cite par ``Ref``, ``Fn::GetAtt``
+ou ``${...}`` dans ``Fn::Sub``, ou la nomme dans ``DependsOn``. Ces fonctions
+servent au découpage en piles (tp4/split.py) et à l'analyse du graphe de
+déploiement.
+"""
+import re
+
+# ${Nom} ou ${Nom.Attribut} ; ${!Littéral} n'est pas une référence
+_SUB_TOKEN = re.compile(r"\$\{([^!}][^}]*)\}")
+_NOT_REFERENCES = ("Type", "DependsOn", "Condition", "DeletionPolicy", "UpdateReplacePolicy")
+
+
+def template_dict(template):
+    """Forme dict d'un template (objet troposphere ou dict déjà chargé)."""
+    return template.to_dict() if hasattr(template, "to_dict") else template
+
+
+def _split_getatt(args):
+    if isinstance(args, str):
+        name, _, attribute = args.partition(".")
+        return name, attribute
+    return args[0], args[1]
+
+
+def references(value):
+    """Références (nom, attribut ou None) contenues dans ``value``, dans l'ordre de lecture."""
+    found = []
+    _collect(value, found)
+    return found
+
+
+def _collect(value, found):
+    if isinstance(value, list):
+        for item in value:
+            _collect(item, found)
+        return
+    if not isinstance(value, dict):
+        return
+    if len(value) == 1:
+        (key, args), = value.items()
+        if key == "Ref" and isinstance(args, str):
+            found.append((args, None))
+            return
+        if key == "Fn::GetAtt":
+            name, attribute = _split_getatt(args)
+            found.append((name, attribute))
+            return
+        if key == "Fn::Sub":
+            text, variables = (args, {}) if isinstance(args, str) else (args[0], args[1])
+            for token in _SUB_TOKEN.findall(text):
+                name, _, attribute = token.partition(".")
+                if name not in variables:
+                    found.append((name, attribute or None))
+            _collect(variables, found)
+            return
+    for item in value.values():
+        _collect(item, found)
+
+
+def implicit_dependencies(body):
+    """Noms cités par Ref, Fn::GetAtt ou Fn::Sub dans une ressource, sans les pseudo-paramètres."""
+    # Properties, mais aussi Metadata (cfn-init) et les politiques peuvent citer une ressource
+    return {name for key, value in body.items() if key not in _NOT_REFERENCES
+            for name, _ in references(value) if not name.startswith("AWS::")}
+
+
+def explicit_dependencies(body):
+    """Noms listés dans DependsOn."""
+    depends_on = body.get("DependsOn", [])
+    return {depends_on} if isinstance(depends_on, str) else set(depends_on)
+
+
+def resource_dependencies(body):
+    """Noms cités par une ressource (références et DependsOn), sans les pseudo-paramètres."""
+    return implicit_dependencies(body) | explicit_dependencies(body)
+
+
+def dependency_graph(template):
+    """{ressource: ensemble des ressources dont elle dépend}, restreint aux ressources."""
+    resources = template_dict(template).get("Resources", {})
+    return {name: resource_dependencies(body) & resources.keys() for name, body in resources.items()}
+
+
+def topological_order(graph):
+    """Ordre de création (dépendances d'abord, ordre d'origine sinon) ; ValueError sur un cycle."""
+    order, state = [], {}
+    for root in graph:
+        if root in state:
+            continue
+        # Parcours en profondeur itératif : les templates de flotte dépassent la pile Python
+        stack = [(root, iter(sorted(graph[root])))]
+        state[root] = "en cours"
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                state[node] = "fait"
+                order.append(node)
+            elif state.get(child) == "en cours":
+                raise ValueError(f"dépendance circulaire entre {child} et {node}")
+            elif child not in state and child in graph:
+                state[child] = "en cours"
+                stack.append((child, iter(sorted(graph[child]))))
+    return order
+
+
+def waves(graph):
+    """{ressource: vague}, la vague 0 regroupant les ressources sans dépendance.
+
+    Toutes les ressources d'une même vague peuvent être créées en parallèle.
+    """
+    wave = {}
+    for name in topological_order(graph):
+        wave[name] = max((wave[dep] + 1 for dep in graph[name] if dep in wave), default=0)
+    return wave
+
+
+def rewrite_references(value, replace):
+    """Copie de ``value`` où chaque référence est passée à ``replace(nom, attribut)``.
+
+    ``replace`` retourne None pour garder la référence, ou l'expression qui la
+    remplace (par exemple {"Ref": "Paramètre"} ou {"Fn::ImportValue": ...}).
+    Dans ``Fn::Sub``, un remplacement par ``Ref`` devient ``${Paramètre}``, les
+    autres passent par la table de variables.
+    """
+    if isinstance(value, list):
+        return [rewrite_references(item, replace) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        (key, args), = value.items()
+        if key == "Ref" and isinstance(args, str):
+            return replace(args, None) or value
+        if key == "Fn::GetAtt":
+            return replace(*_split_getatt(args)) or value
+        if key == "Fn::Sub":
+            return _rewrite_sub(args, replace)
+    return {key: rewrite_references(item, replace) for key, item in value.items()}
+
+
+def _rewrite_sub(args, replace):
+    text, variables = (args, {}) if isinstance(args, str) else (args[0], dict(args[1]))
+    variables = {name: rewrite_references(item, replace) for name, item in variables.items()}
+    added = {}
+
+    def token(match):
+        name, _, attribute = match.group(1).partition(".")
+        if name in variables:
+            return match.group(0)
+        expression = replace(name, attribute or None)
+        if expression is None:
+            return match.group(0)
+        if set(expression) == {"Ref"}:
+            return "${" + expression["Ref"] + "}"
+        variable = re.sub(r"[^A-Za-z0-9]", "", match.group(1))
+        added[variable] = expression
+        return "${" + variable + "}"
+
+    text = _SUB_TOKEN.sub(token, text)
+    variables.update(added)
+    return {"Fn::Sub": [text, variables] if variables else text}
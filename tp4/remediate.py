@@ -0,0 +1,367 @@
+"""Corrections automatiques des résultats de tp4/rules.py, appliquées aux objets troposphere.
+
+Beaucoup de résultats de la Q4 ont une « Resolution » mécanique (clé KMS gérée
+par le client sur Q3Trail, validation des journaux, blocs d'accès public sur
+Q3SourceBucket/Q3BackupBucket, etc.). remediate() applique la correction
+enregistrée pour chaque résultat, puis ne réévalue que les ressources touchées
+(et les règles qui lisent leur type, voir Rule.consults). Les évaluations sont
+mémorisées par empreinte des propriétés : une ressource inchangée n'est jamais
+réévaluée. On recommence jusqu'à un point fixe :
+
+    python -m tp4.remediate q3_3 -o Q3_3_remediated.json
+"""
+import argparse
+import hashlib
+import json
+from dataclasses import dataclass, field, replace
+
+from troposphere import GetAtt, Ref, Sub
+
+from tp4.rules import RULES, Finding, TemplateContext, open_admin_ingress, preset_template
+from tp4.vpc import FlowLogSpec, add_flow_logs
+
+
+@dataclass(frozen=True)
+class RemediationSpec:
+    """Paramètres des corrections qui ne se déduisent pas du template."""
+    kms_key_id: object = None               # None : une clé AWS::KMS::Key est ajoutée au template
+    kms_key_name: str = "RemediationKmsKey"
+    admin_cidr: str = None                  # None : AVD-AWS-0107 reste à corriger à la main
+    flow_logs: FlowLogSpec = FlowLogSpec()
+    launch_template_name: str = "ImdsV2LaunchTemplate"
+    root_device: str = "/dev/xvda"          # volume racine de Amazon Linux 2
+
+
+@dataclass(frozen=True)
+class Change:
+    """Correction appliquée : règle visée, ressource, description et ressources touchées."""
+    avdid: str
+    resource: str
+    description: str
+    touched: tuple
+
+
+@dataclass
+class RemediationResult:
+    template: object
+    changes: list
+    remaining: list                         # Finding encore en échec au point fixe
+    evaluations: int = 0                    # règles réellement évaluées
+    cache_hits: int = 0                     # évaluations évitées par la mémoïsation
+    unresolved: set = field(default_factory=set)
+
+
+FIXES = {}      # AVDID -> fonction (template, nom, spec) -> (description, noms touchés) ou None
+
+
+def fix(*avdids):
+    """Décorateur : enregistre une correction pour une ou plusieurs règles."""
+    def register(function):
+        for avdid in avdids:
+            FIXES[avdid] = function
+        return function
+    return register
+
+
+def _add_once(template, resource):
+    # Ressource partagée par plusieurs corrections (clé KMS, launch template)
+    return template.resources.get(resource.title) or template.add_resource(resource)
+
+
+def _kms_key(template, spec):
+    """(valeur à utiliser comme clé KMS, ressources ajoutées)."""
+    if spec.kms_key_id is not None:
+        return spec.kms_key_id, ()
+    from troposphere.kms import Key
+
+    added = () if spec.kms_key_name in template.resources else (spec.kms_key_name,)
+    key = _add_once(template, Key(
+        spec.kms_key_name,
+        Description="Clé gérée par le client (CloudTrail et chiffrement S3)",
+        EnableKeyRotation=True,
+        KeyPolicy={
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    "Sid": "AccountAdministration",
+                    "Effect": "Allow",
+                    "Principal": {"AWS": Sub("arn:aws:iam::${AWS::AccountId}:root")},
+                    "Action": "kms:*",
+                    "Resource": "*"
+                },
+                {
+                    "Sid": "CloudTrailEncryption",
+                    "Effect": "Allow",
+                    "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                    "Action": ["kms:GenerateDataKey*", "kms:DescribeKey"],
+                    "Resource": "*"
+                }
+            ]
+        }
+    ))
+    return GetAtt(key, "Arn"), added
+
+
+# ----------------------------------------------------------------------
+# ------- CloudTrail ---------------------------------------------------
+# ----------------------------------------------------------------------
+@fix("AVD-AWS-0014")
+def _trail_all_regions(template, name, spec):
+    template.resources[name].IsMultiRegionTrail = True
+    return "IsMultiRegionTrail activé", (name,)
+
+
+@fix("AVD-AWS-0015")
+def _trail_customer_key(template, name, spec):
+    key, added = _kms_key(template, spec)
+    template.resources[name].KMSKeyId = key
+    return "KMSKeyId : clé gérée par le client", (name,) + added
+
+
+@fix("AVD-AWS-0016")
+def _trail_log_validation(template, name, spec):
+    template.resources[name].EnableLogFileValidation = True
+    return "EnableLogFileValidation activé", (name,)
+
+
+# ----------------------------------------------------------------------
+# ------- S3 -----------------------------------------------------------
+# ----------------------------------------------------------------------
+@fix("AVD-AWS-0086", "AVD-AWS-0087", "AVD-AWS-0091", "AVD-AWS-0093")
+def _bucket_public_access_block(template, name, spec):
+    from troposphere.s3 import PublicAccessBlockConfiguration
+
+    template.resources[name].PublicAccessBlockConfiguration = PublicAccessBlockConfiguration(
+        BlockPublicAcls=True,
+        IgnorePublicAcls=True,
+        BlockPublicPolicy=True,
+        RestrictPublicBuckets=True
+    )
+    return "PublicAccessBlockConfiguration : tout bloquer", (name,)
+
+
+@fix("AVD-AWS-0088", "AVD-AWS-0132")
+def _bucket_encryption(template, name, spec):
+    from troposphere.s3 import (
+        BucketEncryption,
+        EncryptionConfiguration,
+        ServerSideEncryptionByDefault,
+        ServerSideEncryptionRule,
+        SourceSelectionCriteria,
+        SseKmsEncryptedObjects
+    )
+
+    key, added = _kms_key(template, spec)
+    bucket = template.resources[name]
+    bucket.BucketEncryption = BucketEncryption(
+        ServerSideEncryptionConfiguration=[
+            ServerSideEncryptionRule(
+                ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
+                    SSEAlgorithm="aws:kms",
+                    KMSMasterKeyID=key
+                ),
+                BucketKeyEnabled=True
+            )
+        ]
+    )
+    description = "BucketEncryption : SSE-KMS avec clé gérée par le client"
+    # Un bucket source répliqué doit aussi répliquer les objets chiffrés par KMS
+    replication = bucket.properties.get("ReplicationConfiguration")
+    if replication is not None:
+        for entry in replication.Rules:
+            entry.SourceSelectionCriteria = SourceSelectionCriteria(
+                SseKmsEncryptedObjects=SseKmsEncryptedObjects(Status="Enabled")
+            )
+            entry.Destination.EncryptionConfiguration = EncryptionConfiguration(ReplicaKmsKeyID=key)
+        description += " (objets KMS répliqués)"
+    return description, (name,) + added
+
+
+# ----------------------------------------------------------------------
+# ------- EC2 et VPC ---------------------------------------------------
+# ----------------------------------------------------------------------
+@fix("AVD-AWS-0164")
+def _subnet_public_ip(template, name, spec):
+    template.resources[name].MapPublicIpOnLaunch = False
+    return "MapPublicIpOnLaunch désactivé", (name,)
+
+
+@fix("AVD-AWS-0107")
+def _group_admin_ingress(template, name, spec):
+    if spec.admin_cidr is None:
+        return None
+    changed = 0
+    for entry in template.resources[name].properties.get("SecurityGroupIngress", []):
+        if open_admin_ingress(entry.to_dict()):
+            entry.properties.pop("CidrIpv6", None)
+            entry.CidrIp = spec.admin_cidr
+            changed += 1
+    return f"{changed} règle(s) SSH/RDP restreinte(s) à {spec.admin_cidr}", (name,)
+
+
+@fix("AVD-AWS-0131")
+def _instance_encrypted_devices(template, name, spec):
+    import troposphere.ec2 as ec2
+
+    instance = template.resources[name]
+    mappings = instance.properties.get("BlockDeviceMappings")
+    if not mappings:
+        instance.BlockDeviceMappings = [
+            ec2.BlockDeviceMapping(DeviceName=spec.root_device, Ebs=ec2.EBSBlockDevice(Encrypted=True))
+        ]
+        return f"volume racine {spec.root_device} chiffré", (name,)
+    for mapping in mappings:
+        if "Ebs" in mapping.properties:
+            mapping.Ebs.Encrypted = True
+    return "volumes EBS chiffrés", (name,)
+
+
+@fix("AVD-AWS-0028")
+def _instance_imds_tokens(template, name, spec):
+    import troposphere.ec2 as ec2
+
+    added = () if spec.launch_template_name in template.resources else (spec.launch_template_name,)
+    launch_template = _add_once(template, ec2.LaunchTemplate(
+        spec.launch_template_name,
+        LaunchTemplateData=ec2.LaunchTemplateData(
+            MetadataOptions=ec2.MetadataOptions(HttpEndpoint="enabled", HttpTokens="required")
+        )
+    ))
+    template.resources[name].LaunchTemplate = ec2.LaunchTemplateSpecification(
+        LaunchTemplateId=Ref(launch_template),
+        Version=GetAtt(launch_template, "LatestVersionNumber")
+    )
+    return f"IMDSv2 obligatoire via {spec.launch_template_name}", (name,) + added
+
+
+@fix("AVD-AWS-0178")
+def _vpc_flow_logs(template, name, spec):
+    flow_logs = spec.flow_logs
+    if flow_logs.name in template.resources:
+        flow_logs = replace(flow_logs, name=f"{name}FlowLog")
+    add_flow_logs(template, template.resources[name], flow_logs)
+    return f"flow logs {flow_logs.traffic_type} vers {flow_logs.bucket_arn}", (flow_logs.name,)
+
+
+# ----------------------------------------------------------------------
+# ------- Boucle de correction -----------------------------------------
+# ----------------------------------------------------------------------
+class RuleCache:
+    """Évaluations mémorisées par (règle, ressource, empreinte des propriétés).
+
+    Pour une règle qui lit d'autres types (Rule.consults), l'empreinte couvre
+    aussi les ressources de ces types.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.memo = {}
+        self.digests = {}
+        self.evaluations = 0
+        self.hits = 0
+
+    def refresh(self, names):
+        self.context.refresh(names)
+        for name in names:
+            self.digests.pop(name, None)
+
+    def digest(self, name):
+        found = self.digests.get(name)
+        if found is None:
+            text = json.dumps(self.context.properties(name), sort_keys=True, default=str)
+            found = self.digests[name] = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        return found
+
+    def check(self, name):
+        """{(AVDID, nom): [Finding]} des règles en échec sur ``name``."""
+        failing = {}
+        for entry in RULES.get(self.context.type_of(name), ()):
+            key = (entry.check, name, self.digest(name),
+                   tuple(self.digest(other) for kind in entry.consults for other in self.context.of_type(kind)))
+            messages = self.memo.get(key)
+            if messages is None:
+                self.evaluations += 1
+                messages = self.memo[key] = list(entry.check(name, self.context.properties(name), self.context))
+            else:
+                self.hits += 1
+            for message in messages:
+                failing.setdefault((entry.avdid, name), []).append(Finding(
+                    entry.avdid, entry.severity, entry.title, message, entry.resolution, entry.service,
+                    "template", name))
+        return failing
+
+
+def _affected(context, touched):
+    # Ressources touchées, plus celles dont une règle lit le type d'une ressource touchée
+    names = {name for name in touched if name in context.names()}
+    kinds = {context.type_of(name) for name in names}
+    for resource_type, entries in RULES.items():
+        if any(kind in entry.consults for entry in entries for kind in kinds):
+            names.update(context.of_type(resource_type))
+    return names
+
+
+def remediate(template, spec=RemediationSpec(), max_changes=10_000):
+    """Corrige ``template`` (modifié en place) jusqu'au point fixe ; voir RemediationResult."""
+    context = TemplateContext(template)
+    cache = RuleCache(context)
+    failing = {}
+    for name in list(context.names()):
+        failing.update(cache.check(name))
+
+    changes, tried, unresolved = [], set(), set()
+    while len(changes) < max_changes:
+        pending = next((key for key in failing if key[0] in FIXES and key not in tried), None)
+        if pending is None:
+            break
+        tried.add(pending)
+        avdid, name = pending
+        applied = FIXES[avdid](template, name, spec)
+        if applied is None:
+            unresolved.add(pending)
+            continue
+        description, touched = applied
+        changes.append(Change(avdid, name, description, touched))
+        cache.refresh(touched)
+        for resource in _affected(context, touched):
+            for key in [key for key in failing if key[1] == resource]:
+                del failing[key]
+            failing.update(cache.check(resource))
+        if pending in failing:
+            unresolved.add(pending)     # la correction n'a pas suffi : on ne la rejoue pas
+
+    remaining = [finding for findings in failing.values() for finding in findings]
+    return RemediationResult(template, changes, remaining, cache.evaluations, cache.hits, unresolved)
+
+
+def format_changes(result):
+    lines = [f"{change.avdid} {change.resource} : {change.description}" for change in result.changes]
+    lines.append(f"{len(result.changes)} correction(s), {len(result.remaining)} résultat(s) restant(s) ; "
+                 f"{result.evaluations} évaluation(s) de règles, {result.cache_hits} évitée(s) par le cache")
+    for finding in result.remaining:
+        lines.append(f"  reste {finding.avdid} ({finding.severity}) {finding.resource} : {finding.message}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Corrige automatiquement les mauvaises configurations d'un template")
+    parser.add_argument("preset", help="q1, q2, q3_1, q3_2 ou q3_3")
+    parser.add_argument("-o", "--output", default=None, help="template corrigé (.json ou .yaml)")
+    parser.add_argument("--kms-key-id", default=None, help="clé KMS existante (sinon une clé est ajoutée)")
+    parser.add_argument("--admin-cidr", default=None, help="CIDR autorisé pour SSH/RDP (AVD-AWS-0107)")
+    args = parser.parse_args(argv)
+
+    template = preset_template(args.preset)
+    if template is None:
+        parser.error(f"preset inconnu : {args.preset}")
+    spec = RemediationSpec(kms_key_id=args.kms_key_id, admin_cidr=args.admin_cidr)
+    result = remediate(template, spec)
+    print(format_changes(result))
+    if args.output:
+        text = template.to_yaml() if args.output.endswith((".yaml", ".yml")) else template.to_json()
+        with open(args.output, "w") as file:
+            file.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Rendu texte du rapport du scanner (format de Exercice/Q4/4.1./iac_vulnerability_report.txt).
+
+Le tableau récapitulatif vient de l'index de tp4.report (mis en cache sur
+disque) : il ne relit aucun résultat détaillé. Les sections par cible sont
+produites résultat par résultat, en relisant chaque misconfiguration à sa
+position dans le fichier, et peuvent être filtrées (sévérité, cible) ou
+découpées en pages :
+
+    python -m tp4.render Exercice/Q4/4.2/tp4_vulnerabilities.json --severity MEDIUM HIGH CRITICAL --width 173
+    python -m tp4.render rapport.json --summary-only
+"""
+import argparse
+import shutil
+import sys
+
+from tp4.report import cached_index
+
+SEVERITIES = ("UNKNOWN", "LOW", "MEDIUM", "HIGH", "CRITICAL")
+LEGEND = "Legend:\n- '-': Not scanned\n- '0': Clean (no security findings detected)\n\n"
+_HEADERS = ("Target", "Type", "Vulnerabilities", "Secrets", "Misconfigurations")
+
+
+def _count(result, field):
+    value = result.get(field)
+    return "-" if value is None else str(value)
+
+
+def _misconfigurations(index, result, severities):
+    if result.get("Class") not in (None, "config"):
+        return "-"
+    return str(len(_rows(index, result, severities)))
+
+
+def _rows(index, result, severities):
+    codes = index.columns["severity"].lookup(severities)
+    column = index.columns["severity"].rows
+    return [row for row in result["rows"] if column[row] in codes]
+
+
+def _cell(text, width, left=False):
+    if left:
+        return " " + text.ljust(width) + " "
+    pad = width - len(text)
+    return " " * (pad // 2 + 1) + text + " " * (pad - pad // 2 + 1)
+
+
+def render_summary(index, severities=SEVERITIES, targets=None):
+    """Tableau « Report Summary » et légende."""
+    table = [(result["Target"], result.get("Type", ""), _count(result, "Vulnerabilities"),
+              _count(result, "Secrets"), _misconfigurations(index, result, severities))
+             for result in index.results if targets is None or result["Target"] in targets]
+    widths = [max(len(text) for text in column) for column in zip(_HEADERS, *table)]
+
+    def border(left, middle, right):
+        return left + middle.join("─" * (width + 2) for width in widths) + right + "\n"
+
+    def line(cells, left_first):
+        return "│" + "│".join(_cell(text, width, left_first and i == 0)
+                              for i, (text, width) in enumerate(zip(cells, widths))) + "│\n"
+
+    parts = ["\nReport Summary\n\n", border("┌", "┬", "┐"), line(_HEADERS, False)]
+    for cells in table:
+        parts += [border("├", "┼", "┤"), line(cells, True)]
+    parts += [border("└", "┴", "┘"), LEGEND]
+    return "".join(parts)
+
+
+def render_target_header(result, rows, index, severities):
+    """En-tête d'une cible : titre souligné, tests et décompte par sévérité."""
+    title = f"{result['Target']} ({result.get('Type', '')})"
+    summary = result.get("MisconfSummary") or {}
+    severity_of = index.columns["severity"]
+    counts = dict.fromkeys(severities, 0)
+    for row in rows:
+        counts[severity_of.values[severity_of.rows[row]]] += 1
+    ordered = [severity for severity in SEVERITIES if severity in counts]
+    return (f"\n{title}\n{'=' * len(title)}\n"
+            f"Tests: {summary.get('Successes', 0) + len(rows)} "
+            f"(SUCCESSES: {summary.get('Successes', 0)}, FAILURES: {len(rows)})\n"
+            f"Failures: {len(rows)} (" + ", ".join(f"{severity}: {counts[severity]}" for severity in ordered)
+            + ")\n\n")
+
+
+def _marker(line, position, count):
+    if (line.get("FirstCause") and line.get("LastCause")) or count == 1:
+        return "["
+    if line.get("FirstCause") or position == 0:
+        return "┌"
+    if line.get("LastCause") or position == count - 1:
+        return "└"
+    return "│"
+
+
+def render_finding(finding, target, width):
+    """Section d'un résultat : message, description, lien, puis le code en cause."""
+    single, double = "─" * width + "\r\n", "═" * width + "\r\n"
+    parts = [f"{finding.get('AVDID') or finding.get('ID')} ({finding.get('Severity')}): {finding.get('Message')}\r\n",
+             double, f"{finding.get('Description', '')}\r\n\r\n", f"See {finding.get('PrimaryURL', '')}\r\n", single]
+    cause = finding.get("CauseMetadata") or {}
+    lines = (cause.get("Code") or {}).get("Lines") or []
+    if lines:
+        start, end = cause.get("StartLine", 0), cause.get("EndLine", 0)
+        location = f":{start}-{end}" if end > start else f":{start}" if start > 0 else ""
+        parts.append(f" {target}{location}\r\n")
+        for i, occurrence in enumerate(cause.get("Occurrences") or []):
+            where = occurrence.get("Location") or {}
+            first, last = where.get("StartLine", 0), where.get("EndLine", 0)
+            span = f"{first}-{last}" if first < last else f"{first}"
+            parts.append(f" {' ' * (i + 2)}via {occurrence.get('Filename')}:{span} ({occurrence.get('Resource')})\n")
+        parts.append(single)
+        for i, line in enumerate(lines):
+            if line.get("Truncated"):
+                parts.append(f"{'.' * len(str(line['Number'])):>4}   ")
+            elif line.get("IsCause"):
+                parts.append(f"{line['Number']:4d} {_marker(line, i, len(lines))} ")
+            else:
+                parts.append(f"{line['Number']:4d}   ")
+            parts.append(f"{line.get('Content', '')}\r\n")
+        parts.append(single)
+    parts.append("\r\n\r\n")
+    return "".join(parts)
+
+
+def render(index, file, severities=SEVERITIES, targets=None, width=None, summary_only=False,
+           page=None, page_size=50):
+    """Écrit le rapport dans ``file`` ; les sections ne sont lues qu'au moment de les écrire.
+
+    Avec ``page`` (à partir de 1), seuls les résultats ``page_size`` de cette page
+    sont détaillés, avec l'en-tête de leur cible.
+    """
+    width = width or shutil.get_terminal_size().columns
+    file.write(render_summary(index, severities, targets))
+    if summary_only:
+        return
+    skip = 0 if page is None else (page - 1) * page_size
+    left = None if page is None else page_size
+    for result in index.results:
+        if targets is not None and result["Target"] not in targets:
+            continue
+        rows = _rows(index, result, severities)
+        if not rows:
+            continue
+        if skip >= len(rows):
+            skip -= len(rows)
+            continue
+        selected = rows[skip:] if left is None else rows[skip:skip + left]
+        skip = 0
+        file.write(render_target_header(result, rows, index, severities))
+        for finding in index.iter_details(selected):
+            file.write(render_finding(finding, result["Target"], width))
+        if left is not None:
+            left -= len(selected)
+            if not left:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapport texte (tableaux et extraits de code) d'un rapport JSON du scanner")
+    parser.add_argument("report")
+    parser.add_argument("--severity", nargs="+", choices=SEVERITIES, default=None)
+    parser.add_argument("--target", nargs="+", default=None)
+    parser.add_argument("--summary-only", action="store_true", help="seulement le tableau récapitulatif")
+    parser.add_argument("--page", type=int, default=None, help="page de résultats détaillés (à partir de 1)")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--width", type=int, default=None, help="largeur des séparateurs (terminal par défaut)")
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args(argv)
+
+    severities = tuple(severity for severity in SEVERITIES if severity in (args.severity or SEVERITIES))
+    targets = set(args.target) if args.target else None
+    index = cached_index(args.report)
+    if args.output is None:
+        render(index, sys.stdout, severities, targets, args.width, args.summary_only, args.page, args.page_size)
+        return
+    with open(args.output, "w", encoding="utf-8", newline="") as file:
+        render(index, file, severities, targets, args.width, args.summary_only, args.page, args.page_size)
+
+
+if __name__ == "__main__":
+    main()
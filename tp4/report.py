@@ -0,0 +1,423 @@
+"""Lecture en flux et index des rapports JSON du scanner (Q4.2).
+
+Un rapport (Exercice/Q4/4.2/tp4_vulnerabilities.json) suit la forme
+Results → Misconfigurations → CauseMetadata. Le lecteur ne charge jamais le
+document entier : il avance dans le fichier par blocs et ne décode qu'un
+« misconfiguration » à la fois, donc la mémoire dépend de la taille d'un
+résultat et pas de celle du rapport.
+
+L'index garde une colonne par champ (AVDID, Severity, Target, Resource, type de
+ressource, StartLine/EndLine), avec des chaînes internées (un code entier par
+valeur distincte) et une liste triée de lignes par valeur :
+
+    python -m tp4.report Exercice/Q4/4.2/tp4_vulnerabilities.json --severity HIGH --type AWS::S3::Bucket
+"""
+import argparse
+import hashlib
+import io
+import os
+import pickle
+import re
+import time
+from array import array
+from json import JSONDecodeError, JSONDecoder
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_CHUNK_CHARS = 1 << 20
+# Ligne "Type": "AWS::..." (JSON) ou Type: AWS::... (YAML) d'un extrait de code du rapport
+_TYPE_LINE = re.compile(r'^(\s*)"?Type"?\s*:\s*"?(AWS::\w+::[\w:]+)')
+_INDEX_VERSION = 2      # à incrémenter si la forme de ReportIndex change (cache sur disque)
+
+
+class _Stream:
+    """Curseur sur un fichier JSON texte, rechargé par blocs à la demande."""
+
+    def __init__(self, file, chunk_chars=_CHUNK_CHARS, offset=0):
+        self.file = file
+        self.chunk_chars = chunk_chars
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decode = JSONDecoder().raw_decode
+        # Position en octets de buffer[mark] (le fichier peut contenir de l'UTF-8)
+        self._mark, self._mark_bytes = 0, offset
+
+    def tell(self):
+        """Position courante en octets dans le fichier."""
+        segment = self.buffer[self._mark:self.pos]
+        self._mark_bytes += len(segment) if segment.isascii() else len(segment.encode())
+        self._mark = self.pos
+        return self._mark_bytes
+
+    def _fill(self):
+        if self.eof:
+            return False
+        self.tell()
+        # Lecture au moins aussi grande que le tampon : une valeur énorme reste linéaire
+        text = self.file.read(max(self.chunk_chars, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = self._mark = 0
+        self.eof = not text
+        return bool(text)
+
+    def peek(self):
+        """Prochain caractère significatif, sans le consommer ('' en fin de fichier)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, character):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"JSON invalide : {character!r} attendu, {found!r} trouvé à l'octet {self.tell()}")
+        self.pos += 1
+
+    def value(self):
+        """Décode la valeur JSON suivante (objet, liste ou scalaire) et la consomme."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decode(self.buffer, self.pos)
+            except JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # Un nombre coupé en fin de tampon se décode sans erreur : on recharge
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """Consomme la valeur suivante sans jamais matérialiser un objet ou une liste entière."""
+        opening = self.peek()
+        if opening == "{":
+            for _ in self.keys():
+                self.skip()
+        elif opening == "[":
+            for _ in self.items():
+                self.skip()
+        else:
+            self.value()
+
+    def keys(self):
+        """Clés de l'objet suivant ; l'appelant consomme chaque valeur avant de reprendre."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def items(self):
+        """Éléments de la liste suivante ; l'appelant consomme chaque élément."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def _open(path):
+    # newline="" : pas de conversion de fins de ligne, les positions en octets restent justes
+    return open(path, encoding="utf-8", newline="")
+
+
+_COUNTED = ("Vulnerabilities", "Secrets")
+
+
+def _walk(path, chunk_chars):
+    # (cible, position, misconfiguration) par misconfiguration, puis (cible, None, résumé)
+    # à la fin de chaque résultat : la cible peut suivre la liste dans l'objet
+    with _open(path) as file:
+        stream = _Stream(file, chunk_chars)
+        for key in stream.keys():
+            if key != "Results":
+                stream.skip()
+                continue
+            for _ in stream.items():
+                result = {"Target": None}
+                for field in stream.keys():
+                    if field == "Misconfigurations" and stream.peek() == "[":
+                        for _ in stream.items():
+                            offset = stream.tell()
+                            yield result["Target"], offset, stream.value()
+                    elif field in _COUNTED:
+                        # Seul le nombre d'éléments sert (tableau récapitulatif)
+                        if stream.peek() != "[":
+                            stream.value()      # null
+                            continue
+                        result[field] = 0
+                        for _ in stream.items():
+                            stream.skip()
+                            result[field] += 1
+                    elif field == "MisconfSummary":
+                        result[field] = stream.value()
+                    elif stream.peek() in ("{", "["):
+                        stream.skip()
+                    else:
+                        result[field] = stream.value()
+                yield result["Target"], None, result
+
+
+def iter_misconfigurations(path, chunk_chars=_CHUNK_CHARS):
+    """(cible, position en octets, misconfiguration) pour chaque résultat du rapport.
+
+    La cible vaut None si le résultat ne la déclare qu'après ses misconfigurations.
+    """
+    for target, offset, finding in _walk(path, chunk_chars):
+        if offset is not None:
+            yield target, offset, finding
+
+
+def read_misconfigurations(path, offsets):
+    """Relit les misconfigurations complets qui commencent à ``offsets`` (voir ReportIndex.offsets)."""
+    with open(path, "rb") as raw:
+        for offset in offsets:
+            raw.seek(offset)
+            text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            yield _Stream(text, 1 << 16, offset).value()
+            text.detach()       # le fichier binaire reste ouvert pour la suivante
+
+
+def read_misconfiguration(path, offset):
+    """Relit le misconfiguration complet qui commence à ``offset``."""
+    return next(read_misconfigurations(path, [offset]))
+
+
+# ----------------------------------------------------------------------
+# ------- Index en colonnes --------------------------------------------
+# ----------------------------------------------------------------------
+def resource_type(finding, default=""):
+    """Type CloudFormation de la ressource en cause, lu dans l'extrait de code du misconfiguration.
+
+    La première ligne de l'extrait ouvre la ressource ; seule une ligne ``Type``
+    au niveau de ses attributs compte, pas celle d'une propriété imbriquée (les
+    DataResources d'une CloudTrail). ``default`` si l'extrait, tronqué, ne la montre pas.
+    """
+    lines = ((finding.get("CauseMetadata") or {}).get("Code") or {}).get("Lines") or []
+    contents = [line.get("Content", "") for line in lines if line.get("Content", "").strip()]
+    if len(contents) < 2:
+        return default
+    indent = lambda text: len(text) - len(text.lstrip())
+    depth = min((indent(text) for text in contents[1:] if indent(text) > indent(contents[0])), default=None)
+    for text in contents[1:]:
+        match = _TYPE_LINE.match(text)
+        if match and len(match.group(1)) == depth:
+            return match.group(2)
+    return default
+
+
+class _Column:
+    """Colonne de chaînes internées : un code par ligne et une liste de lignes par valeur."""
+
+    def __init__(self):
+        self.values = []        # code -> chaîne
+        self.codes = {}         # chaîne -> code
+        self.rows = array("I")  # ligne -> code
+        self.postings = []      # code -> lignes triées (array "I")
+
+    def append(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.postings.append(array("I"))
+        self.postings[code].append(len(self.rows))
+        self.rows.append(code)
+
+    def lookup(self, values):
+        """Codes de ``values`` présents dans la colonne."""
+        return {self.codes[value] for value in values if value in self.codes}
+
+
+COLUMNS = ("avdid", "severity", "target", "resource", "resource_type")
+
+
+class ReportIndex:
+    """Index en colonnes d'un rapport, construit en un seul passage en flux."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.columns = {name: _Column() for name in COLUMNS}
+        self.start_lines = array("I")
+        self.end_lines = array("I")
+        self.offsets = array("Q")
+        self.results = []       # un résumé par résultat : Target, Class, Type, MisconfSummary, rows...
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, path, chunk_chars=_CHUNK_CHARS):
+        from tp4.rules import RULES_BY_ID
+
+        index = cls(path)
+        types = {avdid: rule.resource_type for avdid, rule in RULES_BY_ID.items()}
+        pending, late = [], {}
+        for target, offset, finding in _walk(path, chunk_chars):
+            if offset is None:
+                late.update(dict.fromkeys(pending, target or ""))
+                pending = []
+                first = index.results[-1]["rows"].stop if index.results else 0
+                finding.update(Target=target or "", rows=range(first, len(index)))
+                index.results.append(finding)
+                continue
+            if target is None:
+                pending.append(len(index))
+            cause = finding.get("CauseMetadata") or {}
+            avdid = finding.get("AVDID") or finding.get("ID", "")
+            # Le type vient du rapport ; la table des règles ne sert que si l'extrait ne le montre pas
+            index._append(avdid, finding.get("Severity", ""), target or "", cause.get("Resource", ""),
+                          resource_type(finding, types.get(avdid, "")), cause.get("StartLine", 0),
+                          cause.get("EndLine", 0), offset)
+        if late:
+            index._retarget(late)
+        return index
+
+    def _append(self, avdid, severity, target, resource, resource_type, start, end, offset):
+        values = (avdid, severity, target, resource, resource_type)
+        for name, value in zip(COLUMNS, values):
+            self.columns[name].append(value)
+        self.start_lines.append(start)
+        self.end_lines.append(end)
+        self.offsets.append(offset)
+
+    def _retarget(self, late):
+        # Rare : reconstruit la colonne des cibles avec celles connues en fin de résultat
+        old, column = self.columns["target"], _Column()
+        for row, code in enumerate(old.rows):
+            column.append(late.get(row, old.values[code]))
+        self.columns["target"] = column
+
+    def query(self, **filters):
+        """Lignes (triées) dont chaque colonne vaut la valeur, ou l'une des valeurs, demandée.
+
+        >>> index.query(severity="HIGH", resource_type="AWS::S3::Bucket")
+        """
+        wanted = []
+        for name, values in filters.items():
+            if values is None:
+                continue
+            column = self.columns[name]
+            codes = column.lookup([values] if isinstance(values, str) else values)
+            if not codes:
+                return array("I")
+            wanted.append((sum(len(column.postings[code]) for code in codes), column, codes))
+        if not wanted:
+            return array("I", range(len(self)))
+        # La plus courte liste de lignes mène, les autres colonnes ne font que filtrer
+        wanted.sort(key=lambda entry: entry[0])
+        _, column, codes = wanted[0]
+        rows = column.postings[next(iter(codes))] if len(codes) == 1 else \
+            array("I", sorted(row for code in codes for row in column.postings[code]))
+        for _, column, codes in wanted[1:]:
+            codes_of = column.rows
+            rows = array("I", (row for row in rows if codes_of[row] in codes))
+        return rows
+
+    def count(self, **filters):
+        return len(self.query(**filters))
+
+    def facets(self, name, rows=None):
+        """{valeur: nombre de lignes} pour une colonne, éventuellement restreinte à ``rows``."""
+        column = self.columns[name]
+        if rows is None:
+            return {value: len(column.postings[code]) for code, value in enumerate(column.values)
+                    if column.postings[code]}
+        counts = {}
+        for row in rows:
+            value = column.values[column.rows[row]]
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def row(self, row):
+        """Champs indexés d'une ligne."""
+        found = {name: column.values[column.rows[row]] for name, column in self.columns.items()}
+        found.update(start_line=self.start_lines[row], end_line=self.end_lines[row])
+        return found
+
+    def details(self, row):
+        """Misconfiguration complet d'une ligne, relu depuis le fichier."""
+        return read_misconfiguration(self.path, self.offsets[row])
+
+    def iter_details(self, rows):
+        """Misconfigurations complets de ``rows``, relus à la demande avec un seul fichier ouvert."""
+        return read_misconfigurations(self.path, (self.offsets[row] for row in rows))
+
+
+def cached_index(path):
+    """Index de ``path``, relu depuis le cache (dossier reports/) tant que le rapport n'a pas changé."""
+    from tp4.cache import DEFAULT_DIR
+
+    if os.environ.get("TP4_NO_CACHE"):
+        return ReportIndex.build(path)
+    path = os.path.abspath(path)
+    status = os.stat(path)
+    stamp = (path, status.st_size, status.st_mtime_ns, _INDEX_VERSION)
+    directory = os.path.join(os.environ.get("TP4_CACHE_DIR") or DEFAULT_DIR, "reports")
+    cached = os.path.join(directory, hashlib.sha256(path.encode()).hexdigest()[:32] + ".pickle")
+    try:
+        with open(cached, "rb") as file:
+            found, index = pickle.load(file)
+        if found == stamp:
+            return index
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+        pass
+    index = ReportIndex.build(path)
+    os.makedirs(directory, exist_ok=True)
+    partial = f"{cached}.{os.getpid()}.tmp"
+    with open(partial, "wb") as file:
+        pickle.dump((stamp, index), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, cached)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index et requêtes sur un rapport JSON du scanner")
+    parser.add_argument("report")
+    parser.add_argument("--avdid", nargs="+", default=None)
+    parser.add_argument("--severity", nargs="+", default=None)
+    parser.add_argument("--target", nargs="+", default=None)
+    parser.add_argument("--type", nargs="+", default=None, dest="resource_type",
+                        help="type de ressource CloudFormation, ex. AWS::S3::Bucket")
+    parser.add_argument("--limit", type=int, default=50, help="nombre de lignes affichées")
+    args = parser.parse_args(argv)
+
+    began = time.perf_counter()
+    index = cached_index(args.report)
+    built = time.perf_counter() - began
+
+    began = time.perf_counter()
+    rows = index.query(avdid=args.avdid, severity=args.severity, target=args.target,
+                       resource_type=args.resource_type)
+    queried = time.perf_counter() - began
+
+    for row in rows[:args.limit]:
+        entry = index.row(row)
+        print(f"{entry['target']}:{entry['start_line']}-{entry['end_line']}  {entry['avdid']} "
+              f"({entry['severity']})  {entry['resource_type'] or '-'}")
+    if len(rows) > args.limit:
+        print(f"... {len(rows) - args.limit} de plus")
+    print(f"{len(rows)}/{len(index)} résultat(s) ; index en {built * 1000:.1f} ms, "
+          f"requête en {queried * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
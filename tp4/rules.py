@@ -0,0 +1,461 @@
+"""Règles de mauvaise configuration appliquées aux templates, avant sérialisation.
+
+La Q4 passait les fichiers générés à un scanner externe (voir
+Exercice/Q4/4.1./iac_vulnerability_report.txt). Ce module applique les mêmes
+contrôles AVD directement aux objets Template de troposphere, ou à des
+templates déjà chargés (JSON ou YAML) :
+
+- chaque règle est une fonction enregistrée par le décorateur @rule pour un
+  type de ressource ; RULES[type] donne les règles à appliquer, sans parcourir
+  celles des autres types ;
+- une ressource n'est convertie en dict (to_dict() sans validation) que si au
+  moins une règle la concerne, et une seule fois ;
+- un dossier entier est analysé en parallèle (un processus par fichier).
+
+    python -m tp4.rules q1 q3_3 "VPC Security/" --severity HIGH
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+SEVERITIES = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+_ANYWHERE = ("0.0.0.0/0", "::/0")
+_ADMIN_PORTS = (22, 3389)      # SSH et RDP
+_EXTENSIONS = (".json", ".yaml", ".yml", ".template")
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Contrôle AVD appliqué à un type de ressource."""
+    avdid: str
+    resource_type: str
+    severity: str
+    title: str
+    resolution: str
+    service: str
+    check: object       # fonction (nom, propriétés, contexte) -> messages d'échec
+    consults: tuple = ()    # autres types de ressources lus par la règle (via le contexte)
+
+    @property
+    def url(self):
+        return f"https://avd.aquasec.com/misconfig/{self.avdid.lower()}"
+
+
+@dataclass(frozen=True)
+class Finding:
+    """Échec d'une règle sur une ressource."""
+    avdid: str
+    severity: str
+    title: str
+    message: str
+    resolution: str
+    service: str
+    target: str
+    resource: str
+
+
+@dataclass(frozen=True)
+class ScanResult:
+    """Résultat de l'analyse d'un template : ``checks`` couples (règle, ressource) évalués.
+
+    ``error`` est renseigné si le fichier n'a pas pu être lu ; il n'y a alors ni
+    contrôle ni finding.
+    """
+    target: str
+    findings: tuple
+    checks: int
+    seconds: float = 0.0
+    error: str = ""
+
+    @property
+    def failures(self):
+        # Un finding par échec, comme le rapport de la Q4 (une règle peut échouer plusieurs fois par ressource)
+        return len(self.findings)
+
+    @property
+    def successes(self):
+        return self.checks - len({(f.avdid, f.resource) for f in self.findings})
+
+    @property
+    def tests(self):
+        return self.successes + self.failures
+
+    def by_severity(self):
+        counts = dict.fromkeys(SEVERITIES, 0)
+        for finding in self.findings:
+            counts[finding.severity] += 1
+        return counts
+
+
+RULES = {}          # type de ressource -> [Rule]
+RULES_BY_ID = {}    # AVDID -> Rule
+
+
+def rule(avdid, resource_type, severity, title, resolution, service, consults=()):
+    """Décorateur : enregistre ``check(nom, propriétés, contexte)`` pour ``resource_type``.
+
+    La fonction produit (yield) un message par échec ; rien si la ressource est conforme.
+    ``consults`` liste les autres types de ressources que la fonction lit dans le
+    contexte : une modification de l'un d'eux oblige à réévaluer la règle.
+    """
+    def register(check):
+        entry = Rule(avdid, resource_type, severity, title, resolution, service, check, tuple(consults))
+        RULES.setdefault(resource_type, []).append(entry)
+        RULES_BY_ID.setdefault(avdid, entry)
+        return check
+    return register
+
+
+class TemplateContext:
+    """Accès paresseux aux ressources d'un template (objet troposphere ou dict)."""
+
+    def __init__(self, template):
+        self._troposphere = hasattr(template, "resources")
+        self._resources = template.resources if self._troposphere else template.get("Resources", {})
+        self._properties = {}
+        self._by_type = None
+
+    def names(self):
+        return self._resources.keys()
+
+    def type_of(self, name):
+        resource = self._resources[name]
+        return resource.resource_type if self._troposphere else resource.get("Type")
+
+    def properties(self, name):
+        """Propriétés de ``name`` sous forme de dict, converties une seule fois."""
+        found = self._properties.get(name)
+        if found is None:
+            resource = self._resources[name]
+            body = resource.to_dict(validation=False) if self._troposphere else resource
+            found = self._properties[name] = body.get("Properties", {}) or {}
+        return found
+
+    def refresh(self, names):
+        """Oublie les propriétés converties de ``names`` (ressources modifiées ou ajoutées)."""
+        for name in names:
+            self._properties.pop(name, None)
+        self._by_type = None
+
+    def of_type(self, resource_type):
+        """Noms des ressources de ``resource_type``, dans l'ordre du template."""
+        if self._by_type is None:
+            self._by_type = {}
+            for name in self._resources:
+                self._by_type.setdefault(self.type_of(name), []).append(name)
+        return self._by_type.get(resource_type, [])
+
+
+# ----------------------------------------------------------------------
+# ------- Aides --------------------------------------------------------
+# ----------------------------------------------------------------------
+def _true(value):
+    return value is True or (isinstance(value, str) and value.lower() == "true")
+
+
+def _ref(value):
+    return value.get("Ref") if isinstance(value, dict) else None
+
+
+def _port(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def open_admin_ingress(entry):
+    """Vrai si une règle d'entrée (dict) ouvre SSH ou RDP (ou tous les ports) à tout Internet."""
+    if entry.get("CidrIp") not in _ANYWHERE and entry.get("CidrIpv6") not in _ANYWHERE:
+        return False
+    protocol = str(entry.get("IpProtocol", "-1")).lower()
+    if protocol in ("-1", "all"):
+        return True
+    if protocol not in ("tcp", "6"):
+        return False
+    low, high = _port(entry.get("FromPort"), 0), _port(entry.get("ToPort"), 65535)
+    return any(low <= port <= high for port in _ADMIN_PORTS)
+
+
+def _encryption_rules(properties):
+    configuration = (properties.get("BucketEncryption") or {}).get("ServerSideEncryptionConfiguration") or []
+    return [entry.get("ServerSideEncryptionByDefault") or {} for entry in configuration]
+
+
+# ----------------------------------------------------------------------
+# ------- CloudTrail ---------------------------------------------------
+# ----------------------------------------------------------------------
+@rule("AVD-AWS-0014", "AWS::CloudTrail::Trail", "MEDIUM",
+      "Cloudtrail should be enabled in all regions regardless of where your AWS resources are generally homed",
+      "Enable Cloudtrail in all regions", "cloudtrail")
+def _trail_all_regions(name, properties, context):
+    if not _true(properties.get("IsMultiRegionTrail")):
+        yield "Trail is not enabled across all regions."
+
+
+@rule("AVD-AWS-0015", "AWS::CloudTrail::Trail", "HIGH",
+      "CloudTrail should use Customer managed keys to encrypt the logs", "Use Customer managed key", "cloudtrail")
+def _trail_customer_key(name, properties, context):
+    if not properties.get("KMSKeyId"):
+        yield "CloudTrail does not use a customer managed key to encrypt the logs."
+
+
+@rule("AVD-AWS-0016", "AWS::CloudTrail::Trail", "HIGH",
+      "Cloudtrail log validation should be enabled to prevent tampering of log data",
+      "Turn on log validation for Cloudtrail", "cloudtrail")
+def _trail_log_validation(name, properties, context):
+    if not _true(properties.get("EnableLogFileValidation")):
+        yield "Trail does not have log validation enabled."
+
+
+# ----------------------------------------------------------------------
+# ------- S3 -----------------------------------------------------------
+# ----------------------------------------------------------------------
+def _public_access_rule(avdid, setting, title, resolution, missing, disabled):
+    @rule(avdid, "AWS::S3::Bucket", "HIGH", title, resolution, "s3")
+    def check(name, properties, context):
+        block = properties.get("PublicAccessBlockConfiguration")
+        if not block:
+            yield missing
+        elif not _true(block.get(setting)):
+            yield disabled
+    return check
+
+
+_public_access_rule("AVD-AWS-0086", "BlockPublicAcls", "S3 Access block should block public ACL",
+                    "Enable blocking any PUT calls with a public ACL specified",
+                    "No public access block so not blocking public acls",
+                    "Public access block does not block public ACLs")
+_public_access_rule("AVD-AWS-0087", "BlockPublicPolicy", "S3 Access block should block public policy",
+                    "Prevent policies that allow public access being PUT",
+                    "No public access block so not blocking public policies",
+                    "Public access block does not block public policies")
+_public_access_rule("AVD-AWS-0091", "IgnorePublicAcls", "S3 Access Block should Ignore Public ACL",
+                    "Enable ignoring the application of public ACLs in PUT calls",
+                    "No public access block so not blocking public acls",
+                    "Public access block does not ignore public ACLs")
+_public_access_rule("AVD-AWS-0093", "RestrictPublicBuckets",
+                    "S3 Access block should restrict public bucket to limit access",
+                    "Limit the access to public buckets to only the owner or AWS Services (eg; CloudFront)",
+                    "No public access block so not restricting public buckets",
+                    "Public access block does not restrict public buckets")
+
+
+@rule("AVD-AWS-0088", "AWS::S3::Bucket", "HIGH", "Unencrypted S3 bucket.", "Configure bucket encryption", "s3")
+def _bucket_encrypted(name, properties, context):
+    if not any(entry.get("SSEAlgorithm") for entry in _encryption_rules(properties)):
+        yield "Bucket does not have encryption enabled"
+
+
+@rule("AVD-AWS-0132", "AWS::S3::Bucket", "HIGH", "S3 encryption should use Customer Managed Keys",
+      "Enable encryption using customer managed keys", "s3")
+def _bucket_customer_key(name, properties, context):
+    if not any(str(entry.get("SSEAlgorithm", "")).startswith("aws:kms") and entry.get("KMSMasterKeyID")
+               for entry in _encryption_rules(properties)):
+        yield "Bucket does not encrypt data with a customer managed key."
+
+
+# ----------------------------------------------------------------------
+# ------- EC2 et VPC ---------------------------------------------------
+# ----------------------------------------------------------------------
+@rule("AVD-AWS-0028", "AWS::EC2::Instance", "HIGH",
+      "aws_instance should activate session tokens for Instance Metadata Service.",
+      "Enable HTTP token requirement for IMDS", "ec2", consults=("AWS::EC2::LaunchTemplate",))
+def _instance_imds_tokens(name, properties, context):
+    # AWS::EC2::Instance n'a pas de MetadataOptions : il faut passer par un LaunchTemplate
+    launch_template = properties.get("LaunchTemplate") or {}
+    reference = _ref(launch_template.get("LaunchTemplateId")) or _ref(launch_template.get("LaunchTemplateName"))
+    if reference in context.names() and context.type_of(reference) == "AWS::EC2::LaunchTemplate":
+        data = context.properties(reference).get("LaunchTemplateData") or {}
+        if (data.get("MetadataOptions") or {}).get("HttpTokens") == "required":
+            return
+    yield "Instance does not require IMDS access to require a token."
+
+
+@rule("AVD-AWS-0131", "AWS::EC2::Instance", "HIGH", "Instance with unencrypted block device.",
+      "Turn on encryption for all block devices", "ec2")
+def _instance_encrypted_devices(name, properties, context):
+    mappings = properties.get("BlockDeviceMappings") or []
+    if not mappings:
+        yield "Root block device is not encrypted."
+        return
+    for mapping in mappings:
+        if "Ebs" in mapping and not _true((mapping["Ebs"] or {}).get("Encrypted")):
+            yield "EBS block device is not encrypted."
+
+
+@rule("AVD-AWS-0107", "AWS::EC2::SecurityGroup", "HIGH",
+      "Security groups should not allow unrestricted ingress to SSH or RDP from any IP address.",
+      "Set a more restrictive CIDR range", "ec2")
+def _group_admin_ingress(name, properties, context):
+    for entry in properties.get("SecurityGroupIngress") or []:
+        if open_admin_ingress(entry):
+            yield "Security group rule allows unrestricted ingress from any IP address."
+
+
+@rule("AVD-AWS-0107", "AWS::EC2::SecurityGroupIngress", "HIGH",
+      "Security groups should not allow unrestricted ingress to SSH or RDP from any IP address.",
+      "Set a more restrictive CIDR range", "ec2")
+def _ingress_admin(name, properties, context):
+    if open_admin_ingress(properties):
+        yield "Security group rule allows unrestricted ingress from any IP address."
+
+
+@rule("AVD-AWS-0164", "AWS::EC2::Subnet", "HIGH",
+      "Instances in a subnet should not receive a public IP address by default.",
+      "Set the instance to not be publicly accessible", "ec2")
+def _subnet_public_ip(name, properties, context):
+    if _true(properties.get("MapPublicIpOnLaunch")):
+        yield "Subnet associates public IP address."
+
+
+@rule("AVD-AWS-0178", "AWS::EC2::VPC", "MEDIUM", "VPC Flow Logs is not enabled for VPC",
+      "Enable flow logs for VPC", "ec2", consults=("AWS::EC2::FlowLog",))
+def _vpc_flow_logs(name, properties, context):
+    for flow_log in context.of_type("AWS::EC2::FlowLog"):
+        if _ref(context.properties(flow_log).get("ResourceId")) == name:
+            return
+    yield "VPC does not have VPC Flow Logs enabled."
+
+
+# ----------------------------------------------------------------------
+# ------- Analyse ------------------------------------------------------
+# ----------------------------------------------------------------------
+def scan_template(template, target="template"):
+    """Applique les règles à un Template troposphere (ou à sa forme dict)."""
+    began = time.perf_counter()
+    context = TemplateContext(template)
+    findings, checks = [], 0
+    for name in context.names():
+        rules = RULES.get(context.type_of(name))
+        if not rules:
+            continue
+        properties = context.properties(name)
+        for entry in rules:
+            checks += 1
+            for message in entry.check(name, properties, context):
+                findings.append(Finding(entry.avdid, entry.severity, entry.title, message,
+                                        entry.resolution, entry.service, target, name))
+    return ScanResult(target, tuple(findings), checks, time.perf_counter() - began)
+
+
+def load_template(path):
+    """Charge un template JSON ou YAML (balises courtes !Ref, !GetAtt, etc. comprises), voir tp4.loader."""
+    from tp4.loader import parse
+
+    return parse(path)
+
+
+def _scan_file(path):
+    try:
+        template = load_template(path)
+    except Exception as error:
+        # Fichier illisible ou mal formé : signalé, jamais ignoré
+        return ScanResult(path, (), 0, error=f"{type(error).__name__}: {error}")
+    if not isinstance(template, dict) or not isinstance(template.get("Resources"), dict):
+        return None         # rapport JSON, fichier de configuration... : pas un template
+    return scan_template(template, path)
+
+
+def template_files(paths):
+    """Fichiers candidats : les chemins donnés, et le contenu des dossiers (récursif)."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.endswith(_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def scan_paths(paths, workers=None):
+    """Analyse fichiers et dossiers en parallèle ; ignore les fichiers lus qui ne sont pas des templates.
+
+    Un fichier qui ne peut pas être lu donne un ScanResult avec ``error``.
+    """
+    from tp4.batch import available_cpus
+
+    files = list(template_files(paths))
+    workers = min(workers or available_cpus(), max(len(files), 1))
+    if workers == 1:
+        results = map(_scan_file, files)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_scan_file, files, chunksize=max(1, len(files) // (4 * workers))))
+    return [result for result in results if result is not None]
+
+
+def preset_template(name):
+    """Template d'une question (q1, q2, q3_1, q3_2, q3_3), ou None."""
+    from tp4.batch import PRESETS
+    from tp4.s3 import Q2_SPEC, Q3_3_SPEC, build_bucket_template, build_replication_template
+    from tp4.vpc import build_vpc_template
+
+    if name in PRESETS:
+        return build_vpc_template(PRESETS[name])
+    if name == "q2":
+        return build_bucket_template(Q2_SPEC)
+    if name == "q3_3":
+        return build_replication_template(Q3_3_SPEC)
+    return None
+
+
+def format_result(result, severities=SEVERITIES):
+    """Rendu texte d'un ScanResult, dans l'esprit du rapport de la Q4."""
+    if result.error:
+        return "\n".join([result.target, "=" * len(result.target), f"Erreur de lecture : {result.error}"])
+    counts = result.by_severity()
+    lines = [
+        result.target,
+        "=" * len(result.target),
+        f"Tests: {result.tests} (SUCCESSES: {result.successes}, FAILURES: {result.failures})",
+        f"Failures: {len(result.findings)} ("
+        + ", ".join(f"{severity}: {counts[severity]}" for severity in severities) + ")",
+    ]
+    for finding in result.findings:
+        if finding.severity in severities:
+            lines.append(f"  {finding.avdid} ({finding.severity}): {finding.message} [{finding.resource}]")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse de mauvaises configurations des templates CloudFormation")
+    parser.add_argument("paths", nargs="+",
+                        help="presets (q1, q2, q3_1, q3_2, q3_3), fichiers ou dossiers de templates")
+    parser.add_argument("--severity", nargs="+", choices=SEVERITIES, default=None,
+                        help="n'affiche que ces sévérités")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    began = time.perf_counter()
+    results, paths = [], []
+    for path in args.paths:
+        template = preset_template(path)
+        if template is None:
+            paths.append(path)
+        else:
+            results.append(scan_template(template, path))
+    results += scan_paths(paths, args.workers)
+    elapsed = time.perf_counter() - began
+
+    severities = args.severity or SEVERITIES
+    for result in results:
+        print(format_result(result, severities))
+        print()
+    failures = sum(result.failures for result in results)
+    errors = sum(1 for result in results if result.error)
+    rules_time = sum(result.seconds for result in results)
+    print(f"{len(results) - errors} template(s), {failures} échec(s) en {elapsed * 1000:.0f} ms "
+          f"(règles : {rules_time * 1000:.1f} ms)")
+    if errors:
+        print(f"{errors} fichier(s) illisible(s)")
+        return 2
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
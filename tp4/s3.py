@@ -0,0 +1,329 @@
+"""Construction des templates S3 : bucket chiffré (Q2) et réplication + CloudTrail (Q3.3)."""
+from dataclasses import dataclass, replace
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    """Bucket privé, versionné et chiffré avec une clé KMS (Q2)."""
+    description: str = "S3 Security"
+    logical_id: str = "PolystudentS3ImaneQ2TP4"
+    bucket_name: str = "polystudent-q2-tp4"
+    kms_key_id: str = "arn:aws:kms:us-east-1:081743453153:key/0bdfb016-9a1e-43fe-9b7c-d351fa52a535"
+    # S3 Bucket Key : réduit les appels KMS (voir tp4/kms.py pour l'estimer)
+    bucket_key: bool = False
+
+
+@dataclass(frozen=True)
+class ReplicationRule:
+    """Règle de réplication filtrée vers le bucket de backup.
+
+    Seuls les objets sous ``prefix`` et portant tous les ``tags`` ((clé, valeur), ...)
+    sont copiés. ``priority`` départage les règles qui se recouvrent (la plus
+    grande l'emporte) ; sans priorité, l'ordre de déclaration fait foi.
+    ``time_control`` active Replication Time Control (objets répliqués en
+    15 minutes) et ses métriques ; ``metrics`` active seulement les métriques.
+    """
+    rule_id: str
+    prefix: str = ""
+    tags: tuple = ()
+    priority: int = None
+    delete_markers: bool = False
+    time_control: bool = False
+    metrics: bool = False
+    storage_class: str = None
+    enabled: bool = True
+
+
+@dataclass(frozen=True)
+class ReplicationSpec:
+    """Bucket source répliqué vers un bucket de backup, audité par CloudTrail (Q3.3)."""
+    description: str = "TP4 Q3.3 — Réplication + CloudTrail"
+    source_bucket_name: str = "polystudents-ing-groupe14-tp4-q3"
+    backup_bucket_name: str = "polystudents-ing-groupe14-tp4-q3-backup"
+    account_id: str = "625730254292"
+    replication_role_arn: str = "arn:aws:iam::625730254292:role/LabRole"
+    trail_name: str = "groupe14-s3-trail-q3"
+    # Vide : la règle d'origine "ReplicateToBackup" (Prefix="", tous les objets)
+    rules: tuple = ()
+
+
+Q2_SPEC = BucketSpec()
+Q3_3_SPEC = ReplicationSpec()
+
+# Limites de S3 pour une configuration de réplication
+MAX_REPLICATION_RULES = 1000
+RTC_MINUTES = 15
+
+
+def _covers(a, b):
+    # Tout objet sélectionné par b l'est aussi par a
+    return b.prefix.startswith(a.prefix) and set(a.tags) <= set(b.tags)
+
+
+def check_replication_rules(rules):
+    """Vérifie ``rules`` et retourne les règles avec leur priorité résolue.
+
+    Les recouvrements partiels sont permis (la priorité décide), mais une règle
+    entièrement couverte par une règle prioritaire ne s'appliquerait jamais :
+    ValueError, comme pour des identifiants ou des priorités en double.
+    """
+    if not rules or len(rules) > MAX_REPLICATION_RULES:
+        raise ValueError(f"entre 1 et {MAX_REPLICATION_RULES} règles de réplication")
+    if len({rule.rule_id for rule in rules}) != len(rules):
+        raise ValueError("identifiants de règles de réplication en double")
+    given = [rule.priority is not None for rule in rules]
+    if any(given) and not all(given):
+        raise ValueError("priorité à donner pour toutes les règles ou pour aucune")
+    if not any(given):
+        rules = [replace(rule, priority=len(rules) - index) for index, rule in enumerate(rules)]
+    if len({rule.priority for rule in rules}) != len(rules):
+        raise ValueError("priorités de réplication en double")
+
+    for rule in rules:
+        if len(dict(rule.tags)) != len(rule.tags):
+            raise ValueError(f"{rule.rule_id} : clé de tag en double")
+        # S3 refuse de répliquer les marqueurs de suppression d'une règle filtrée par tags
+        if rule.tags and rule.delete_markers:
+            raise ValueError(f"{rule.rule_id} : delete_markers incompatible avec un filtre par tags")
+
+    enabled = sorted((rule for rule in rules if rule.enabled), key=lambda rule: -rule.priority)
+    for index, rule in enumerate(enabled):
+        for stronger in enabled[:index]:
+            if _covers(stronger, rule):
+                raise ValueError(f"{rule.rule_id} est entièrement couverte par {stronger.rule_id} "
+                                 f"(priorité {stronger.priority} > {rule.priority})")
+    return rules
+
+
+def build_bucket_template(spec):
+    """Template de la Q2 : un bucket S3 privé dont le chiffrement utilise KMS."""
+    from troposphere import Template
+    from troposphere.s3 import (
+        Bucket,
+        PublicAccessBlockConfiguration,
+        VersioningConfiguration,
+        BucketEncryption,
+        ServerSideEncryptionRule,
+        ServerSideEncryptionByDefault
+    )
+
+    template = Template()
+    template.set_description(spec.description)
+
+    encryption_rule = ServerSideEncryptionRule(
+        ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
+            SSEAlgorithm="aws:kms",
+            KMSMasterKeyID=spec.kms_key_id
+        )
+    )
+    if spec.bucket_key:
+        encryption_rule.BucketKeyEnabled = True
+
+    template.add_resource(
+        Bucket(
+            spec.logical_id,
+            BucketName=spec.bucket_name,
+            AccessControl="Private",
+
+            PublicAccessBlockConfiguration=PublicAccessBlockConfiguration(
+                BlockPublicAcls=True,
+                IgnorePublicAcls=True,
+                BlockPublicPolicy=True,
+                RestrictPublicBuckets=True
+            ),
+
+            BucketEncryption=BucketEncryption(
+                ServerSideEncryptionConfiguration=[encryption_rule]
+            ),
+
+            VersioningConfiguration=VersioningConfiguration(
+                Status="Enabled"
+            )
+        )
+    )
+    return template
+
+
+def build_replication_template(spec):
+    """Template de la Q3.3 : réplication du bucket source et trail CloudTrail."""
+    from troposphere import Template, Ref
+    from troposphere.s3 import (
+        Bucket,
+        BucketPolicy,
+        VersioningConfiguration,
+        ReplicationConfiguration,
+        ReplicationConfigurationRules,
+        ReplicationConfigurationRulesDestination
+    )
+    from troposphere.cloudtrail import Trail, EventSelector, DataResource
+
+    template = Template()
+    template.set_description(spec.description)
+
+    # ---------------------------------------------------------------------------------------
+    # ------------- 1. Création du bucket source avec la réplication activée ----------------
+    # ---------------------------------------------------------------------------------------
+    # Le versioning est activé car il est obligatoire pour pouvoir utiliser la réplication
+    # S3 (AWS ne permet pas la réplication sur un bucket non versionné).
+    # La règle "ReplicateToBackup" copie automatiquement tous les objets du bucket
+    # source vers le bucket de destination (ARN du bucket backup).
+    # Le rôle IAM spécifié autorise S3 à exécuter la réplication.
+    # Avec spec.rules, chaque règle a son filtre (préfixe, tags), sa priorité et son
+    # traitement des marqueurs de suppression (voir replication_rules()).
+    if spec.rules:
+        rules = replication_rules(spec.rules, spec.backup_bucket_name)
+    else:
+        rules = [
+            ReplicationConfigurationRules(
+                Id="ReplicateToBackup",
+                Status="Enabled",
+                Prefix="",
+                Destination=ReplicationConfigurationRulesDestination(
+                    Bucket=f"arn:aws:s3:::{spec.backup_bucket_name}"
+                )
+            )
+        ]
+    template.add_resource(
+        Bucket(
+            "Q3SourceBucket",
+            BucketName=spec.source_bucket_name,
+            VersioningConfiguration=VersioningConfiguration(Status="Enabled"),
+            ReplicationConfiguration=ReplicationConfiguration(
+                Role=spec.replication_role_arn,
+                Rules=rules
+            )
+        )
+    )
+
+    # ---------------------------------------------------------------------------------------
+    # ------------- 2. Bucket de destination (backup) ---------------------------------------
+    # ---------------------------------------------------------------------------------------
+    # La réplication S3 exige que le bucket cible ait aussi le versioning activé, afin de
+    # conserver l’historique complet des objets répliqués.
+    template.add_resource(
+        Bucket(
+            "Q3BackupBucket",
+            BucketName=spec.backup_bucket_name,
+            VersioningConfiguration=VersioningConfiguration(Status="Enabled")
+        )
+    )
+
+    # -----------------------------------------------------------------------------------------------
+    # --------- 3. Politique du bucket permettant à CloudTrail d’écrire les journaux ----------------
+    # -----------------------------------------------------------------------------------------------
+    # CloudTrail doit pouvoir lire l’ACL du bucket (GetBucketAcl) et déposer des fichiers de logs
+    # (PutObject) dans le dossier AWSLogs/. La condition "bucket-owner-full-control" garantit que
+    # tous les objets écrits dans le bucket restent entièrement contrôlés par le propriétaire.
+    template.add_resource(
+        BucketPolicy(
+            "Q3BackupBucketPolicy",
+            Bucket=Ref("Q3BackupBucket"),
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Effect": "Allow",
+                        "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                        "Action": "s3:GetBucketAcl",
+                        "Resource": f"arn:aws:s3:::{spec.backup_bucket_name}"
+                    },
+                    {
+                        "Effect": "Allow",
+                        "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                        "Action": "s3:PutObject",
+                        "Resource": f"arn:aws:s3:::{spec.backup_bucket_name}/AWSLogs/{spec.account_id}/*",
+                        "Condition": {
+                            "StringEquals": {
+                                "s3:x-amz-acl": "bucket-owner-full-control"
+                            }
+                        }
+                    }
+                ]
+            }
+        )
+    )
+
+    # -----------------------------------------------------------------------------------------------
+    # ------------- 4. Configuration du Trail CloudTrail --------------------------------------------
+    # -----------------------------------------------------------------------------------------------
+    # Les journaux sont stockés dans le bucket de backup. Le trail dépend du bucket et de sa
+    # BucketPolicy pour garantir que l’écriture est autorisée. EventSelector capture toutes les
+    # opérations (lecture/écriture) sur les objets du bucket source.
+    template.add_resource(
+        Trail(
+            "Q3Trail",
+            TrailName=spec.trail_name,
+            DependsOn=["Q3BackupBucket", "Q3BackupBucketPolicy"],
+            S3BucketName=spec.backup_bucket_name,
+            IncludeGlobalServiceEvents=True,
+            IsLogging=True,
+            EventSelectors=[
+                EventSelector(
+                    ReadWriteType="All",
+                    DataResources=[
+                        DataResource(
+                            Type="AWS::S3::Object",
+                            Values=[f"arn:aws:s3:::{spec.source_bucket_name}/*"]
+                        )
+                    ]
+                )
+            ]
+        )
+    )
+    return template
+
+
+def replication_rules(rules, backup_bucket_name):
+    """Règles troposphere (schéma Filter/Priority) pour des ReplicationRule vérifiées."""
+    from troposphere.s3 import (
+        DeleteMarkerReplication,
+        Metrics,
+        ReplicationConfigurationRules,
+        ReplicationConfigurationRulesDestination,
+        ReplicationRuleAndOperator,
+        ReplicationRuleFilter,
+        ReplicationTime,
+        ReplicationTimeValue,
+        TagFilter
+    )
+
+    built = []
+    for rule in check_replication_rules(rules):
+        tags = [TagFilter(Key=key, Value=value) for key, value in rule.tags]
+        if not tags:
+            rule_filter = ReplicationRuleFilter(Prefix=rule.prefix)
+        elif len(tags) == 1 and not rule.prefix:
+            rule_filter = ReplicationRuleFilter(TagFilter=tags[0])
+        else:
+            # Préfixe et tags, ou plusieurs tags : opérateur And
+            operator = ReplicationRuleAndOperator(TagFilters=tags)
+            if rule.prefix:
+                operator.Prefix = rule.prefix
+            rule_filter = ReplicationRuleFilter(And=operator)
+
+        destination = ReplicationConfigurationRulesDestination(Bucket=f"arn:aws:s3:::{backup_bucket_name}")
+        if rule.storage_class:
+            destination.StorageClass = rule.storage_class
+        # RTC exige les métriques de réplication avec le même seuil
+        if rule.time_control:
+            destination.ReplicationTime = ReplicationTime(
+                Status="Enabled", Time=ReplicationTimeValue(Minutes=RTC_MINUTES)
+            )
+        if rule.time_control or rule.metrics:
+            destination.Metrics = Metrics(
+                Status="Enabled", EventThreshold=ReplicationTimeValue(Minutes=RTC_MINUTES)
+            )
+
+        built.append(
+            ReplicationConfigurationRules(
+                Id=rule.rule_id,
+                Status="Enabled" if rule.enabled else "Disabled",
+                Priority=rule.priority,
+                Filter=rule_filter,
+                DeleteMarkerReplication=DeleteMarkerReplication(
+                    Status="Enabled" if rule.delete_markers else "Disabled"
+                ),
+                Destination=destination
+            )
+        )
+    return built
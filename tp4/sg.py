@@ -0,0 +1,291 @@
+"""Compaction des règles de groupes de sécurité et index de correspondance rapide.
+
+Une règle est un tuple (protocole, port de début, port de fin, CIDR source), comme
+DEFAULT_SG_RULES dans tp4/vpc.py. Le protocole "-1" couvre tous les protocoles
+et tous les ports. Pour ICMP (et ICMPv6), FromPort est le type et ToPort le
+code, -1 valant « tous » ; les autres protocoles que TCP et UDP n'ont pas de ports.
+
+- compact_rules() fusionne les plages de ports TCP/UDP contiguës ou qui se
+  chevauchent et les CIDR adjacents, puis retire les règles couvertes par une
+  autre (pour ICMP : doublons exacts, ou règle de type ou de code -1). Le
+  résultat autorise exactement les mêmes flux avec moins de règles (la limite
+  AWS par groupe est vite atteinte).
+- RuleIndex répond à « ce protocole/port/source est-il autorisé ? » en
+  O(log n) grâce à des segments de ports précalculés, et évalue des millions de
+  flux d'un coup avec NumPy (allowed_many()).
+"""
+import ipaddress
+from bisect import bisect_right
+
+_PROTOCOLS = {"6": "tcp", "17": "udp", "1": "icmp", "58": "icmpv6", "all": "-1"}
+_ALL = "-1"
+_PORTS = ("tcp", "udp")             # seuls protocoles dont FromPort/ToPort sont des ports
+_ICMP = ("icmp", "icmpv6")          # FromPort : type, ToPort : code
+_KEYS = 65535                       # axe commun : ports, ou type * 256 + code pour ICMP
+
+
+def normalize_protocol(protocol):
+    """Nom canonique d'un protocole : "tcp", "udp", "icmp", "-1" ou son numéro."""
+    protocol = str(protocol).lower()
+    return _PROTOCOLS.get(protocol, protocol)
+
+
+def _normalize(rule):
+    protocol, from_port, to_port, cidr = rule
+    protocol = normalize_protocol(protocol)
+    if protocol == _ALL:
+        from_port, to_port = 0, 65535
+    return protocol, int(from_port), int(to_port), ipaddress.IPv4Network(cidr)
+
+
+def _key_range(protocol, from_port, to_port):
+    # Plage couverte sur l'axe des clés : ports TCP/UDP, (type, code) ICMP, tout l'axe sinon
+    if protocol in _PORTS:
+        return from_port, to_port
+    if protocol in _ICMP and from_port != -1:
+        if to_port == -1:
+            return from_port * 256, from_port * 256 + 255
+        return from_port * 256 + to_port, from_port * 256 + to_port
+    return 0, _KEYS
+
+
+def _query_key(protocol, port, code):
+    if protocol in _PORTS:
+        return port
+    if protocol in _ICMP:
+        return port * 256 + code
+    return 0
+
+
+def rules_from_ingress(ingress):
+    """Convertit une liste SecurityGroupIngress (objets troposphere ou dicts) en tuples.
+
+    Les règles sans CidrIp (groupe source, liste de préfixes, IPv6) sont ignorées.
+    """
+    rules = []
+    for entry in ingress:
+        entry = entry.to_dict() if hasattr(entry, "to_dict") else entry
+        if "CidrIp" not in entry or not isinstance(entry["CidrIp"], str):
+            continue
+        rules.append((entry["IpProtocol"], entry.get("FromPort", -1), entry.get("ToPort", -1), entry["CidrIp"]))
+    return rules
+
+
+# ----------------------------------------------------------------------
+# ------- Compaction ---------------------------------------------------
+# ----------------------------------------------------------------------
+def compact_rules(rules):
+    """Ensemble de règles équivalent et minimal (fusion gloutonne jusqu'au point fixe).
+
+    L'ordre de sortie suit la première règle d'origine de chaque règle fusionnée :
+    un ensemble déjà compact est retourné tel quel, dans le même ordre.
+    """
+    # Chaque règle garde le rang de la première règle d'origine qu'elle représente
+    current = [(rank, *_normalize(rule)) for rank, rule in enumerate(rules)]
+    while True:
+        merged = _drop_covered(_merge_ports(_merge_cidrs(current)))
+        if len(merged) == len(current):
+            break
+        current = merged
+    current.sort()
+    return [(protocol, -1, -1, str(cidr)) if protocol == _ALL else (protocol, from_port, to_port, str(cidr))
+            for _, protocol, from_port, to_port, cidr in current]
+
+
+def _merge_cidrs(rules):
+    # Même protocole et même plage de ports : les CIDR adjacents sont regroupés
+    groups = {}
+    for rank, protocol, from_port, to_port, cidr in rules:
+        groups.setdefault((protocol, from_port, to_port), []).append((rank, cidr))
+    merged = []
+    for (protocol, from_port, to_port), members in groups.items():
+        if len(members) == 1:
+            rank, cidr = members[0]
+            merged.append((rank, protocol, from_port, to_port, cidr))
+            continue
+        for cidr in ipaddress.collapse_addresses(cidr for _, cidr in members):
+            rank = min(r for r, member in members if member.subnet_of(cidr))
+            merged.append((rank, protocol, from_port, to_port, cidr))
+    return merged
+
+
+def _merge_ports(rules):
+    # Même protocole et même CIDR : les plages de ports contiguës sont fusionnées.
+    # Type et code ICMP ne sont pas des plages : ces règles passent telles quelles.
+    groups = {}
+    merged = []
+    for rank, protocol, from_port, to_port, cidr in rules:
+        if protocol in _PORTS:
+            groups.setdefault((protocol, cidr), []).append((from_port, to_port, rank))
+        else:
+            merged.append((rank, protocol, from_port, to_port, cidr))
+    for (protocol, cidr), ranges in groups.items():
+        ranges.sort()
+        start, end, rank = ranges[0]
+        for from_port, to_port, other_rank in ranges[1:]:
+            if from_port <= end + 1:
+                end = max(end, to_port)
+                rank = min(rank, other_rank)
+            else:
+                merged.append((rank, protocol, start, end, cidr))
+                start, end, rank = from_port, to_port, other_rank
+        merged.append((rank, protocol, start, end, cidr))
+    return merged
+
+
+def _drop_covered(rules):
+    # Une règle incluse dans une autre (même protocole ou "-1", plage de clés et CIDR
+    # inclus) n'autorise rien de plus : on la retire. Les groupes de sécurité ont au
+    # plus quelques centaines de règles, la comparaison deux à deux reste négligeable.
+    kept = []
+    ranged = [(rule, _key_range(*rule[1:4])) for rule in rules]
+    ranged.sort(key=lambda item: (item[0][4].prefixlen, item[1][0] - item[1][1], item[0][1] != _ALL, item[0][0]))
+    for rule, (low, high) in ranged:
+        protocol, cidr = rule[1], rule[4]
+        if any(
+            (other[1] == protocol or other[1] == _ALL)
+            and other_low <= low and high <= other_high
+            and cidr.subnet_of(other[4])
+            for other, (other_low, other_high) in kept
+        ):
+            continue
+        kept.append((rule, (low, high)))
+    return [rule for rule, _ in kept]
+
+
+# ----------------------------------------------------------------------
+# ------- Index de correspondance --------------------------------------
+# ----------------------------------------------------------------------
+class RuleIndex:
+    """Index précalculé des flux autorisés par un ensemble de règles d'entrée.
+
+    Pour chaque protocole, l'axe des ports est coupé en segments élémentaires
+    (les bornes de toutes les règles) ; chaque segment garde la liste triée et
+    fusionnée des plages d'adresses sources autorisées. Une requête fait une
+    recherche dichotomique sur les segments puis une sur les adresses. Pour ICMP,
+    l'axe des ports est celui des couples (type, code), en type * 256 + code.
+    """
+
+    def __init__(self, rules):
+        by_protocol = {}
+        for protocol, from_port, to_port, cidr in map(_normalize, rules):
+            first = int(cidr.network_address)
+            low, high = _key_range(protocol, from_port, to_port)
+            by_protocol.setdefault(protocol, []).append((low, high, first, first + cidr.num_addresses - 1))
+        self._segments = {protocol: _segments(entries) for protocol, entries in by_protocol.items()}
+        self._arrays = None
+
+    def allowed(self, protocol, port, source, code=0):
+        """Vrai si un paquet ``protocol``/``port`` venant de ``source`` est autorisé.
+
+        Pour ICMP, ``port`` est le type et ``code`` le code du message.
+        """
+        protocol = normalize_protocol(protocol)
+        address = source if isinstance(source, int) else int(ipaddress.IPv4Address(source))
+        port = _query_key(protocol, port, code)
+        for candidate in (protocol, _ALL) if protocol != _ALL else (_ALL,):
+            segments = self._segments.get(candidate)
+            if segments is None:
+                continue
+            starts, ends, ranges = segments
+            position = bisect_right(starts, port) - 1
+            if position < 0 or port > ends[position]:
+                continue
+            range_starts, range_ends = ranges[position]
+            slot = bisect_right(range_starts, address) - 1
+            if slot >= 0 and address <= range_ends[slot]:
+                return True
+        return False
+
+    def allowed_many(self, protocols, ports, sources, codes=0):
+        """Version vectorisée de allowed() : retourne un tableau NumPy de booléens.
+
+        ``protocols`` est une séquence de noms (ou un seul nom pour tous les flux),
+        ``ports`` des entiers (types pour ICMP, de codes ``codes``) et ``sources``
+        des adresses entières (uint32) ou texte.
+        """
+        import numpy as np
+
+        ports = np.asarray(ports, dtype=np.int64)
+        codes = np.broadcast_to(np.asarray(codes, dtype=np.int64), ports.shape)
+        sources = _addresses(sources)
+        if isinstance(protocols, str):
+            protocols = np.full(len(ports), normalize_protocol(protocols))
+        else:
+            # On ne normalise que les valeurs distinctes (quelques-unes pour des millions de flux)
+            values, inverse = np.unique(np.asarray(protocols, dtype=str), return_inverse=True)
+            protocols = np.array([normalize_protocol(value) for value in values])[inverse]
+        # Clé de chaque flux sur l'axe de son protocole (voir _query_key)
+        icmp = np.isin(protocols, _ICMP)
+        ports = np.where(np.isin(protocols, _PORTS), ports, np.where(icmp, ports * 256 + codes, 0))
+        result = np.zeros(len(ports), dtype=bool)
+        for protocol, (seg_starts, seg_ends, keys_start, keys_end) in self._numpy_arrays().items():
+            mask = np.ones(len(ports), dtype=bool) if protocol == _ALL else protocols == protocol
+            if not mask.any():
+                continue
+            result[mask] |= _match(ports[mask], sources[mask], seg_starts, seg_ends, keys_start, keys_end)
+        return result
+
+    def _numpy_arrays(self):
+        # Les segments sont aplatis en clés (segment << 32 | adresse) triées :
+        # une seule recherche searchsorted par protocole pour tous les flux
+        if self._arrays is None:
+            import numpy as np
+
+            self._arrays = {}
+            for protocol, (starts, ends, ranges) in self._segments.items():
+                keys_start, keys_end = [], []
+                for position, (range_starts, range_ends) in enumerate(ranges):
+                    keys_start.extend((position << 32) | first for first in range_starts)
+                    keys_end.extend((position << 32) | last for last in range_ends)
+                self._arrays[protocol] = (
+                    np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+                    np.array(keys_start, dtype=np.int64), np.array(keys_end, dtype=np.int64),
+                )
+        return self._arrays
+
+
+def _segments(entries):
+    # Balayage des bornes de ports : chaque segment élémentaire reçoit les plages
+    # d'adresses des règles actives, fusionnées et triées.
+    bounds = sorted({from_port for from_port, _, _, _ in entries} | {to_port + 1 for _, to_port, _, _ in entries})
+    starts, ends, ranges = [], [], []
+    for low, high in zip(bounds, bounds[1:]):
+        active = sorted((first, last) for from_port, to_port, first, last in entries
+                        if from_port <= low and high - 1 <= to_port)
+        if not active:
+            continue
+        range_starts, range_ends = [], []
+        for first, last in active:
+            if range_ends and first <= range_ends[-1] + 1:
+                range_ends[-1] = max(range_ends[-1], last)
+            else:
+                range_starts.append(first)
+                range_ends.append(last)
+        starts.append(low)
+        ends.append(high - 1)
+        ranges.append((range_starts, range_ends))
+    return starts, ends, ranges
+
+
+def _addresses(sources):
+    import numpy as np
+
+    sources = np.asarray(sources)
+    if sources.dtype.kind in "iu":
+        return sources.astype(np.int64)
+    return np.array([int(ipaddress.IPv4Address(s)) for s in sources], dtype=np.int64)
+
+
+def _match(ports, sources, seg_starts, seg_ends, keys_start, keys_end):
+    import numpy as np
+
+    position = np.searchsorted(seg_starts, ports, side="right") - 1
+    valid = position >= 0
+    position = np.where(valid, position, 0)
+    valid &= ports <= seg_ends[position]
+    keys = (position << 32) | sources
+    slot = np.searchsorted(keys_start, keys, side="right") - 1
+    valid &= slot >= 0
+    slot = np.where(slot >= 0, slot, 0)
+    return valid & (keys <= keys_end[slot])
@@ -0,0 +1,674 @@
+"""Découpage automatique en piles d'un template qui dépasse les limites CloudFormation.
+
+Un template de flotte (beaucoup d'instances et d'alarmes, voir
+ComputeSpec.instances_per_subnet) dépasse vite les 500 ressources ou la taille
+maximale d'un template. split_template() :
+
+1. mesure la taille JSON de chaque ressource une seule fois (TemplateSize tient
+   le total à jour entrée par entrée, sans sérialiser le template entier) ;
+   build_vpc_template() relève dict et taille de chaque entrée à son ajout
+   (TemplateRecord) et refuse de dépasser les limites, build_vpc_stacks()
+   découpe à partir de ces dicts ;
+2. regroupe les ressources qui vont ensemble (une alarme et son instance) et
+   place les groupes dans l'ordre topologique : d'abord dans la pile parente,
+   puis dans des piles filles qui ne dépendent, autant que possible, que de la
+   parente. Les filles se déploient alors toutes en parallèle ;
+3. recâble les références d'une pile à l'autre : paramètres et sorties
+   ``Outputs.X`` pour des piles imbriquées (``mode="nested"``), ou
+   Export/``Fn::ImportValue`` pour des piles liées (``mode="linked"``).
+
+    python -m tp4.split q3_2 --instances-per-subnet 300 --output-dir stacks/
+"""
+import argparse
+import json
+import os
+import re
+from dataclasses import dataclass, field, replace
+
+from tp4.refs import dependency_graph, references, rewrite_references, template_dict, topological_order
+
+_SECTIONS = ("Parameters", "Resources", "Outputs")
+_JSON = {"indent": 1, "sort_keys": True, "separators": (",", ": ")}    # comme Template.to_json()
+_STACK_TYPE = "AWS::CloudFormation::Stack"
+# Les piles filles sont déposées dans le bucket de la Q2
+TEMPLATE_URL = "https://polystudent-q2-tp4.s3.amazonaws.com/stacks/{name}"
+
+
+@dataclass(frozen=True)
+class StackLimits:
+    """Limites d'une pile CloudFormation.
+
+    ``fill`` est la part des limites de ressources et d'octets que le placement
+    s'autorise : le reste absorbe les paramètres et sorties ajoutés par le
+    recâblage et les ressources AWS::CloudFormation::Stack de la pile parente.
+    """
+    max_resources: int = 500
+    max_bytes: int = 1_000_000        # 1 Mo via S3 (TemplateURL), obligatoire pour les piles imbriquées
+    max_parameters: int = 200
+    max_outputs: int = 200
+    fill: float = 0.95
+
+
+# ----------------------------------------------------------------------
+# ------- Estimation de taille -----------------------------------------
+# ----------------------------------------------------------------------
+def entry_size(name, body):
+    """Octets de ``"name": body`` dans une section de to_json() (profondeur 2)."""
+    # json.dumps avec indent passe par l'encodeur Python, dix fois plus lent que
+    # l'encodeur C : on mesure la forme compacte et on ajoute l'indentation.
+    compact = json.dumps(body, separators=_JSON["separators"])
+    return 4 + len(json.dumps(name)) + len(compact) + _indentation(body, 2)
+
+
+def _indentation(value, depth):
+    # Chaque élément d'un conteneur non vide est précédé de "\n" + (depth + 1)
+    # espaces, et le crochet fermant de "\n" + depth espaces
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, list):
+        items = value
+    else:
+        return 0
+    if not items:
+        return 0
+    return len(items) * (depth + 2) + depth + 1 + sum(_indentation(item, depth + 1) for item in items)
+
+
+class TemplateSize:
+    """Taille exacte de to_json() et nombre d'entrées, tenus à jour entrée par entrée.
+
+    Chaque entrée est sérialisée une seule fois, à son ajout : on suit un
+    template de flotte pendant sa construction sans jamais le sérialiser en
+    entier. ``other`` regroupe les sections qui ne changent pas (Description,
+    Mappings, Conditions...).
+    """
+
+    def __init__(self, other=None):
+        other = other or {}
+        text = json.dumps(other, **_JSON)
+        self._other_keys = len(other)
+        # Un dict racine de k clés s'écrit "{\n" + entrées jointes par ",\n" + "\n}"
+        self._other_bytes = len(text) - 4 - 2 * (len(other) - 1) if other else 0
+        self.counts = dict.fromkeys(_SECTIONS, 0)
+        self._bytes = dict.fromkeys(_SECTIONS, 0)
+
+    @classmethod
+    def of(cls, template, sizes=None):
+        """Taille de ``template`` ; ``sizes`` ({ressource: octets}) évite de remesurer ces ressources."""
+        data = template_dict(template)
+        sizes = sizes or {}
+        size = cls({key: value for key, value in data.items() if key not in _SECTIONS})
+        for section in _SECTIONS:
+            for name, body in data.get(section, {}).items():
+                size.add(section, name, body, sizes.get(name) if section == "Resources" else None)
+        return size
+
+    def add(self, section, name=None, body=None, size=None):
+        """Ajoute une entrée ; ``size`` évite de la resérialiser si elle est déjà connue."""
+        size = entry_size(name, body) if size is None else size
+        self.counts[section] += 1
+        self._bytes[section] += size
+        return size
+
+    def remove(self, section, size):
+        self.counts[section] -= 1
+        self._bytes[section] -= size
+
+    @property
+    def resources(self):
+        return self.counts["Resources"]
+
+    @property
+    def bytes(self):
+        keys, total = self._other_keys, self._other_bytes
+        for section in _SECTIONS:
+            count = self.counts[section]
+            if count == 0 and section != "Resources":
+                continue        # troposphere n'écrit que la section Resources quand elle est vide
+            keys += 1
+            if count == 0:
+                total += len(json.dumps(section)) + 5
+            else:
+                total += len(json.dumps(section)) + self._bytes[section] + 2 * count + 6
+        return 2 if keys == 0 else 4 + total + 2 * (keys - 1)
+
+    def within(self, limits):
+        return (self.resources <= limits.max_resources and self.bytes <= limits.max_bytes
+                and self.counts["Parameters"] <= limits.max_parameters
+                and self.counts["Outputs"] <= limits.max_outputs)
+
+
+# Clés de Template.to_dict(), dans son ordre : (clé, attribut du Template ou None pour une section)
+_FRAME = (
+    ("Description", "description"), ("Metadata", "metadata"), ("Conditions", "conditions"),
+    ("Mappings", "mappings"), ("Outputs", None), ("Parameters", None), ("AWSTemplateFormatVersion", "version"),
+    ("Transform", "transform"), ("Rules", "rules"), ("Globals", "globals"), ("Resources", None),
+)
+_ATTRIBUTES = {"Parameters": "parameters", "Resources": "resources", "Outputs": "outputs"}
+
+
+class TemplateRecord:
+    """Forme dict et taille des entrées d'un Template troposphere, relevées pendant sa construction.
+
+    Chaque entrée est convertie (to_dict()) et mesurée une seule fois, à son
+    enregistrement : le nombre de ressources et la taille de to_json() sont
+    connus à tout moment sans sérialiser le template, et split_template()
+    réutilise ces dicts. Avec ``limits``, l'entrée qui ferait dépasser une
+    limite est refusée (ValueError) avant d'être ajoutée au template.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits
+        self.size = None
+        self.entries = {section: {} for section in _SECTIONS}     # nom -> (dict, octets)
+
+    def sync(self, template):
+        """Enregistre les entrées de ``template`` ajoutées sans passer par add() (add_resource()...)."""
+        if self.size is None:
+            self.size = TemplateSize(self._frame(template))
+        for section, attribute in _ATTRIBUTES.items():
+            objects, known = getattr(template, attribute), self.entries[section]
+            if len(objects) != len(known):
+                for name, entry in objects.items():
+                    if name not in known:
+                        self.add(section, name, entry.to_dict())
+        return self
+
+    def add(self, section, name, body):
+        """Enregistre une entrée ; ValueError si elle fait dépasser ``limits``."""
+        size = self.size.add(section, name, body)
+        if self.limits is not None and not self.size.within(self.limits):
+            self.size.remove(section, size)
+            raise ValueError(f"{name} : le template dépasserait les limites d'une pile "
+                             f"({self.limits.max_resources} ressources, {self.limits.max_bytes} octets), "
+                             "à découper avec tp4.vpc.build_vpc_stacks() ou python -m tp4.split")
+        self.entries[section][name] = (body, size)
+
+    @property
+    def sizes(self):
+        """{ressource: octets} des ressources enregistrées."""
+        return {name: size for name, (_, size) in self.entries["Resources"].items()}
+
+    def data(self, template):
+        """Équivalent de template.to_dict(), assemblé à partir des entrées enregistrées."""
+        self.sync(template)
+        frame = self._frame(template)
+        data = {}
+        for key, attribute in _FRAME:
+            if attribute is not None:
+                if key in frame:
+                    data[key] = frame[key]
+                continue
+            entries = self.entries[key]
+            if entries or key == "Resources":
+                data[key] = {name: entries[name][0] for name in getattr(template, _ATTRIBUTES[key])}
+        return data
+
+    @staticmethod
+    def _frame(template):
+        # Sections hors Parameters/Resources/Outputs : quelques clés, converties à chaque appel
+        from troposphere import encode_to_dict
+
+        return {key: encode_to_dict(getattr(template, attribute)) for key, attribute in _FRAME
+                if attribute is not None and getattr(template, attribute)}
+
+
+# ----------------------------------------------------------------------
+# ------- Placement ----------------------------------------------------
+# ----------------------------------------------------------------------
+def _units(graph, sizes, limits):
+    # Une ressource dont une seule autre dépend (l'instance de son alarme, l'EIP
+    # de sa NAT) voyage avec elle : aucune référence croisée pour ces couples.
+    dependents = dict.fromkeys(graph, 0)
+    for deps in graph.values():
+        for dep in deps:
+            dependents[dep] += 1
+    root = {name: name for name in graph}
+
+    def find(name):
+        while root[name] != name:
+            root[name] = root[root[name]]
+            name = root[name]
+        return name
+
+    for name, deps in graph.items():
+        for dep in sorted(deps):
+            if dependents[dep] == 1:
+                root[find(dep)] = find(name)
+    members = {}
+    for name in graph:
+        members.setdefault(find(name), []).append(name)
+    units = list(members.values())
+
+    # Un groupe trop gros pour une pile, ou un cycle entre groupes : ressources isolées
+    unit_of = {name: index for index, unit in enumerate(units) for name in unit}
+    unit_graph = {index: {unit_of[dep] for name in unit for dep in graph[name]} - {index}
+                  for index, unit in enumerate(units)}
+    too_big = any(len(unit) > limits.max_resources * limits.fill
+                  or sum(sizes[name] for name in unit) > limits.max_bytes * limits.fill for unit in units)
+    try:
+        if too_big:
+            raise ValueError("groupe trop gros")
+        order = topological_order(unit_graph)
+    except ValueError:
+        return [[name] for name in topological_order(graph)]
+    position = {name: rank for rank, name in enumerate(topological_order(graph))}
+    return [sorted(units[index], key=position.get) for index in order]
+
+
+@dataclass
+class _Bin:
+    size: TemplateSize
+    names: list = field(default_factory=list)
+    parameters: set = field(default_factory=set)     # clés de paramètres (références entrantes)
+    outputs: set = field(default_factory=set)        # clés de sorties (références sortantes)
+    depends: set = field(default_factory=set)        # index des piles dont celle-ci dépend
+
+
+def _key(name, attribute):
+    # Nom de paramètre/sortie pour une référence : "Subnet" ou "InstancePrivateIp"
+    return name if attribute is None else name + re.sub(r"[^A-Za-z0-9]", "", attribute)
+
+
+_PARAMETER_SIZE = entry_size("X" * 24, {"Type": "String"})
+_OUTPUT_SIZE = entry_size("X" * 24, {"Value": {"Fn::GetAtt": ["X" * 24, "X" * 12]}})
+
+
+def _place(data, graph, sizes, limits, parent_reserve, mode):
+    resources = data["Resources"]
+    template_parameters = data.get("Parameters", {})
+    other = {key: value for key, value in data.items() if key not in _SECTIONS}
+    owner = {}
+    refs = {name: {(ref, attribute) for ref, attribute in references(body)
+                   if ref in resources or ref in template_parameters}
+            for name, body in resources.items()}
+    bins = [_Bin(TemplateSize(other))]
+    reserve_resources, reserve_bytes = parent_reserve
+
+    def cost(unit, index):
+        members = set(unit)
+        parameters, outputs, depends = set(), {}, set()
+        for name in unit:
+            for ref, attribute in refs[name]:
+                if ref in members:
+                    continue
+                target = owner.get(ref, 0)
+                if target == index:
+                    continue
+                # Imbriquées : un paramètre par référence entrante, une sortie si la
+                # ressource est dans une autre fille. Liées : Export/ImportValue.
+                if index != 0 and (mode == "nested" or ref not in resources):
+                    parameters.add(_key(ref, attribute))
+                if ref in resources and (target != 0 or mode == "linked"):
+                    outputs.setdefault(target, set()).add(_key(ref, attribute))
+            # DependsOn crée aussi une dépendance entre piles, sans paramètre
+            depends |= {owner[dep] for dep in graph[name] if dep not in members and owner[dep] != index}
+        return parameters - bins[index].parameters, outputs, depends
+
+    def capacity(index):
+        resources_max, bytes_max = limits.max_resources * limits.fill, limits.max_bytes * limits.fill
+        if index == 0:
+            return resources_max - reserve_resources, bytes_max - reserve_bytes
+        return resources_max, bytes_max
+
+    def fits(unit, index, parameters, outputs):
+        target = bins[index]
+        resources_max, bytes_max = capacity(index)
+        if target.size.resources + len(unit) > resources_max:
+            return False
+        added = sum(sizes[name] for name in unit) + len(parameters) * _PARAMETER_SIZE
+        if target.size.bytes + added + 2 * len(unit) > bytes_max:
+            return False
+        if len(target.parameters) + len(parameters) > limits.max_parameters:
+            return False
+        for other_index, keys in outputs.items():
+            source = bins[other_index]
+            new = keys - source.outputs
+            if len(source.outputs) + len(new) > limits.max_outputs:
+                return False
+            if source.size.bytes + len(new) * _OUTPUT_SIZE > limits.max_bytes:
+                return False
+        return True
+
+    def commit(unit, index, parameters, outputs, depends):
+        target = bins[index]
+        for name in unit:
+            target.size.add("Resources", size=sizes[name])
+            target.names.append(name)
+            owner[name] = index
+        for key in parameters:
+            target.size.add("Parameters", size=_PARAMETER_SIZE)
+        target.parameters |= parameters
+        for other_index, keys in outputs.items():
+            source = bins[other_index]
+            for key in keys - source.outputs:
+                source.size.add("Outputs", size=_OUTPUT_SIZE)
+            source.outputs |= keys
+        target.depends |= depends - {index}
+
+    def reaches(source, target):
+        seen, todo = set(), [source]
+        while todo:
+            index = todo.pop()
+            if index == target:
+                return True
+            if index not in seen:
+                seen.add(index)
+                todo.extend(bins[index].depends)
+        return False
+
+    full = set()
+    for unit in _units(graph, sizes, limits):
+        dep_bins = {owner[dep] for name in unit for dep in graph[name] if dep in owner}
+        # 1. la parente, si le groupe ne dépend d'aucune fille ;
+        # 2. une fille qui contient déjà ses dépendances ;
+        # 3. une fille sans nouvelle dépendance entre piles ;
+        # 4. une nouvelle fille.
+        candidates = [0] if dep_bins <= {0} else []
+        # Une fille dont dépend (même indirectement) une pile de dep_bins créerait un cycle
+        children = [i for i in range(1, len(bins)) if not any(reaches(dep, i) for dep in dep_bins - {i})]
+        candidates += [i for i in children if i in dep_bins]
+        candidates += [i for i in children if i not in dep_bins and dep_bins - {0} <= bins[i].depends]
+        candidates += [i for i in children if i not in candidates]
+        for index in candidates + [None]:
+            if index in full:
+                continue
+            new = index is None
+            if new:
+                bins.append(_Bin(TemplateSize({"AWSTemplateFormatVersion": "", "Description": ""})))
+                index = len(bins) - 1
+            parameters, outputs, depends = cost(unit, index)
+            if fits(unit, index, parameters, outputs):
+                commit(unit, index, parameters, outputs, depends)
+                if bins[index].size.resources + 1 > capacity(index)[0]:
+                    full.add(index)     # plus aucune place : inutile de la réessayer
+                break
+            if new:
+                raise ValueError(f"{', '.join(unit[:3])} ne tient dans aucune pile")
+    return bins, owner
+
+
+# ----------------------------------------------------------------------
+# ------- Assemblage ---------------------------------------------------
+# ----------------------------------------------------------------------
+@dataclass
+class SplitPlan:
+    """Résultat de split_template().
+
+    ``stacks`` est une liste de couples (nom de fichier, template dict) ; le
+    premier est la pile parente (``nested``) ou la pile de base (``linked``).
+    ``dependencies`` donne, pour chaque pile, l'index des piles qu'elle attend.
+    """
+    stacks: list
+    mode: str
+    owner: dict
+    dependencies: dict
+    graph: dict
+
+    def deploy_waves(self):
+        """Piles regroupées par vague de déploiement (la parente imbriquée compte pour la vague 0)."""
+        wave = {}
+        for index in topological_order({i: set(deps) for i, deps in self.dependencies.items()}):
+            wave[index] = max((wave[dep] + 1 for dep in self.dependencies[index]), default=0)
+        grouped = {}
+        for index, number in sorted(wave.items()):
+            grouped.setdefault(number, []).append(self.stacks[index][0])
+        return [grouped[number] for number in sorted(grouped)]
+
+    def depth(self):
+        """(profondeur d'origine, profondeur après découpage) en vagues de ressources.
+
+        Une pile fille ne démarre que lorsque tout ce qu'elle référence est prêt ;
+        une référence vers une autre pile fille attend toute cette pile.
+        """
+        original = _longest(self.graph, set(self.graph))
+        nodes = {name: set() for name in self.graph}
+        for index in range(len(self.stacks)):
+            nodes[f"début:{index}"] = set()
+            nodes[f"fin:{index}"] = {name for name, where in self.owner.items() if where == index}
+        for name, deps in self.graph.items():
+            here = self.owner[name]
+            for dep in deps:
+                there = self.owner[dep]
+                if there == here:
+                    nodes[name].add(dep)
+                elif self.mode == "nested" and there == 0:
+                    nodes[f"début:{here}"].add(dep)
+                else:
+                    nodes[f"début:{here}"].add(f"fin:{there}")
+            nodes[name].add(f"début:{here}")
+        if self.mode == "linked":
+            for index, deps in self.dependencies.items():
+                nodes[f"début:{index}"] |= {f"fin:{dep}" for dep in deps}
+        return original, _longest(nodes, set(self.graph))
+
+    def write(self, directory):
+        """Écrit chaque pile en JSON (même format que to_json()) et retourne les chemins."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, data in self.stacks:
+            path = os.path.join(directory, name)
+            with open(path, "w") as file:
+                file.write(json.dumps(data, **_JSON))
+            paths.append(path)
+        return paths
+
+    def summary(self):
+        lines = []
+        for name, data in self.stacks:
+            size = TemplateSize.of(data)
+            lines.append(f"{name:<28} {size.resources:>4} ressources {size.bytes:>9} octets "
+                         f"{size.counts['Parameters']:>3} paramètres {size.counts['Outputs']:>3} sorties")
+        original, split = self.depth()
+        waves = " | ".join(", ".join(names) for names in self.deploy_waves())
+        lines.append(f"vagues de piles : {waves}")
+        lines.append(f"profondeur de déploiement : {original} vagues de ressources avant découpage, {split} après")
+        return "\n".join(lines)
+
+
+def _longest(graph, weighted):
+    finish = {}
+    for node in topological_order(graph):
+        start = max((finish[dep] for dep in graph[node] if dep in finish), default=0)
+        finish[node] = start + (1 if node in weighted else 0)
+    return max(finish.values(), default=0)
+
+
+def split_template(template, limits=StackLimits(), mode="nested", basename="template",
+                   template_url=TEMPLATE_URL,
+                   stack_name="tp4-fleet", record=None):
+    """Découpe ``template`` en piles qui respectent ``limits`` ; voir SplitPlan.
+
+    Un template qui tient déjà dans les limites est retourné seul, inchangé.
+    ``template_url`` (mode ``nested``) reçoit le nom de fichier de chaque fille ;
+    ``stack_name`` (mode ``linked``) préfixe les noms d'export. ``record`` : le
+    TemplateRecord rempli pendant la construction (build_vpc_template(spec, record)),
+    dont les dicts et les tailles sont réutilisés sans reconvertir le template.
+    """
+    if mode not in ("nested", "linked"):
+        raise ValueError(f"mode inconnu : {mode}")
+    data = template_dict(template) if record is None else record.data(template)
+    graph = dependency_graph(data)
+    known = {} if record is None else record.sizes
+    sizes = {name: known[name] if name in known else entry_size(name, body)
+             for name, body in data["Resources"].items()}
+    if TemplateSize.of(data, sizes).within(limits):
+        return SplitPlan([(f"{basename}.json", data)], mode, dict.fromkeys(graph, 0), {0: set()}, graph)
+
+    # La réserve de la parente (ressources Stack et leurs paramètres) n'est connue
+    # qu'après placement : on l'agrandit jusqu'à ce que tout tienne.
+    reserve = (0, 0) if mode == "linked" else (len(sizes) // limits.max_resources + 1, 0)
+    placement = limits
+    for _ in range(8):
+        bins, owner = _place(data, graph, sizes, placement, reserve, mode)
+        stacks, dependencies = _assemble(data, bins, owner, mode, basename, template_url, stack_name)
+        oversized = [name for name, stack in stacks if not TemplateSize.of(stack).within(limits)]
+        if not oversized:
+            return SplitPlan(stacks, mode, owner, dependencies, graph)
+        if oversized == [stacks[0][0]] and mode == "nested":
+            parent = TemplateSize.of(stacks[0][1])
+            reserve = (reserve[0] + len(bins), reserve[1] + max(parent.bytes - limits.max_bytes, 0) + 10_000)
+        else:
+            placement = replace(placement, fill=placement.fill * 0.9)
+    raise ValueError(f"découpage impossible dans les limites : {', '.join(oversized)}")
+
+
+def _assemble(data, bins, owner, mode, basename, template_url, stack_name):
+    resources = data["Resources"]
+    template_parameters = data.get("Parameters", {})
+    count = len(bins)
+    stack_ids = {index: f"NestedStack{index}" for index in range(1, count)}
+    files = [f"{basename}.json"] + [f"{basename}-stack{index}.json" for index in range(1, count)]
+    description = data.get("Description", "")
+
+    parameters = [{} for _ in bins]        # définitions de paramètres par pile
+    passed = [{} for _ in bins]            # valeurs passées par la parente (nested)
+    outputs = [{} for _ in bins]
+    dependencies = {index: set() for index in range(count)}
+
+    def export(index, key, ref, attribute):
+        value = {"Ref": ref} if attribute is None else {"Fn::GetAtt": [ref, attribute]}
+        output = {"Value": value}
+        if mode == "linked":
+            output["Export"] = {"Name": f"{stack_name}-{key}"}
+        outputs[index][key] = output
+
+    def replacer(index):
+        def replace(ref, attribute):
+            if ref in template_parameters:
+                if index != 0:
+                    parameters[index][ref] = template_parameters[ref]
+                    passed[index][ref] = {"Ref": ref}
+                return None
+            there = owner.get(ref)
+            if there is None or there == index:
+                return None
+            key = _key(ref, attribute)
+            dependencies[index].add(there)
+            if mode == "linked":
+                export(there, key, ref, attribute)
+                return {"Fn::ImportValue": f"{stack_name}-{key}"}
+            if there == 0:
+                remote = {"Ref": ref} if attribute is None else {"Fn::GetAtt": [ref, attribute]}
+            else:
+                export(there, key, ref, attribute)
+                remote = {"Fn::GetAtt": [stack_ids[there], f"Outputs.{key}"]}
+            if index == 0:
+                return remote
+            parameters[index][key] = {"Type": "String"}
+            passed[index][key] = remote
+            return {"Ref": key}
+        return replace
+
+    bodies = [{} for _ in bins]
+    stack_depends = [set() for _ in bins]
+    for index, target in enumerate(bins):
+        replace = replacer(index)
+        for name in target.names:
+            body = rewrite_references(resources[name], replace)
+            depends_on = body.get("DependsOn")
+            if depends_on is not None:
+                depends_on = [depends_on] if isinstance(depends_on, str) else depends_on
+                kept = [dep for dep in depends_on if owner.get(dep) == index]
+                for dep in depends_on:
+                    if owner.get(dep, index) != index:
+                        dependencies[index].add(owner[dep])
+                        if mode == "nested":
+                            stack_depends[index].add(dep if owner[dep] == 0 else stack_ids[owner[dep]])
+                body = dict(body)
+                if kept:
+                    body["DependsOn"] = kept if len(kept) > 1 else kept[0]
+                else:
+                    del body["DependsOn"]
+            bodies[index][name] = body
+
+    # Sorties d'origine : dans la parente (nested) ou dans la pile qui possède leurs ressources (linked)
+    original_outputs = data.get("Outputs", {})
+    parent_outputs = {}
+    for name, output in original_outputs.items():
+        owners = {owner[ref] for ref, _ in references(output) if ref in owner}
+        if mode == "linked" and len(owners) == 1:
+            target = outputs[owners.pop()]
+            if name in target and target[name]["Value"] != output.get("Value"):
+                raise ValueError(f"la sortie {name} entre en conflit avec un export généré")
+            # Même nom et même valeur qu'un export généré : on garde l'Export
+            target[name] = {**output, **target.get(name, {})}
+        else:
+            parent_outputs[name] = rewrite_references(output, replacer(0))
+
+    shared = {key: data[key] for key in ("Mappings", "Conditions") if key in data}
+    stacks = []
+    for index in range(count):
+        if index == 0:
+            parent = {key: value for key, value in data.items() if key not in ("Resources", "Outputs")}
+            parent["Resources"] = dict(bodies[0])
+            if mode == "nested":
+                for child in range(1, count):
+                    properties = {"TemplateURL": template_url.format(name=files[child])}
+                    if passed[child]:
+                        properties["Parameters"] = passed[child]
+                    stack = {"Type": _STACK_TYPE, "Properties": properties}
+                    if stack_depends[child]:
+                        stack["DependsOn"] = sorted(stack_depends[child])
+                    parent["Resources"][stack_ids[child]] = stack
+            merged_outputs = {**outputs[0], **parent_outputs}
+            if merged_outputs:
+                parent["Outputs"] = merged_outputs
+            stacks.append((files[0], parent))
+            continue
+        child = {"AWSTemplateFormatVersion": "2010-09-09",
+                 "Description": f"{description} (pile {index}/{count - 1})".strip()}
+        if shared:
+            replace = replacer(index)
+            child.update({key: rewrite_references(value, replace) for key, value in shared.items()})
+        if parameters[index]:
+            child["Parameters"] = parameters[index]
+        child["Resources"] = bodies[index]
+        if outputs[index]:
+            child["Outputs"] = outputs[index]
+        stacks.append((files[index], child))
+
+    for index in range(count):
+        dependencies[index].discard(index)
+        if mode == "nested" and index != 0:
+            dependencies[index].discard(0)
+    return stacks, dependencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Découpe un template trop gros en piles CloudFormation")
+    parser.add_argument("template", help="preset (q1, q3_1, q3_2) ou fichier template JSON")
+    parser.add_argument("--instances-per-subnet", type=int, default=None,
+                        help="taille de la flotte pour un preset avec instances (q3_2)")
+    parser.add_argument("--mode", choices=("nested", "linked"), default="nested")
+    parser.add_argument("--output-dir", default=None, help="écrit les piles dans ce dossier")
+    parser.add_argument("--template-url", default=TEMPLATE_URL,
+                        help="URL S3 des piles filles ({name} = nom du fichier)")
+    parser.add_argument("--max-resources", type=int, default=StackLimits.max_resources)
+    parser.add_argument("--max-bytes", type=int, default=StackLimits.max_bytes)
+    args = parser.parse_args(argv)
+
+    from tp4.batch import PRESETS
+
+    limits = StackLimits(max_resources=args.max_resources, max_bytes=args.max_bytes)
+    if args.template in PRESETS:
+        from tp4.vpc import build_vpc_stacks
+
+        spec = PRESETS[args.template]
+        if args.instances_per_subnet and spec.compute is not None:
+            spec = replace(spec, compute=replace(spec.compute, instances_per_subnet=args.instances_per_subnet))
+        plan = build_vpc_stacks(spec, limits, mode=args.mode, basename=args.template,
+                                template_url=args.template_url)
+    else:
+        with open(args.template) as file:
+            template = json.load(file)
+        basename = os.path.splitext(os.path.basename(args.template))[0]
+        plan = split_template(template, limits, args.mode, basename, args.template_url)
+    print(plan.summary())
+    if args.output_dir:
+        for path in plan.write(args.output_dir):
+            print(f"{path} généré")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Sérialisation en flux des templates troposphere.
+
+template.to_yaml() construit le dictionnaire complet, puis la chaîne JSON, puis
+un second dictionnaire ordonné (cfn_flip), puis la chaîne YAML. Pour un template
+de plusieurs milliers de ressources, ces copies coexistent en mémoire.
+
+Ici, chaque section (Parameters, Resources, Outputs, ...) est écrite élément par
+élément dans le fichier : on ne garde en mémoire que le dictionnaire d'une seule
+ressource à la fois. La sortie est identique octet pour octet à to_json() et à
+to_yaml().
+"""
+import json
+
+from troposphere import encode_to_dict
+
+# Sections dont la valeur est un dictionnaire écrit élément par élément
+_MAPPING_SECTIONS = {
+    "Conditions", "Globals", "Mappings", "Metadata", "Outputs", "Parameters", "Resources", "Rules",
+}
+
+
+def _sections(template):
+    # Mêmes sections et même contenu que Template.to_dict(), sans l'encodage récursif
+    sections = {
+        "Description": template.description,
+        "Metadata": template.metadata,
+        "Conditions": template.conditions,
+        "Mappings": template.mappings,
+        "Outputs": template.outputs,
+        "Parameters": template.parameters,
+        "AWSTemplateFormatVersion": template.version,
+        "Transform": template.transform,
+        "Rules": template.rules,
+        "Globals": template.globals,
+    }
+    sections = {key: value for key, value in sections.items() if value}
+    sections["Resources"] = template.resources
+    # to_json() trie les clés : l'ordre des sections est alphabétique
+    return sorted(sections.items())
+
+
+def _items(section):
+    # Les éléments d'une section, triés par nom et encodés un à la fois
+    for name in sorted(section):
+        yield name, encode_to_dict(section[name])
+
+
+def write_json(template, file):
+    """Écrit ``template`` dans ``file`` exactement comme template.to_json()."""
+    dumps = _json_dumps
+    file.write("{")
+    for index, (key, value) in enumerate(_sections(template)):
+        file.write(",\n" if index else "\n")
+        file.write(f" {json.dumps(key)}: ")
+        if key in _MAPPING_SECTIONS and value:
+            file.write("{")
+            for item_index, (name, body) in enumerate(_items(value)):
+                file.write(",\n" if item_index else "\n")
+                # Un élément de section est au niveau 2 : on décale son rendu de 2 espaces
+                file.write(f"  {json.dumps(name)}: ")
+                file.write(dumps(body).replace("\n", "\n  "))
+            file.write("\n }")
+        else:
+            file.write(dumps(encode_to_dict(value)))
+    file.write("\n}")
+
+
+def _json_dumps(value):
+    return json.dumps(value, indent=1, sort_keys=True, separators=(",", ": "))
+
+
+def write_yaml(template, file):
+    """Écrit ``template`` dans ``file`` exactement comme template.to_yaml().
+
+    Chaque élément est rendu dans un document {section: {nom: corps}} dont on retire
+    la première ligne : les indentations (et donc les retours à la ligne des longues
+    chaînes) sont les mêmes que dans le document complet.
+    """
+    for key, value in _sections(template):
+        if key in _MAPPING_SECTIONS and value:
+            file.write(f"{key}:\n")
+            for name, body in _items(value):
+                text = _yaml_dumps({key: {name: body}})
+                file.write(text[text.index("\n") + 1:])
+        else:
+            file.write(_yaml_dumps({key: encode_to_dict(value)}))
+
+
+def _yaml_dumps(data):
+    # Même chaîne de traitement que cfn_flip.to_yaml() appelé par Template.to_yaml()
+    import cfn_flip
+    from cfn_clean import cfn_literal_parser
+    from cfn_tools import load_json
+
+    return cfn_flip.dump_yaml(cfn_literal_parser(load_json(_json_dumps(data))))
+
+
+def write_template(template, path, fmt=None):
+    """Écrit ``template`` dans ``path`` au format "yaml" ou "json" (déduit de l'extension)."""
+    fmt = fmt or ("json" if path.endswith(".json") else "yaml")
+    writer = write_json if fmt == "json" else write_yaml
+    with open(path, "w") as file:
+        writer(template, file)
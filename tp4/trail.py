@@ -0,0 +1,426 @@
+"""Index incrémental des événements de données CloudTrail (trail Q3Trail de la Q3.3).
+
+Q3Trail enregistre toutes les lectures et écritures sur les objets du bucket
+source dans le bucket de backup. Ici, un dossier local tient lieu de bucket :
+
+    AWSLogs/<compte>/CloudTrail/<région>/AAAA/MM/JJ/<...>.json.gz
+
+Chaque fichier est décompressé et lu par un worker, puis ses enregistrements
+sont insérés dans une base SQLite. Les noms d'événements, principaux, buckets,
+IP sources et codes d'erreur sont stockés dans une table de chaînes. Les
+événements sont indexés par (nom, heure), (principal, heure), (clé d'objet,
+heure) et heure. Une requête sur un préfixe de clé est donc une plage d'index,
+quel que soit le nombre de mois de journaux.
+
+Les fichiers déjà ingérés sont notés dans la base (point de reprise). Une
+nouvelle ingestion ne lit que les nouveaux fichiers. La base note aussi le
+mtime de chaque dossier de jour parcouru : ajouter un fichier change le mtime
+de son dossier, donc un dossier inchangé n'est pas relu, et un fichier déposé
+après coup dans un jour ancien est tout de même ingéré. ``--full`` relit tout.
+
+    python -m tp4.trail ingest logs/
+    python -m tp4.trail query --event DeleteObject DeleteObjects --prefix factures/ --since 1h --by principal
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    records INTEGER NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS strings (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS events (
+    time INTEGER NOT NULL,
+    name INTEGER NOT NULL,
+    principal INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    source_ip INTEGER NOT NULL,
+    error INTEGER NOT NULL,
+    event_id TEXT NOT NULL,
+    UNIQUE (event_id, key)
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_name ON events (name, time);
+CREATE INDEX IF NOT EXISTS events_principal ON events (principal, time);
+CREATE INDEX IF NOT EXISTS events_key ON events (key, time);
+CREATE TABLE IF NOT EXISTS days (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+# Colonnes codées par la table de chaînes (colonne de la requête -> colonne de events)
+_CODED = ("name", "principal", "bucket", "source_ip", "error")
+GROUPS = {"principal": "principal", "event": "name", "key": "key", "bucket": "bucket", "ip": "source_ip"}
+_DATE_PARTS = (re.compile(r"^\d{4}$"), re.compile(r"^\d{2}$"), re.compile(r"^\d{2}$"))
+_PREFIX_END = "\U0010ffff"
+COMMIT_EVERY = 64
+# Un dossier modifié depuis moins longtemps n'est pas noté : un fichier ajouté dans
+# la même graduation de mtime que la liste passerait inaperçu
+_RECENT_NS = 2 * 10**9
+
+
+@dataclass
+class IngestReport:
+    """Résultat d'une ingestion : fichiers lus, ignorés (déjà indexés), dossiers de jours non relus et débit."""
+    files: int
+    skipped: int
+    records: int
+    seconds: float
+    unchanged_days: int = 0
+
+    def __str__(self):
+        rate = self.records / self.seconds if self.seconds else float("inf")
+        return (f"{self.files} fichier(s) ingéré(s), {self.skipped} déjà indexé(s), "
+                f"{self.unchanged_days} dossier(s) de jour inchangé(s) non relu(s), "
+                f"{self.records} événements en {self.seconds:.2f} s ({rate:.0f} événements/s)")
+
+
+# ----------------------------------------------------------------------
+# ------- Lecture des fichiers de journaux -----------------------------
+# ----------------------------------------------------------------------
+def _principal(identity):
+    # ARN du rôle assumé ou de l'utilisateur ; service AWS sinon
+    return (identity.get("arn") or identity.get("invokedBy") or identity.get("principalId")
+            or identity.get("type") or "")
+
+
+def _keys(record):
+    # Objets visés : ressources AWS::S3::Object, puis paramètres de la requête
+    keys = []
+    for resource in record.get("resources") or []:
+        if resource.get("type") == "AWS::S3::Object":
+            keys.append(resource.get("ARN", "").split(":::", 1)[-1].partition("/")[2])
+    parameters = record.get("requestParameters") or {}
+    if not keys and parameters.get("key"):
+        keys.append(parameters["key"])
+    if not keys:
+        # DeleteObjects : les clés sont dans le corps de la requête
+        objects = (parameters.get("delete") or {}).get("Object") or []
+        keys = [entry.get("Key", "") for entry in (objects if isinstance(objects, list) else [objects])]
+    return keys or [""]
+
+
+def _timestamp(text):
+    return int(datetime.datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp())
+
+
+def parse_records(records):
+    """Lignes (heure, nom, principal, bucket, clé, IP, erreur, eventID), une par objet visé."""
+    for record in records:
+        parameters = record.get("requestParameters") or {}
+        common = (_timestamp(record["eventTime"]), record.get("eventName", ""),
+                  _principal(record.get("userIdentity") or {}), parameters.get("bucketName", "") or "")
+        tail = (record.get("sourceIPAddress", ""), record.get("errorCode", "") or "", record.get("eventID", ""))
+        for key in _keys(record):
+            yield common + (key,) + tail
+
+
+def read_log_file(path):
+    """(chemin, taille, lignes) d'un fichier CloudTrail (.json.gz ou .json)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        # Un fichier CloudTrail couvre quelques minutes d'un seul compte et d'une région
+        records = json.load(file).get("Records") or []
+    return path, os.path.getsize(path), list(parse_records(records))
+
+
+def _day(relative):
+    # "AAAA/MM/JJ" des derniers composants du chemin s'ils forment une date, sinon None
+    parts = relative.split(os.sep)
+    for size in (3, 2, 1):
+        tail = parts[-size:]
+        if len(parts) >= size and all(pattern.match(part) for pattern, part in zip(_DATE_PARTS, tail)):
+            return "/".join(tail)
+    return None
+
+
+def iter_log_files(directory, days=None, listed=None):
+    """Fichiers CloudTrail sous ``directory``, triés.
+
+    ``days`` ({dossier de jour: mtime en ns}) : un dossier de jour dont le mtime
+    n'a pas changé n'a reçu aucun fichier et n'est pas relu. ``listed`` reçoit
+    le mtime de chaque dossier de jour rencontré, relu ou non.
+    """
+    days = days or {}
+    for root, dirs, files in os.walk(directory):
+        kept = []
+        for name in sorted(dirs):
+            path = os.path.join(root, name)
+            day = _day(os.path.relpath(path, directory))
+            if day is not None and len(day) == 10:
+                # stat avant la liste du dossier : un fichier ajouté entre les deux le fera relire
+                path, mtime = os.path.abspath(path), os.stat(path).st_mtime_ns
+                if listed is not None:
+                    listed[path] = mtime
+                if days.get(path) == mtime:
+                    continue
+            kept.append(name)
+        dirs[:] = kept
+        for name in sorted(files):
+            if name.endswith((".json.gz", ".json")):
+                yield os.path.join(root, name)
+
+
+# ----------------------------------------------------------------------
+# ------- Index SQLite -------------------------------------------------
+# ----------------------------------------------------------------------
+def _read_files(paths, workers):
+    # (chemin, taille, lignes) de chaque fichier ; au plus 2 × workers fichiers en cours,
+    # comme tp4.flowlogs.ingest
+    if workers == 1 or len(paths) < 2:
+        yield from map(read_log_file, paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(read_log_file, path))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def default_index_path():
+    from tp4.cache import DEFAULT_DIR
+
+    return os.path.join(os.environ.get("TP4_CACHE_DIR") or DEFAULT_DIR, "cloudtrail.sqlite3")
+
+
+class TrailIndex:
+    """Base SQLite des événements CloudTrail, avec point de reprise par fichier."""
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        # WAL : les requêtes restent possibles pendant une ingestion
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._ids = dict(self._db.execute("SELECT value, id FROM strings"))
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # ------- Ingestion -------------------------------------------------
+    # ------------------------------------------------------------------
+    def _code(self, value):
+        code = self._ids.get(value)
+        if code is None:
+            code = self._db.execute("INSERT INTO strings (value) VALUES (?)", (value,)).lastrowid
+            self._ids[value] = code
+        return code
+
+    def _store(self, path, size, rows, directory):
+        # Sans commit : les lignes du fichier et son entrée dans files partent dans la même transaction
+        code = self._code
+        self._db.executemany(
+            "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((when, code(name), code(principal), code(bucket), key, code(ip), code(error), event_id)
+             for when, name, principal, bucket, key, ip, error, event_id in rows),
+        )
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (os.path.abspath(path), size, len(rows), time.time()))
+        day = _day(os.path.relpath(os.path.dirname(path), directory))
+        if day is not None and len(day) == 10:
+            self._db.execute("INSERT INTO checkpoint VALUES ('last_day', ?) "
+                             "ON CONFLICT (name) DO UPDATE SET value = max(value, excluded.value)", (day,))
+
+    def ingest(self, directory, workers=None, full=False):
+        """Indexe les fichiers de ``directory`` qui ne le sont pas encore.
+
+        Les dossiers de jours dont le mtime n'a pas changé depuis la dernière
+        ingestion ne sont pas relus, sauf avec ``full``.
+        """
+        from tp4.batch import available_cpus
+
+        start, now = time.perf_counter(), time.time_ns()
+        known = {path for path, in self._db.execute("SELECT path FROM files")}
+        days = {} if full else dict(self._db.execute("SELECT path, mtime FROM days"))
+        listed, paths, skipped = {}, [], 0
+        for path in iter_log_files(directory, days, listed):
+            if os.path.abspath(path) in known:
+                skipped += 1
+            else:
+                paths.append(path)
+
+        records = 0
+        try:
+            for count, (path, size, rows) in enumerate(_read_files(paths, workers or available_cpus()), start=1):
+                self._store(path, size, rows, directory)
+                records += len(rows)
+                # Un commit par lot de fichiers : un commit par fichier coûterait plus que la lecture
+                if count % COMMIT_EVERY == 0:
+                    self._db.commit()
+            # Noté seulement une fois tous les fichiers du dossier ingérés
+            self._db.executemany("INSERT OR REPLACE INTO days VALUES (?, ?)",
+                                 ((path, mtime) for path, mtime in listed.items()
+                                  if days.get(path) != mtime and mtime < now - _RECENT_NS))
+        finally:
+            self._db.commit()
+        unchanged = sum(days.get(path) == mtime for path, mtime in listed.items())
+        return IngestReport(len(paths), skipped, records, time.perf_counter() - start, unchanged)
+
+    # ------------------------------------------------------------------
+    # ------- Requêtes --------------------------------------------------
+    # ------------------------------------------------------------------
+    def _where(self, events=None, principal=None, prefix=None, bucket=None, since=None, until=None,
+               errors=None):
+        clauses, values = [], []
+        if events:
+            codes = [self._ids[name] for name in events if name in self._ids]
+            clauses.append(f"name IN ({', '.join('?' * len(codes))})" if codes else "0")
+            values += codes
+        if principal:
+            # Sous-chaîne de l'ARN (ex. "LabRole") : résolue sur la table de chaînes, petite
+            codes = [code for value, code in self._ids.items() if principal in value]
+            clauses.append(f"principal IN ({', '.join('?' * len(codes))})" if codes else "0")
+            values += codes
+        if prefix:
+            clauses.append("key >= ? AND key < ?")
+            values += [prefix, prefix + _PREFIX_END]
+        if bucket:
+            clauses.append("bucket = ?")
+            values.append(self._ids.get(bucket, -1))
+        if since is not None:
+            clauses.append("time >= ?")
+            values.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            values.append(until)
+        if errors is not None:
+            clauses.append("error != ?" if errors else "error = ?")
+            values.append(self._ids.get("", -1))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+    def query(self, limit=100, **filters):
+        """Événements les plus récents qui passent les filtres, sous forme de dictionnaires.
+
+        Filtres : ``events`` (noms), ``principal`` (sous-chaîne), ``prefix`` (clé
+        d'objet), ``bucket``, ``since``/``until`` (secondes Unix), ``errors``
+        (True : seulement les refus/erreurs, False : seulement les succès).
+        """
+        where, values = self._where(**filters)
+        names = {code: value for value, code in self._ids.items()}
+        columns = ("time", "name", "principal", "bucket", "key", "source_ip", "error", "event_id")
+        rows = self._db.execute(f"SELECT {', '.join(columns)} FROM events{where} ORDER BY time DESC LIMIT ?",
+                                values + [limit])
+        return [{column: names[value] if column in _CODED else value for column, value in zip(columns, row)}
+                for row in rows]
+
+    def counts(self, by="principal", limit=20, **filters):
+        """[(valeur, nombre d'événements)] groupés selon ``by`` (voir GROUPS), du plus fréquent au moins."""
+        column = GROUPS[by]
+        where, values = self._where(**filters)
+        rows = self._db.execute(f"SELECT {column}, COUNT(*) FROM events{where} GROUP BY {column} "
+                                f"ORDER BY COUNT(*) DESC LIMIT ?", values + [limit])
+        if column not in _CODED:
+            return rows.fetchall()
+        names = {code: value for value, code in self._ids.items()}
+        return [(names[code], count) for code, count in rows]
+
+    def per_second(self, **filters):
+        """[(seconde Unix, nom d'événement, nombre)] des événements qui passent les filtres."""
+        where, values = self._where(**filters)
+        names = {code: value for value, code in self._ids.items()}
+        rows = self._db.execute(f"SELECT time, name, COUNT(*) FROM events{where} GROUP BY time, name", values)
+        return [(when, names[name], count) for when, name, count in rows]
+
+    def stats(self):
+        """Nombre de fichiers et d'événements indexés, et dernier jour ingéré."""
+        files, = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+        events, = self._db.execute("SELECT COUNT(*) FROM events").fetchone()
+        row = self._db.execute("SELECT value FROM checkpoint WHERE name = 'last_day'").fetchone()
+        return {"files": files, "events": events, "last_day": row[0] if row else None}
+
+
+def parse_since(text, now=None):
+    """Secondes Unix pour "90s", "30m", "1h", "7d" (avant ``now``) ou une date ISO 8601."""
+    match = re.fullmatch(r"(\d+)([smhd])", text)
+    if match:
+        seconds = int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return int((time.time() if now is None else now) - seconds)
+    moment = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+
+def format_events(events):
+    lines = []
+    for event in events:
+        when = datetime.datetime.fromtimestamp(event["time"], datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        error = f" [{event['error']}]" if event["error"] else ""
+        lines.append(f"{when} {event['name']:<16} {event['principal']} {event['bucket']}/{event['key']} "
+                     f"depuis {event['source_ip']}{error}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index des journaux CloudTrail (événements de données S3)")
+    parser.add_argument("--index", default=None, help="base SQLite (par défaut : .tp4-cache/cloudtrail.sqlite3)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="indexe les nouveaux fichiers d'un dossier")
+    ingest.add_argument("directory", help="dossier qui tient lieu de bucket (ex. une copie de AWSLogs/)")
+    ingest.add_argument("--workers", type=int, default=None)
+    ingest.add_argument("--full", action="store_true", help="relit aussi les dossiers de jours inchangés depuis la dernière ingestion")
+
+    query = commands.add_parser("query", help="interroge l'index")
+    query.add_argument("--event", nargs="+", default=None, help="noms d'événements (ex. DeleteObject PutObject)")
+    query.add_argument("--principal", default=None, help="sous-chaîne de l'ARN du principal")
+    query.add_argument("--prefix", default=None, help="préfixe des clés d'objets")
+    query.add_argument("--bucket", default=None)
+    query.add_argument("--since", default=None, help="1h, 30m, 7d ou date ISO 8601")
+    query.add_argument("--until", default=None)
+    query.add_argument("--errors", action="store_true", help="seulement les requêtes refusées ou en erreur")
+    query.add_argument("--by", choices=sorted(GROUPS), default=None, help="compte les événements par valeur")
+    query.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    with TrailIndex(args.index) as index:
+        if args.command == "ingest":
+            print(index.ingest(args.directory, args.workers, args.full))
+            return
+        filters = dict(events=args.event, principal=args.principal, prefix=args.prefix, bucket=args.bucket,
+                       since=parse_since(args.since) if args.since else None,
+                       until=parse_since(args.until) if args.until else None,
+                       errors=True if args.errors else None)
+        if args.by:
+            for value, count in index.counts(args.by, args.limit, **filters):
+                print(f"{count:>8}  {value}")
+        else:
+            print(format_events(index.query(args.limit, **filters)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,586 @@
+"""Construction paramétrable des templates VPC (Q1, Q3.1 et Q3.2).
+
+Le réseau de base (VPC, sous-réseaux, IGW, NAT, tables de routage et groupe de
+sécurité) est commun aux trois questions. Les couches optionnelles (endpoints
+VPC, flow logs, instances EC2 et alarmes CloudWatch) s'ajoutent selon le VpcSpec
+fourni.
+"""
+from dataclasses import dataclass, replace
+
+
+# Règles d'entrée du groupe de sécurité polystudent14SG (Figure 9)
+# Chaque règle est un tuple (protocole, port de début, port de fin, CIDR source)
+DEFAULT_SG_RULES = (
+    ("tcp", 22, 22, "0.0.0.0/0"),
+    ("tcp", 80, 80, "0.0.0.0/0"),
+    ("tcp", 443, 443, "0.0.0.0/0"),
+    ("udp", 53, 53, "0.0.0.0/0"),
+    ("tcp", 53, 53, "0.0.0.0/0"),
+    ("tcp", 1433, 1433, "0.0.0.0/0"),
+    ("tcp", 5432, 5432, "0.0.0.0/0"),
+    ("tcp", 3306, 3306, "0.0.0.0/0"),
+    ("tcp", 3389, 3389, "0.0.0.0/0"),
+    ("tcp", 1514, 1514, "0.0.0.0/0"),
+    ("tcp", 9200, 9300, "0.0.0.0/0"),
+)
+
+
+NAT_MODES = ("per_az", "shared")
+GATEWAY_SERVICES = ("s3", "dynamodb")     # seuls services joignables par un endpoint Gateway
+
+
+@dataclass(frozen=True)
+class EndpointSpec:
+    """Endpoint VPC vers un service AWS, sans passer par les NAT Gateways.
+
+    Un endpoint Gateway (s3, dynamodb) ajoute une route vers le service dans les
+    tables de routage privées ; un endpoint Interface place une interface réseau
+    dans chaque sous-réseau privé, derrière un groupe de sécurité qui n'accepte
+    que HTTPS depuis le VPC.
+    """
+    service: str = "s3"                   # nom court : s3, dynamodb, logs, ssm, ecr.api...
+    endpoint_type: str = "Gateway"        # Gateway ou Interface
+    private_dns: bool = True              # Interface : le nom public du service résout vers l'endpoint
+
+    @property
+    def title(self):
+        words = self.service.replace("-", ".").split(".")
+        return "".join(word.capitalize() for word in words) + f"{self.endpoint_type}Endpoint"
+
+
+@dataclass(frozen=True)
+class FlowLogSpec:
+    """Couche VPC Flow Logs (Q3.1) : paquets envoyés vers un bucket S3."""
+    name: str = "VPCFlowLogRejectedOnly"
+    traffic_type: str = "REJECT"
+    bucket_arn: str = "arn:aws:s3:::polystudent-q2-tp4"   # bucket S3 créé dans la Q2
+    max_aggregation_interval: int = 600
+
+
+@dataclass(frozen=True)
+class ComputeSpec:
+    """Couche EC2 (Q3.2) : une instance par sous-réseau avec le rôle LabRole."""
+    ami: str = "ami-0c02fb55956c7d316"    # Amazon Linux 2 (us-east-1)
+    instance_type: str = "t3.micro"
+    role: str = "LabRole"                 # Rôle existant déjà dans AWS Academy
+    instances_per_subnet: int = 1         # > 1 pour une flotte (voir tp4/split.py)
+
+
+@dataclass(frozen=True)
+class MonitoringSpec:
+    """Couche CloudWatch (Q3.2) : une alarme par instance."""
+    namespace: str = "AWS/EC2"
+    metric_name: str = "NetworkPacketsIn"
+    statistic: str = "Average"
+    period: int = 60
+    evaluation_periods: int = 1
+    threshold: int = 1000
+    comparison_operator: str = "GreaterThanThreshold"
+
+
+@dataclass(frozen=True)
+class VpcSpec:
+    """Description complète d'un VPC à générer.
+
+    Les sous-réseaux publics et privés sont indexés par AZ : public_cidrs[i] et
+    private_cidrs[i] sont créés dans azs[i]. Laissés à None, ils sont découpés
+    dans cidr_block par tp4.cidr.plan_subnets() (10.0.0.0/24, 10.0.16.0/24,
+    10.0.128.0/24 et 10.0.144.0/24 pour le VPC de la Q1). Les spécifications sont
+    immuables et picklables, ce qui permet de les distribuer à un pool de processus.
+    """
+    description: str = "VPC créé en utilisant Troposhere pour la Q1"
+    cidr_block: str = "10.0.0.0/16"
+    vpc_name: str = "polystudent-vpc"
+    azs: tuple = ("us-east-1a", "us-east-1b")
+    public_cidrs: tuple = None
+    private_cidrs: tuple = None
+    subnet_prefix: int = 24
+    internet_access: bool = True          # IGW + NAT Gateway(s) + routes
+    nat_gateways: str = "per_az"          # "per_az" : un NAT par AZ ; "shared" : un seul NAT, dans la 1re AZ
+    endpoints: tuple = ()                 # EndpointSpec reliés aux tables de routage privées
+    igw_name: str = "polystudent-14-igw"
+    sg_name: str = "polystudent-sg"
+    sg_rules: tuple = DEFAULT_SG_RULES
+    flow_logs: FlowLogSpec = None
+    compute: ComputeSpec = None
+    monitoring: MonitoringSpec = None
+
+
+# ----------------------------------------------------------------------
+# ------- Spécifications des questions du TP ---------------------------
+# ----------------------------------------------------------------------
+Q1_SPEC = VpcSpec()
+
+Q3_1_SPEC = replace(
+    Q1_SPEC,
+    description="VPC de la Q1 mis à jour pour la Q3.1 afin qu'il puisse supporter les VPC Flow Logs",
+    flow_logs=FlowLogSpec(),
+)
+
+# La Q3.2 ne reprend pas l'IGW ni les NAT : seulement le VPC, les sous-réseaux,
+# le groupe de sécurité, les instances et leurs alarmes.
+Q3_2_SPEC = replace(
+    Q1_SPEC,
+    description="VPC de la Q3.2 - Ajout d_instances EC2 + LabRole + CloudWatch alarm",
+    internet_access=False,
+    compute=ComputeSpec(),
+    monitoring=MonitoringSpec(),
+)
+
+
+def build_vpc_template(spec, record=None):
+    """Construit le Template troposphere correspondant à ``spec``.
+
+    Le dict et la taille de chaque entrée sont relevés au fil de la construction
+    dans ``record`` (tp4.split.TemplateRecord). Sans ``record``, un template qui
+    dépasserait les limites d'une pile CloudFormation (une grande flotte) lève
+    ValueError : build_vpc_stacks() le découpe en piles.
+    """
+    from troposphere import Template, Ref, Output
+    from tp4.split import StackLimits, TemplateRecord
+
+    record = TemplateRecord(StackLimits()) if record is None else record
+    if spec.monitoring is not None and spec.compute is None:
+        raise ValueError("la couche monitoring nécessite la couche compute")
+
+    # Initialisation du template CloudFormation :
+    # on crée un objet Template qui contiendra toutes les ressources
+    template = Template()
+    template.set_description(spec.description)
+
+    network = add_network(template, spec)
+    if spec.endpoints:
+        add_endpoints(template, network, spec)
+    if spec.flow_logs is not None:
+        add_flow_logs(template, network["vpc"], spec.flow_logs)
+    if spec.compute is not None:
+        instances = add_compute(template, network, spec.compute, record)
+        if spec.monitoring is not None:
+            add_monitoring(template, instances, spec.monitoring, record)
+
+    # Ajout des lignes du bloc Output (Figure 4)
+    template.add_output(
+        [Output(network["vpc"].title, Value=Ref(network["vpc"]))]
+        + [Output(subnet.title, Value=Ref(subnet)) for subnet in network["subnets"]]
+    )
+    record.sync(template)
+    return template
+
+
+def build_vpc_stacks(spec, limits=None, **options):
+    """SplitPlan de ``spec`` : le template seul s'il tient dans ``limits``, des piles sinon.
+
+    Les dicts relevés pendant la construction servent au découpage : le template
+    n'est pas reconverti en entier. ``options`` : voir tp4.split.split_template().
+    """
+    from tp4.split import StackLimits, TemplateRecord, split_template
+
+    record = TemplateRecord()
+    template = build_vpc_template(spec, record)
+    return split_template(template, limits or StackLimits(), record=record, **options)
+
+
+def subnet_cidrs(spec):
+    """Retourne (public_cidrs, private_cidrs) pour ``spec``.
+
+    Les blocs fournis explicitement sont vérifiés : ils doivent être inclus dans le
+    VPC et ne pas se chevaucher (ValueError sinon).
+    """
+    from tp4.cidr import CidrAllocator, plan_subnets
+
+    if spec.public_cidrs is None and spec.private_cidrs is None:
+        layout = plan_subnets(spec.cidr_block, len(spec.azs), subnet_prefix=spec.subnet_prefix)
+        return layout.cidrs("public"), layout.cidrs("private")
+
+    if spec.public_cidrs is None or spec.private_cidrs is None:
+        raise ValueError("public_cidrs et private_cidrs doivent être fournis ensemble")
+    if len(spec.public_cidrs) != len(spec.azs) or len(spec.private_cidrs) != len(spec.azs):
+        raise ValueError("public_cidrs et private_cidrs doivent avoir une entrée par AZ")
+    allocator = CidrAllocator(spec.cidr_block)
+    for tier, cidrs in (("public", spec.public_cidrs), ("private", spec.private_cidrs)):
+        for index, cidr in enumerate(cidrs, start=1):
+            allocator.reserve(cidr, label=f"{tier}-az{index}")
+    return tuple(spec.public_cidrs), tuple(spec.private_cidrs)
+
+
+def add_network(template, spec):
+    """Ajoute le réseau de base et retourne les ressources utiles aux couches suivantes.
+
+    Le dictionnaire retourné contient "vpc", "security_group", "subnets" (publics
+    puis privés), "labels" (suffixe "PublicAZ1", "PrivateAZ2", ... de chaque
+    sous-réseau, dans le même ordre) et "private_route_tables" (une par AZ, vide
+    sans accès Internet).
+    """
+    from troposphere import Ref, Sub
+    import troposphere.ec2 as ec2
+
+    # ----------------------------------------------------------------------
+    # ------- 1. Création du VPC (Figure 1) --------------------------------
+    # ----------------------------------------------------------------------
+    vpc = template.add_resource(
+        ec2.VPC(
+            "VPCQ1TP4",
+            CidrBlock=spec.cidr_block,
+            EnableDnsSupport=True,
+            EnableDnsHostnames=True,
+            Tags=[{"Key": "Name", "Value": spec.vpc_name}]
+        )
+    )
+
+    # ----------------------------------------------------------------------
+    # ------- 2. Création de sous-réseaux (Figures 2, 3 et 4) --------------
+    # ----------------------------------------------------------------------
+    # Un sous-réseau public et un sous-réseau privé dans chaque AZ
+    public_cidrs, private_cidrs = subnet_cidrs(spec)
+    public_subnets = []
+    private_subnets = []
+    for index, az in enumerate(spec.azs, start=1):
+        public_subnets.append(template.add_resource(
+            ec2.Subnet(
+                f"PublicSubnetAZ{index}",
+                VpcId=Ref(vpc),
+                CidrBlock=public_cidrs[index - 1],
+                AvailabilityZone=Sub(az),
+                MapPublicIpOnLaunch=True,
+                Tags=[{"Key": "Name", "Value": f"public-az{index}"}]
+            )
+        ))
+    for index, az in enumerate(spec.azs, start=1):
+        private_subnets.append(template.add_resource(
+            ec2.Subnet(
+                f"PrivateSubnetAZ{index}",
+                VpcId=Ref(vpc),
+                CidrBlock=private_cidrs[index - 1],
+                AvailabilityZone=Sub(az),
+                MapPublicIpOnLaunch=False,
+                Tags=[{"Key": "Name", "Value": f"private-az{index}"}]
+            )
+        ))
+
+    private_route_tables = []
+    if spec.internet_access:
+        private_route_tables = add_internet_access(template, vpc, public_subnets, private_subnets, spec.igw_name,
+                                                   spec.nat_gateways)
+
+    # ---------------------------------------------------------------------------------
+    # ------- 7. Création d'un groupe de sécurité (Figure 9) --------------------------
+    # ---------------------------------------------------------------------------------
+    # Les règles sont compactées avant l'émission (plages de ports et CIDR fusionnés)
+    # pour rester sous la limite de règles par groupe ; voir tp4/sg.py.
+    from tp4.sg import compact_rules
+
+    security_group = template.add_resource(
+        ec2.SecurityGroup(
+            "polystudent14SG",
+            VpcId=Ref(vpc),
+            GroupDescription="Security group qui allows SSH, HTTP, etc.",
+            SecurityGroupIngress=[
+                ec2.SecurityGroupRule(IpProtocol=protocol, FromPort=from_port, ToPort=to_port, CidrIp=cidr)
+                for protocol, from_port, to_port, cidr in compact_rules(spec.sg_rules)
+            ],
+            Tags=[{"Key": "Name", "Value": spec.sg_name}]
+        )
+    )
+
+    labels = [f"PublicAZ{i}" for i in range(1, len(spec.azs) + 1)]
+    labels += [f"PrivateAZ{i}" for i in range(1, len(spec.azs) + 1)]
+    return {
+        "vpc": vpc,
+        "security_group": security_group,
+        "subnets": public_subnets + private_subnets,
+        "labels": labels,
+        "private_route_tables": private_route_tables,
+    }
+
+
+def add_internet_access(template, vpc, public_subnets, private_subnets, igw_name, nat_mode="per_az"):
+    """Ajoute l'IGW, les NAT Gateways et les tables de routage (Figures 5 à 8).
+
+    Avec ``nat_mode="shared"``, un seul NAT (dans la première AZ) sert toutes
+    les tables privées. Retourne les tables de routage privées, une par AZ.
+    """
+    from troposphere import Ref, GetAtt
+    import troposphere.ec2 as ec2
+
+    if nat_mode not in NAT_MODES:
+        raise ValueError(f"nat_gateways inconnu : {nat_mode} (attendu : {', '.join(NAT_MODES)})")
+
+    # --------------------------------------------------------------------------
+    # ------- 3. Création d'un Internet Gateway (Figure 5) ---------------------
+    # --------------------------------------------------------------------------
+    # L'IGW permet au VPC d'avoir une sortie vers Internet.
+    # Il est ensuite attaché explicitement au VPC.
+    # Il est important car sans IGW, aucun subnet ne peut être publique
+    igw = template.add_resource(
+        ec2.InternetGateway(
+            "InternetGateway",
+            Tags=[{"Key": "Name", "Value": igw_name}]
+        )
+    )
+
+    # Attachement de l'IGW au VPC
+    template.add_resource(
+        ec2.VPCGatewayAttachment(
+            "InternetGatewayAttachment",
+            VpcId=Ref(vpc),             # VPC auquel l'IGW est attaché
+            InternetGatewayId=Ref(igw)  # l'IGW créé juste au-dessus
+        )
+    )
+
+    # --------------------------------------------------------------------------
+    # ------- 4. Création d'un NAT Gateway per AZ (Figure 6) -------------------
+    # --------------------------------------------------------------------------
+    # Chaque NAT utilise une EIP et se trouve dans le sous-réseau public de son AZ
+    shared = nat_mode == "shared"
+    nat_gateways = []
+    for index, public_subnet in enumerate(public_subnets[:1] if shared else public_subnets, start=1):
+        nat_eip = ec2.EIP(f"NATEIP{index}", Domain="vpc")
+        nat_eip.DependsOn = "InternetGatewayAttachment"
+        template.add_resource(nat_eip)
+
+        nat_gateways.append(template.add_resource(
+            ec2.NatGateway(
+                f"NatGatewayAZ{index}",
+                AllocationId=GetAtt(nat_eip, "AllocationId"),
+                SubnetId=Ref(public_subnet)
+            )
+        ))
+
+    # ---------------------------------------------------------------------------------
+    # ------- 5. Création de tables de routage publiques (Figure 7) -------------------
+    # ---------------------------------------------------------------------------------
+    # Création de la table de routage publique
+    public_route_table = template.add_resource(ec2.RouteTable("PublicRouteTable", VpcId=Ref(vpc)))
+
+    # Ajout d’une route par défaut vers l’Internet Gateway
+    template.add_resource(
+        ec2.Route(
+            "PublicRouteDefault",
+            RouteTableId=Ref(public_route_table),
+            DestinationCidrBlock="0.0.0.0/0",
+            GatewayId=Ref(igw)
+        )
+    )
+
+    # Association des subnets publics à la table de routage publique
+    for index, public_subnet in enumerate(public_subnets, start=1):
+        template.add_resource(
+            ec2.SubnetRouteTableAssociation(
+                f"PublicSubnet{index}RTAssociation",
+                SubnetId=Ref(public_subnet),
+                RouteTableId=Ref(public_route_table)
+            )
+        )
+
+    # ---------------------------------------------------------------------------------
+    # ------- 6. Création de tables de routage privées (Figure 8) ---------------------
+    # ---------------------------------------------------------------------------------
+    # Une table par AZ, dont la route par défaut passe par le NAT Gateway de l'AZ
+    # (ou par le NAT partagé)
+    return add_private_route_tables(template, vpc, private_subnets,
+                                    nat_gateways * len(private_subnets) if shared else nat_gateways)
+
+
+def add_private_route_tables(template, vpc, private_subnets, nat_gateways=()):
+    """Ajoute une table de routage par sous-réseau privé, avec sa route par défaut vers ``nat_gateways[i]``.
+
+    Sans NAT Gateway (``nat_gateways`` vide), les tables n'ont que la route locale
+    du VPC et celles des endpoints Gateway.
+    """
+    from troposphere import Ref
+    import troposphere.ec2 as ec2
+
+    route_tables = []
+    for index, private_subnet in enumerate(private_subnets, start=1):
+        private_route_table = template.add_resource(
+            ec2.RouteTable(f"PrivateRouteTableAZ{index}", VpcId=Ref(vpc))
+        )
+        route_tables.append(private_route_table)
+
+        if nat_gateways:
+            template.add_resource(
+                ec2.Route(
+                    f"PrivateRoute{index}Default",
+                    RouteTableId=Ref(private_route_table),
+                    DestinationCidrBlock="0.0.0.0/0",
+                    NatGatewayId=Ref(nat_gateways[index - 1])
+                )
+            )
+
+        template.add_resource(
+            ec2.SubnetRouteTableAssociation(
+                f"PrivateSubnet{index}RTAssociation",
+                SubnetId=Ref(private_subnet),
+                RouteTableId=Ref(private_route_table)
+            )
+        )
+    return route_tables
+
+
+def add_endpoints(template, network, spec):
+    """Ajoute les endpoints VPC de ``spec`` et retourne leurs ressources.
+
+    Les endpoints Gateway sont reliés aux tables de routage privées
+    (PrivateRouteTableAZ1, PrivateRouteTableAZ2...), créées ici si le VPC n'a
+    pas d'accès Internet ; les endpoints Interface sont placés dans les
+    sous-réseaux privés.
+    """
+    from troposphere import Ref, Sub
+    import troposphere.ec2 as ec2
+
+    titles = [endpoint.title for endpoint in spec.endpoints]
+    if len(set(titles)) != len(titles):
+        raise ValueError(f"endpoint déclaré plusieurs fois : {titles}")
+    for endpoint in spec.endpoints:
+        if endpoint.endpoint_type not in ("Gateway", "Interface"):
+            raise ValueError(f"type d'endpoint inconnu : {endpoint.endpoint_type}")
+        if endpoint.endpoint_type == "Gateway" and endpoint.service not in GATEWAY_SERVICES:
+            raise ValueError(f"pas d'endpoint Gateway pour {endpoint.service} (seulement {', '.join(GATEWAY_SERVICES)})")
+
+    # ----------------------------------------------------------------------
+    # ------- 8. Endpoints VPC ---------------------------------------------
+    # ----------------------------------------------------------------------
+    vpc = network["vpc"]
+    private_subnets = network["subnets"][len(spec.azs):]
+    route_tables = network["private_route_tables"]
+    if not route_tables and any(endpoint.endpoint_type == "Gateway" for endpoint in spec.endpoints):
+        route_tables = network["private_route_tables"] = add_private_route_tables(template, vpc, private_subnets)
+
+    security_group = None
+    if any(endpoint.endpoint_type == "Interface" for endpoint in spec.endpoints):
+        # Les interfaces des endpoints n'acceptent que HTTPS depuis le VPC
+        security_group = template.add_resource(
+            ec2.SecurityGroup(
+                "EndpointSecurityGroup",
+                VpcId=Ref(vpc),
+                GroupDescription="HTTPS depuis le VPC vers les endpoints Interface",
+                SecurityGroupIngress=[
+                    ec2.SecurityGroupRule(IpProtocol="tcp", FromPort=443, ToPort=443, CidrIp=spec.cidr_block)
+                ],
+                Tags=[{"Key": "Name", "Value": f"{spec.vpc_name}-endpoints"}]
+            )
+        )
+
+    endpoints = []
+    for endpoint in spec.endpoints:
+        properties = {
+            "VpcId": Ref(vpc),
+            "ServiceName": Sub(f"com.amazonaws.${{AWS::Region}}.{endpoint.service}"),
+            "VpcEndpointType": endpoint.endpoint_type,
+        }
+        if endpoint.endpoint_type == "Gateway":
+            properties["RouteTableIds"] = [Ref(route_table) for route_table in route_tables]
+        else:
+            properties["SubnetIds"] = [Ref(subnet) for subnet in private_subnets]
+            properties["SecurityGroupIds"] = [Ref(security_group)]
+            properties["PrivateDnsEnabled"] = endpoint.private_dns
+        endpoints.append(template.add_resource(ec2.VPCEndpoint(endpoint.title, **properties)))
+    return endpoints
+
+
+def add_flow_logs(template, vpc, flow_logs):
+    """Active les VPC Flow Logs du VPC vers le bucket S3 de la Q2 (Q3.1)."""
+    from troposphere import Ref
+    import troposphere.ec2 as ec2
+
+    # Par défaut, seulement les paquets rejetés sont capturés et envoyés au bucket
+    # S3 nommé polystudent-q2-tp4 (créé dans la Q2)
+    return template.add_resource(
+        ec2.FlowLog(
+            flow_logs.name,
+            ResourceId=Ref(vpc),
+            ResourceType="VPC",
+            TrafficType=flow_logs.traffic_type,
+            LogDestinationType="s3",
+            LogDestination=flow_logs.bucket_arn,
+            MaxAggregationInterval=flow_logs.max_aggregation_interval
+        )
+    )
+
+
+def add_compute(template, network, compute, record=None):
+    """Ajoute le profil d'instance LabRole et les instances EC2 de chaque sous-réseau (Q3.2).
+
+    Retourne la liste de couples (suffixe, instance), par exemple ("PublicAZ1", ...).
+    À partir de la deuxième instance d'un sous-réseau, le suffixe prend un numéro :
+    "PublicAZ1N2", "PublicAZ1N3", etc.
+    """
+    from troposphere import Ref
+    import troposphere.ec2 as ec2
+    import troposphere.iam as iam
+
+    # IAM Instance Profile pour LabRole
+    lab_instance_profile = template.add_resource(
+        iam.InstanceProfile(
+            "LabInstanceProfile",
+            Roles=[compute.role]
+        )
+    )
+
+    instances = []
+    for label, subnet in zip(network["labels"], network["subnets"]):
+        tier, _, az_index = label.partition("AZ")      # "PrivateAZ12" : ("Private", "12")
+        for number in range(1, compute.instances_per_subnet + 1):
+            suffix = "" if number == 1 else f"N{number}"
+            instance = add_fleet_resource(template, ec2.Instance(
+                f"{tier}InstanceAZ{az_index}{suffix}",     # ex. PublicInstanceAZ1
+                ImageId=compute.ami,
+                InstanceType=compute.instance_type,
+                SubnetId=Ref(subnet),
+                SecurityGroupIds=[Ref(network["security_group"])],
+                IamInstanceProfile=Ref(lab_instance_profile)    # Role IAM (LabRole)
+            ), record)
+            instances.append((label + suffix, instance))
+    return instances
+
+
+def add_fleet_resource(template, resource, record=None):
+    """Ajoute une ressource de flotte (instance, alarme) à ``template`` et la retourne.
+
+    add_resource() refuse la 501e ressource : une flotte est d'abord construite
+    en entier, puis build_vpc_stacks() la découpe en piles qui
+    respectent les limites. Un titre déjà présent est refusé comme par
+    troposphere. ``record`` (TemplateRecord) relève le dict et la taille de la
+    ressource avant l'ajout, et refuse l'ajout si ses limites seraient dépassées.
+    """
+    if resource.title in template.resources:
+        raise ValueError(f"ressource en double dans le template : {resource.title}")
+    if record is not None:
+        record.sync(template)
+        record.add("Resources", resource.title, resource.to_dict())
+    template.resources[resource.title] = resource
+    return resource
+
+
+def create_alarm(instance, name_suffix, monitoring=MonitoringSpec()):
+    """Alarme CloudWatch sur la métrique de ``monitoring`` pour une instance.
+
+    Avec les valeurs par défaut, l'alarme se déclenche si le nombre moyen de paquets
+    entrants (NetworkPacketsIn) dépasse 1000 sur une période de 60 secondes.
+    """
+    from troposphere import Ref
+    import troposphere.cloudwatch as cw
+
+    return cw.Alarm(
+        f"Alarm{name_suffix}",
+        AlarmDescription=f"Alarm activated if {monitoring.metric_name} > {monitoring.threshold} on {name_suffix}",
+        Namespace=monitoring.namespace,
+        MetricName=monitoring.metric_name,
+        Statistic=monitoring.statistic,
+        Period=str(monitoring.period),
+        EvaluationPeriods=str(monitoring.evaluation_periods),
+        Threshold=str(monitoring.threshold),
+        ComparisonOperator=monitoring.comparison_operator,
+        Dimensions=[
+            cw.MetricDimension(
+                Name="InstanceId",
+                Value=Ref(instance)
+            )
+        ]
+    )
+
+
+def add_monitoring(template, instances, monitoring, record=None):
+    """Ajoute une alarme par instance : toutes les instances du VPC sont surveillées."""
+    return [add_fleet_resource(template, create_alarm(instance, label, monitoring), record)
+            for label, instance in instances]